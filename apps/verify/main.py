@@ -0,0 +1,12 @@
+import logging
+from ytarchive_lib.verify_app import main
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+
+
+if __name__ == "__main__":
+    main()
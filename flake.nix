@@ -36,6 +36,16 @@
             runtimeInputs = [ pkgs.ffmpeg pkgs.deno ];
           };
 
+          migrate = pkgs.make-bundle {
+            app_name = "migrate";
+            inherit python-libs;
+          };
+
+          verify = pkgs.make-bundle {
+            app_name = "verify";
+            inherit python-libs;
+          };
+
           decrypt_local = pkgs.make-run {
             app = pkgs.make-app {
               app_name = "decrypt_local";
@@ -50,6 +60,13 @@
             };
           };
 
+          reconcile = pkgs.make-run {
+            app = pkgs.make-app {
+              app_name = "reconcile";
+              propagatedBuildInputs = python-libs pkgs.python3Packages;
+            };
+          };
+
           tests = pkgs.make-run { app = pkgs.callPackage ./tests {}; };
 
           pushall = pkgs.writeShellApplication {
@@ -57,6 +74,8 @@
             text = ''
               ${pkgs.lib.getExe playlist.push}
               ${pkgs.lib.getExe download.push}
+              ${pkgs.lib.getExe migrate.push}
+              ${pkgs.lib.getExe verify.push}
             '';
           };
         };
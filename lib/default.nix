@@ -4,10 +4,10 @@
 , yt-dlp
 , boto3
 , cryptography
-, to_file_like_obj
 , python-dotenv
 , psycopg
 , pyyaml
+, zstandard
 }:
 buildPythonPackage {
   pname = "ytarchive-lib";
@@ -24,11 +24,12 @@ buildPythonPackage {
   propagatedBuildInputs = [
     yt-dlp
     boto3
-    to_file_like_obj
     cryptography
     python-dotenv
     psycopg
+    psycopg.pool
     pyyaml
+    zstandard
   ];
 
   doCheck = false;
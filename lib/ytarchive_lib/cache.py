@@ -0,0 +1,128 @@
+import os
+import logging
+import tempfile
+from pathlib import Path
+from typing import Generator, Iterable
+
+MiB = 1024 * 1024
+
+READ_SIZE = MiB
+# prefix of the files being written, never served nor counted against the budget
+PARTIAL_PREFIX = ".partial-"
+
+
+class DownloadCache:
+    """On-disk cache of downloaded archive objects, evicted LRU under `max_bytes`.
+
+    Entries hold the ciphertext as it is in the bucket, named after the
+    object key and its ETag, so a replaced object is a miss and never served
+    stale. An entry is written to a temporary file and renamed into place
+    once complete, a reader sees a whole entry or none. Readers keep their
+    file open, an entry evicted under them stays readable until they finish.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        if max_bytes < 0:
+            raise ValueError(f"Invalid cache size ({max_bytes}). Must not be negative.")
+
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str, etag: str) -> Generator | None:
+        """The cached ciphertext of `key` in chunks, None unless it is cached with `etag`"""
+        path = self._path(key, etag)
+
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            logging.info(f"Cache miss for {key} ({self.hits} hits, {self.misses} misses)")
+            return None
+
+        # the modification time orders the entries for eviction
+        os.utime(path)
+        self.hits += 1
+        logging.info(f"Cache hit for {key} ({self.hits} hits, {self.misses} misses)")
+
+        return self._read(f)
+
+    def put(self, key: str, etag: str, chunks: Iterable[bytes]) -> Generator:
+        """Pass `chunks` through, caching them as `key` with `etag` once all were read.
+
+        An entry that would not fit the budget on its own is not written, a
+        consumer stopping early or a failing download leaves nothing behind.
+        """
+        fd, partial = tempfile.mkstemp(dir=self.directory, prefix=PARTIAL_PREFIX)
+        size = 0
+
+        try:
+            with open(fd, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size <= self.max_bytes:
+                        f.write(chunk)
+
+                    yield chunk
+
+            if size > self.max_bytes:
+                logging.info(f"Not caching {key}: {size / MiB:.1f} MiB exceed the cache size")
+                return
+
+            self._remove(key)
+            os.replace(partial, self._path(key, etag))
+            self.evict()
+        finally:
+            Path(partial).unlink(missing_ok=True)
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cache fits `max_bytes`, returns the bytes freed"""
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith(PARTIAL_PREFIX):
+                continue
+
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # evicted by another process
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+
+        for _, size, path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+
+            path.unlink(missing_ok=True)
+            freed += size
+
+        if freed:
+            logging.info(f"Evicted {freed / MiB:.1f} MiB from the download cache")
+
+        return freed
+
+    def _remove(self, key: str):
+        """Remove the entries of `key` left by earlier versions of the object"""
+        for path in self.directory.glob(f"{self._name(key)}.*"):
+            path.unlink(missing_ok=True)
+
+    def _path(self, key: str, etag: str) -> Path:
+        etag = etag.strip('"')
+        return self.directory / f"{self._name(key)}.{etag}"
+
+    @staticmethod
+    def _name(key: str) -> str:
+        # archive/<hash_string> keys, the hash alone is unique
+        return key.rsplit("/", 1)[-1]
+
+    @staticmethod
+    def _read(f) -> Generator:
+        with f:
+            yield from iter(lambda: f.read(READ_SIZE), b"")
@@ -1,6 +1,11 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
-from typing import Iterable, Generator
+from concurrent.futures import Executor
+from typing import AsyncGenerator, AsyncIterable, Iterable, Generator, BinaryIO
+
+from .utils import offload, read_into, write_all
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
 
 
 class Crypt:
@@ -42,6 +47,85 @@ class Crypt:
         yield unpadder.update(decryptor.finalize())
         yield unpadder.finalize()
 
+    async def aencrypt(self, data: AsyncIterable, executor: Executor = None) -> AsyncGenerator:
+        """Async variant of encrypt, large chunks are encrypted in `executor`"""
+        encryptor = self.cipher.encryptor()
+        padder = self.pkcs7.padder()
+
+        def update(chunk):
+            return encryptor.update(padder.update(chunk))
+
+        async for chunk in data:
+            assert isinstance(chunk, bytes)
+            yield await offload(executor, len(chunk), update, chunk)
+
+        yield encryptor.update(padder.finalize())
+        yield encryptor.finalize()
+
+    async def adecrypt(self, data: AsyncIterable, executor: Executor = None) -> AsyncGenerator:
+        """Async variant of decrypt, large chunks are decrypted in `executor`"""
+        decryptor = self.cipher.decryptor()
+        unpadder = self.pkcs7.unpadder()
+
+        def update(chunk):
+            return unpadder.update(decryptor.update(chunk))
+
+        async for chunk in data:
+            assert isinstance(chunk, bytes)
+            yield await offload(executor, len(chunk), update, chunk)
+
+        yield unpadder.update(decryptor.finalize())
+        yield unpadder.finalize()
+
+    def encrypt_into(self, src: BinaryIO, dst: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Encrypt `src` into `dst` through reusable buffers, returns the number of bytes written"""
+        encryptor = self.cipher.encryptor()
+        block_size = self.pkcs7.block_size // 8
+
+        data = memoryview(bytearray(chunk_size))
+        out = memoryview(bytearray(chunk_size + block_size))
+
+        size = 0
+        written = 0
+
+        while count := read_into(src, data):
+            size += count
+            written += write_all(dst, out[:encryptor.update_into(data[:count], out)])
+
+        # same bytes as PKCS7 padder, applied to the total length
+        pad = block_size - size % block_size
+        written += write_all(dst, encryptor.update(bytes([pad]) * pad))
+        written += write_all(dst, encryptor.finalize())
+
+        return written
+
+    def decrypt_into(self, src: BinaryIO, dst: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Decrypt `src` into `dst` through reusable buffers, returns the number of bytes written"""
+        decryptor = self.cipher.decryptor()
+        block_size = self.pkcs7.block_size // 8
+
+        data = memoryview(bytearray(chunk_size))
+        # the last padded block is held at the front until the end of the stream
+        out = memoryview(bytearray(block_size + chunk_size + block_size))
+
+        held = 0
+        written = 0
+
+        while count := read_into(src, data):
+            total = held + decryptor.update_into(data[:count], out[held:])
+
+            ready = max(total - block_size, 0)
+            written += write_all(dst, out[:ready])
+
+            out[:total - ready] = out[ready:total]
+            held = total - ready
+
+        unpadder = self.pkcs7.unpadder()
+        written += write_all(dst, unpadder.update(bytes(out[:held]) + decryptor.finalize()))
+        written += write_all(dst, unpadder.finalize())
+
+        return written
+
 
 if __name__ == "__main__":
     key = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
@@ -1,67 +1,556 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import padding, hashes, hmac
-from typing import Iterable, Generator
-from dataclasses import dataclass, field
+from concurrent.futures import Executor, ThreadPoolExecutor
+from collections import deque
+from typing import AsyncGenerator, AsyncIterable, BinaryIO, Callable, Iterable, Generator
+from dataclasses import dataclass
+import io
+import asyncio
+import itertools
 import secrets
+import struct
+import zstandard
+
+from .utils import OFFLOAD_THRESHOLD, offload, read_into, write_all
+
+
+V2 = b"V2:"
+V3 = b"V3:"
+
+TAG_SIZE = 16
+SALT_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# V3 layout: b"V3:" | segment size (u32) | flags (u8) | salt (16 bytes) | segments...
+# Every segment is `segment size` bytes of plaintext followed by its own GCM tag,
+# the last one may be shorter (or empty). Segment keys are derived from the salt,
+# nonces are the segment index plus a "last segment" flag, so truncation,
+# reordering and header changes all fail authentication.
+# With FLAG_ZSTD set the segments hold a single zstd frame of the plaintext,
+# followed by the plaintext length (u64) to detect a truncated frame.
+V3_PARAMS = struct.Struct(">IB16s")
+V3_HEADER_SIZE = len(V3) + V3_PARAMS.size
+
+FLAG_ZSTD = 0x01
+SUPPORTED_FLAGS = FLAG_ZSTD
+ZSTD_TRAILER = struct.Struct(">Q")
 
 
 class Crypt:
-    def __init__(self, key: bytes):
+    def __init__(
+        self,
+        key: bytes,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        workers: int = 1,
+        compression_level: int = None,
+        compression_threads: int = 0,
+    ):
         # Validate key size (must be exactly 32 bytes for AES-256)
         if len(key) != 32:
             raise ValueError(f"Invalid key size ({len(key) * 8}) for AES. Must be exactly 256 bits (32 bytes).")
 
-        self.algorithm = algorithms.AES(key)
+        if not 0 < segment_size < 2 ** 32:
+            raise ValueError(f"Invalid segment size ({segment_size}). Must be between 1 and 2^32 - 1 bytes.")
 
-    def encrypt(self, data: Iterable) -> Generator:
-        nonce = secrets.token_bytes(16)
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers ({workers}). Must be at least 1.")
 
-        yield b"V2:"
+        if compression_level is not None and compression_level > zstandard.MAX_COMPRESSION_LEVEL:
+            raise ValueError(f"Invalid compression level ({compression_level}). Must be at most {zstandard.MAX_COMPRESSION_LEVEL}.")
 
-        yield nonce
+        self.key = key
+        self.algorithm = algorithms.AES(key)
+        self.segment_size = segment_size
+        self.workers = workers
+        self.compression_level = compression_level
+        self.compression_threads = compression_threads
 
-        encryptor = Cipher(self.algorithm, modes.GCM(nonce)).encryptor()
-        for chunk in data:
-            assert isinstance(chunk, bytes)
-            yield encryptor.update(chunk)
+    @property
+    def flags(self) -> int:
+        """Flags of the V3 objects written by this instance"""
+        return FLAG_ZSTD if self.compression_level is not None else 0
+
+    def encrypt(self, data: Iterable, salt: bytes = None) -> Generator:
+        """Encrypt as a V3 object, a given `salt` makes the output reproducible"""
+        salt = salt or secrets.token_bytes(SALT_SIZE)
 
-        yield encryptor.finalize()
+        header = V3 + V3_PARAMS.pack(self.segment_size, self.flags, salt)
+        yield header
 
-        tag = encryptor.tag
-        assert len(tag) == 16, f"Invalid tag size ({len(tag)}). Must be 16 bytes."
+        if self.flags & FLAG_ZSTD:
+            data = self._compress(data)
 
-        yield tag
+        aead = AESGCM(self._segment_key(salt))
+        segments = (
+            (aead, header, index, last, segment)
+            for index, (segment, last) in enumerate(self._split(data, self.segment_size))
+        )
+
+        yield from self._map(self._seal, segments)
 
     def decrypt(self, data: Iterable) -> Generator:
         version, rest = self._get_prefix(3, data)
-        if version != b"V2:":
-            raise ValueError(f"Unsupported version: {version.decode()}")
+        if version == V3:
+            yield from self._decrypt_v3(rest)
+        elif version == V2:
+            yield from self._decrypt_v2(rest)
+        else:
+            raise ValueError(f"Unsupported version: {version.decode(errors='replace')}")
+
+    async def aencrypt(self, data: AsyncIterable, executor: Executor = None) -> AsyncGenerator:
+        """Async variant of encrypt, segments are encrypted in `executor`"""
+        salt = secrets.token_bytes(SALT_SIZE)
+
+        header = V3 + V3_PARAMS.pack(self.segment_size, self.flags, salt)
+        yield header
+
+        if self.flags & FLAG_ZSTD:
+            data = self._acompress(data, executor)
+
+        aead = AESGCM(self._segment_key(salt))
+
+        async def segments():
+            index = 0
+            async for segment, last in self._asplit(data, self.segment_size):
+                yield aead, header, index, last, segment
+                index += 1
+
+        async for chunk in self._amap(self._seal, segments(), executor):
+            yield chunk
+
+    async def adecrypt(self, data: AsyncIterable, executor: Executor = None) -> AsyncGenerator:
+        """Async variant of decrypt, CPU heavy work runs in `executor`"""
+        version, rest = await self._aget_prefix(3, data)
+        if version == V3:
+            decrypted = self._adecrypt_v3(rest, executor)
+        elif version == V2:
+            decrypted = self._adecrypt_v2(rest, executor)
+        else:
+            raise ValueError(f"Unsupported version: {version.decode(errors='replace')}")
+
+        async for chunk in decrypted:
+            yield chunk
+
+    def encrypted_size(self, size: int) -> int:
+        """Size of a V3 object holding `size` bytes of plaintext, an upper bound when compressing"""
+        if self.flags & FLAG_ZSTD:
+            # ZSTD_COMPRESSBOUND, the worst case for incompressible data
+            size += (size >> 8) + ((128 * 1024 - size) >> 11 if size < 128 * 1024 else 0)
+            # frame header, checksum and the length trailer
+            size += 18 + ZSTD_TRAILER.size
+
+        return V3_HEADER_SIZE + size + self._segment_count(size, self.segment_size) * TAG_SIZE
+
+    def decrypt_range(self, read: Callable[[int, int], bytes], size: int, start: int, end: int) -> Generator:
+        """Decrypt plaintext bytes [start, end) of a V3 object of `size` bytes.
+
+        `read(offset, length)` must return the given byte range of the object,
+        only the segments covering the requested range are read and verified.
+        """
+        version, segment_size, flags, header, key = self._parse_v3_header(read(0, V3_HEADER_SIZE))
+        if version != V3:
+            raise ValueError(f"Range decryption is not supported for version: {version.decode(errors='replace')}")
+        if flags & FLAG_ZSTD:
+            raise ValueError("Range decryption is not supported for compressed objects")
+
+        aead = AESGCM(key)
+
+        stride = segment_size + TAG_SIZE
+        body_size = size - V3_HEADER_SIZE
+        if body_size < TAG_SIZE:
+            raise ValueError(f"Not enough data to read {TAG_SIZE} bytes")
+
+        count = (body_size + stride - 1) // stride
+        plaintext_size = body_size - count * TAG_SIZE
+
+        end = min(end, plaintext_size)
+        if start >= end:
+            return
+
+        for index in range(start // segment_size, (end - 1) // segment_size + 1):
+            offset = index * segment_size
+            segment = read(V3_HEADER_SIZE + index * stride, min(stride, body_size - index * stride))
+            plaintext = self._open(aead, header, index, index == count - 1, segment)
+            yield plaintext[max(start - offset, 0):end - offset]
+
+    def encrypt_into(self, src: BinaryIO, dst: BinaryIO) -> int:
+        """Encrypt `src` into `dst` as a V3 object through reusable buffers, returns the number of bytes written"""
+        if self.workers > 1 or self.flags & FLAG_ZSTD:
+            return self._write_chunks(dst, self.encrypt(iter(lambda: src.read(self.segment_size), b"")))
+
+        reader = EncryptingReader(self, src)
+        # a whole segment fits, so every one is sealed straight into `out`
+        out = memoryview(bytearray(self.segment_size + TAG_SIZE))
+        written = 0
+
+        while count := reader.readinto(out):
+            written += write_all(dst, out[:count])
+
+        return written
+
+    def encrypt_reader(self, src: BinaryIO, salt: bytes = None, offset: int = 0) -> io.RawIOBase:
+        """A reader of `src` encrypted as a V3 object, see EncryptingReader.
+
+        With the `salt` of an earlier encryption of the same data the reader
+        can start at `offset` of its output. Uncompressed objects seek `src`
+        to the segment holding `offset`, compressed ones are encrypted from
+        the start and the output before `offset` is dropped.
+        """
+        if self.workers > 1 or self.flags & FLAG_ZSTD:
+            reader = ChunkReader(self.encrypt(iter(lambda: src.read(self.segment_size), b""), salt))
+            reader.skip(offset)
+            return reader
+
+        return EncryptingReader(self, src, salt, offset)
+
+    def decrypt_into(self, src: BinaryIO, dst: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Decrypt `src` into `dst` through reusable buffers, returns the number of bytes written"""
+        version = self._read_exactly(src, len(V3))
+        if version == V3:
+            return self._decrypt_v3_into(src, dst)
+        elif version == V2:
+            return self._decrypt_v2_into(src, dst, chunk_size)
+        else:
+            raise ValueError(f"Unsupported version: {version.decode(errors='replace')}")
+
+    def _decrypt_v3_into(self, src: BinaryIO, dst: BinaryIO) -> int:
+        params = self._read_exactly(src, V3_PARAMS.size)
+        _, segment_size, flags, header, key = self._parse_v3_header(V3 + params)
+
+        if self.workers > 1 or flags & FLAG_ZSTD:
+            chunks = iter(lambda: src.read(segment_size + TAG_SIZE), b"")
+            return self._write_chunks(dst, self._decrypt_v3(itertools.chain([params], chunks)))
+
+        aead = AESGCM(key)
+        stride = segment_size + TAG_SIZE
+
+        current = memoryview(bytearray(stride))
+        following = memoryview(bytearray(stride))
+        out = memoryview(bytearray(stride))
+
+        count = read_into(src, current)
+        index = 0
+        written = 0
+
+        while True:
+            following_count = read_into(src, following) if count == stride else 0
+            last = following_count == 0
+
+            # the tag is checked before any plaintext of the segment is written
+            written += write_all(dst, self._open(aead, header, index, last, current[:count], out))
+
+            if last:
+                return written
+
+            current, following = following, current
+            count = following_count
+            index += 1
+
+    def _decrypt_v2_into(self, src: BinaryIO, dst: BinaryIO, chunk_size: int) -> int:
+        nonce = self._read_exactly(src, 16)
+        decryptor = Cipher(self.algorithm, modes.GCM(nonce)).decryptor()
+
+        # the tag is held at the front of the buffer until the end of the stream
+        data = memoryview(bytearray(TAG_SIZE + chunk_size))
+        out = memoryview(bytearray(chunk_size + TAG_SIZE))
+
+        held = 0
+        written = 0
+
+        while count := read_into(src, data[held:]):
+            total = held + count
+            ready = max(total - TAG_SIZE, 0)
+
+            written += write_all(dst, out[:decryptor.update_into(data[:ready], out)])
+
+            data[:total - ready] = data[ready:total]
+            held = total - ready
+
+        if held < TAG_SIZE:
+            raise ValueError(f"Not enough data to read {TAG_SIZE} bytes")
+
+        written += write_all(dst, decryptor.finalize_with_tag(bytes(data[:held])))
+
+        return written
+
+    @staticmethod
+    def _read_exactly(src: BinaryIO, size: int) -> bytes:
+        data = bytearray(size)
+        if read_into(src, memoryview(data)) < size:
+            raise ValueError(f"Not enough data to read {size} bytes")
+
+        return bytes(data)
+
+    @staticmethod
+    def _write_chunks(dst: BinaryIO, chunks: Iterable) -> int:
+        return sum(write_all(dst, chunk) for chunk in chunks)
+
+    def _decrypt_v3(self, data: Iterable) -> Generator:
+        params, rest = self._get_prefix(V3_PARAMS.size, data)
+        _, segment_size, flags, header, key = self._parse_v3_header(V3 + params)
+        aead = AESGCM(key)
+
+        def segments():
+            for index, (segment, last) in enumerate(self._split(rest, segment_size + TAG_SIZE)):
+                yield aead, header, index, last, segment
+
+        decrypted = self._map(self._open, segments())
+        if flags & FLAG_ZSTD:
+            decrypted = self._decompress(decrypted)
+
+        yield from decrypted
+
+    def _compress(self, data: Iterable) -> Generator:
+        # compressors are not thread safe, every stream gets its own
+        compressor = zstandard.ZstdCompressor(
+            level=self.compression_level,
+            threads=self.compression_threads,
+        ).compressobj()
+        size = 0
+
+        for chunk in data:
+            assert isinstance(chunk, (bytes, memoryview))
+            size += len(chunk)
+            if compressed := compressor.compress(chunk):
+                yield compressed
+
+        yield compressor.flush() + ZSTD_TRAILER.pack(size)
+
+    def _decompress(self, data: Iterable, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Generator:
+        """Decompress a zstd frame and its length trailer, yielding at most `chunk_size` bytes at a time.
+
+        A highly compressed frame expands to far more than its input, pulling
+        the output keeps memory bounded where decompressing whole chunks does not.
+        """
+        holdback = Holdback(ZSTD_TRAILER.size)
+
+        def frame():
+            for chunk in data:
+                yield from holdback.feed(chunk)
+
+        source = ChunkReader(frame())
+        reader = zstandard.ZstdDecompressor().stream_reader(source, read_size=chunk_size)
+
+        size = 0
+        while decompressed := reader.read(chunk_size):
+            size += len(decompressed)
+            yield decompressed
 
-        nonce, rest = self._get_prefix(16, rest)
+        if source.read():
+            raise ValueError("Unexpected data after zstd frame")
+
+        (expected,) = ZSTD_TRAILER.unpack(holdback.tail())
+        if size != expected:
+            raise ValueError("Truncated zstd frame")
+
+    def _map(self, func: Callable, args: Iterable[tuple]) -> Generator:
+        """Yield func(*a) for every a in order, running up to `workers` calls at once.
+
+        At most 2 * workers segments are in flight, so memory stays bounded
+        no matter how far the consumer lags behind.
+        """
+        if self.workers == 1:
+            for a in args:
+                yield func(*a)
+            return
+
+        pending = deque()
+        with ThreadPoolExecutor(self.workers) as executor:
+            try:
+                for a in args:
+                    pending.append(executor.submit(func, *a))
+                    if len(pending) >= 2 * self.workers:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    async def _adecrypt_v3(self, data: AsyncIterable, executor: Executor) -> AsyncGenerator:
+        params, rest = await self._aget_prefix(V3_PARAMS.size, data)
+        _, segment_size, flags, header, key = self._parse_v3_header(V3 + params)
+        aead = AESGCM(key)
+
+        async def segments():
+            index = 0
+            async for segment, last in self._asplit(rest, segment_size + TAG_SIZE):
+                yield aead, header, index, last, segment
+                index += 1
+
+        decrypted = self._amap(self._open, segments(), executor)
+        if flags & FLAG_ZSTD:
+            decrypted = self._adecompress(decrypted, executor)
+
+        async for chunk in decrypted:
+            yield chunk
+
+    async def _acompress(self, data: AsyncIterable, executor: Executor) -> AsyncGenerator:
+        compressor = zstandard.ZstdCompressor(
+            level=self.compression_level,
+            threads=self.compression_threads,
+        ).compressobj()
+        size = 0
+
+        async for chunk in data:
+            assert isinstance(chunk, (bytes, memoryview))
+            size += len(chunk)
+            if compressed := await offload(executor, len(chunk), compressor.compress, chunk):
+                yield compressed
+
+        yield await offload(executor, OFFLOAD_THRESHOLD, compressor.flush) + ZSTD_TRAILER.pack(size)
+
+    async def _adecompress(self, data: AsyncIterable, executor: Executor) -> AsyncGenerator:
+        """Async variant of _decompress, the generator is driven from a worker thread.
+
+        Input is pulled back from the event loop, the default executor is used
+        because a busy `executor` could be the one producing that input.
+        """
+        loop = asyncio.get_running_loop()
+        source = aiter(data)
+
+        def pull():
+            return asyncio.run_coroutine_threadsafe(anext(source, None), loop).result()
+
+        decompressed = self._decompress(iter(pull, None))
+
+        while (chunk := await loop.run_in_executor(None, next, decompressed, None)) is not None:
+            yield chunk
+
+    async def _adecrypt_v2(self, data: AsyncIterable, executor: Executor) -> AsyncGenerator:
+        nonce, rest = await self._aget_prefix(16, data)
+
+        decryptor = Cipher(self.algorithm, modes.GCM(nonce)).decryptor()
+        holdback = Holdback(TAG_SIZE)
+
+        async for chunk in rest:
+            assert isinstance(chunk, (bytes, memoryview))
+            for piece in holdback.feed(chunk):
+                yield await offload(executor, len(piece), decryptor.update, piece)
+
+        yield decryptor.finalize_with_tag(holdback.tail())
+
+    async def _amap(self, func: Callable, args: AsyncIterable[tuple], executor: Executor) -> AsyncGenerator:
+        """Async variant of _map, up to `workers` calls run in `executor` at once"""
+        loop = asyncio.get_running_loop()
+        pending = deque()
+
+        try:
+            async for a in args:
+                pending.append(loop.run_in_executor(executor, func, *a))
+                if len(pending) >= self.workers:
+                    yield await pending.popleft()
+
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _parse_v3_header(self, header: bytes):
+        if len(header) != V3_HEADER_SIZE:
+            raise ValueError(f"Not enough data to read {V3_HEADER_SIZE} bytes")
+
+        version = header[:len(V3)]
+        if version != V3:
+            return version, None, None, header, None
+
+        segment_size, flags, salt = V3_PARAMS.unpack(header[len(V3):])
+        if segment_size == 0:
+            raise ValueError(f"Invalid segment size ({segment_size})")
+        if flags & ~SUPPORTED_FLAGS:
+            raise ValueError(f"Unsupported flags: {flags:#x}")
+
+        return version, segment_size, flags, header, self._segment_key(salt)
+
+    def _segment_key(self, salt: bytes) -> bytes:
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"ytarchive V3 segment key")
+        return hkdf.derive(self.key)
+
+    @staticmethod
+    def _segment_nonce(index: int, last: bool) -> bytes:
+        return index.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+    @classmethod
+    def _seal(cls, aead: AESGCM, header: bytes, index: int, last: bool, segment, out: memoryview = None):
+        """Encrypt one V3 segment, into `out` when given, returning the ciphertext with its tag"""
+        nonce = cls._segment_nonce(index, last)
+        if out is None:
+            return aead.encrypt(nonce, segment, header)
+
+        out = out[:len(segment) + TAG_SIZE]
+        aead.encrypt_into(nonce, segment, header, out)
+        return out
+
+    @classmethod
+    def _open(cls, aead: AESGCM, header: bytes, index: int, last: bool, segment, out: memoryview = None):
+        """Decrypt and authenticate one V3 segment, into `out` when given, returning the plaintext"""
+        if len(segment) < TAG_SIZE:
+            raise ValueError(f"Not enough data to read {TAG_SIZE} bytes")
+
+        nonce = cls._segment_nonce(index, last)
+        if out is None:
+            return aead.decrypt(nonce, segment, header)
+
+        out = out[:len(segment) - TAG_SIZE]
+        aead.decrypt_into(nonce, segment, header, out)
+        return out
+
+    @staticmethod
+    def _segment_count(size: int, segment_size: int) -> int:
+        # the last segment is always present, even if empty
+        return max((size + segment_size - 1) // segment_size, 1)
+
+    def _split(self, data: Iterable[bytes], size: int) -> Generator:
+        segmenter = Segmenter(size)
+
+        for chunk in data:
+            assert isinstance(chunk, (bytes, memoryview))
+            yield from segmenter.feed(chunk)
+
+        yield segmenter.finish()
+
+    async def _asplit(self, data: AsyncIterable[bytes], size: int) -> AsyncGenerator:
+        segmenter = Segmenter(size)
+
+        async for chunk in data:
+            assert isinstance(chunk, (bytes, memoryview))
+            for segment in segmenter.feed(chunk):
+                yield segment
+
+        yield segmenter.finish()
+
+    def _decrypt_v2(self, data: Iterable) -> Generator:
+        nonce, rest = self._get_prefix(16, data)
 
         suffix = self._get_suffix(16, rest)
 
         decryptor = Cipher(self.algorithm, modes.GCM(nonce)).decryptor()
 
         for chunk in suffix.rest:
-            assert isinstance(chunk, bytes)
             yield decryptor.update(chunk)
 
         yield decryptor.finalize_with_tag(suffix.suffix)
 
     def _get_prefix(self, size: int, data: Iterable[bytes]) -> tuple[bytes, Generator]:
-        buffer = b""
+        prefix = bytearray()
+        remainder = b""
         it = iter(data)
 
-        while len(buffer) < size:
+        while len(prefix) < size:
             try:
                 chunk = next(it)
             except StopIteration:
                 raise ValueError(f"Not enough data to read {size} bytes")
-            assert isinstance(chunk, bytes)
-            buffer += chunk
+            assert isinstance(chunk, (bytes, memoryview))
 
-        prefix, remainder = buffer[:size], buffer[size:]
+            missing = size - len(prefix)
+            prefix += chunk[:missing]
+            remainder = memoryview(chunk)[missing:]
 
         def rest():
             if remainder:
@@ -69,55 +558,273 @@ class Crypt:
 
             yield from it
 
-        return prefix, rest()
+        return bytes(prefix), rest()
+
+    async def _aget_prefix(self, size: int, data: AsyncIterable[bytes]) -> tuple[bytes, AsyncGenerator]:
+        prefix = bytearray()
+        remainder = b""
+        it = aiter(data)
+
+        while len(prefix) < size:
+            try:
+                chunk = await anext(it)
+            except StopAsyncIteration:
+                raise ValueError(f"Not enough data to read {size} bytes")
+            assert isinstance(chunk, (bytes, memoryview))
+
+            missing = size - len(prefix)
+            prefix += chunk[:missing]
+            remainder = memoryview(chunk)[missing:]
+
+        async def rest():
+            if remainder:
+                yield remainder
+
+            async for chunk in it:
+                yield chunk
 
+        return bytes(prefix), rest()
 
     def _get_suffix(self, size: int, data: Iterable[bytes]):
         @dataclass
         class Result:
             rest: Generator = None
             suffix: bytes = b""
-            window: list[bytes] = field(default_factory=list)
 
         result = Result()
+        holdback = Holdback(size)
 
-        def take_prefix():
-            total = 0
+        def process_stream():
+            for chunk in data:
+                assert isinstance(chunk, (bytes, memoryview))
+                yield from holdback.feed(chunk)
 
-            for i in range(len(result.window) - 1, -1, -1):
-                total += len(result.window[i])
-                if total > size:
-                    prefix = result.window[:i]
-                    del result.window[:i]
-                    return prefix
+            result.suffix = holdback.tail()
 
-            return []
+        result.rest = process_stream()
+        return result
 
-        def process_stream():
-            for chunk in data:
-                assert isinstance(chunk, bytes)
 
-                result.window.append(chunk)
-                yield from iter(take_prefix())
+class ChunkReader(io.RawIOBase):
+    """Minimal file-like reader over an iterable of chunks"""
 
-            result.suffix = b"".join(result.window)
-            if len(result.suffix) > size:
-                tmp = result.suffix
-                result.suffix = result.suffix[-size:]
-                yield tmp[:-size]
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.rest = memoryview(b"")
 
-            if len(result.suffix) < size:
-                raise ValueError(f"Not enough data to read {size} bytes")
+    def readable(self) -> bool:
+        return True
 
-        result.rest = process_stream()
-        return result
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            return self.readall()
+
+        if not self._fill():
+            return b""
+
+        data = bytes(self.rest[:size])
+        self.rest = self.rest[size:]
+        return data
+
+    def readinto(self, buffer) -> int:
+        if not self._fill():
+            return 0
+
+        view = memoryview(buffer).cast("B")
+        count = min(len(view), len(self.rest))
+        view[:count] = self.rest[:count]
+        self.rest = self.rest[count:]
+        return count
+
+    def skip(self, size: int):
+        while size and self._fill():
+            count = min(size, len(self.rest))
+            self.rest = self.rest[count:]
+            size -= count
+
+    def _fill(self) -> bool:
+        while not self.rest:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return False
+
+            self.rest = memoryview(chunk).cast("B")
+
+        return True
+
+
+class EncryptingReader(io.RawIOBase):
+    """Reads `src` encrypted as an uncompressed V3 object.
+
+    `src` is read a segment at a time into two reusable buffers (one segment
+    of lookahead tells whether the current one is the last) and every segment
+    that fits the caller's buffer is sealed straight into it. One that does
+    not fit is sealed into an internal buffer and handed out over the next
+    reads; to keep later segments aligned with the caller's buffers, a read
+    returns short rather than start such a segment after other data.
+
+    With an `offset` (and the salt of the output to continue) `src` must be
+    seekable, it is moved to the segment holding that offset.
+    """
+
+    def __init__(self, crypt: Crypt, src: BinaryIO, salt: bytes = None, offset: int = 0):
+        salt = salt or secrets.token_bytes(SALT_SIZE)
+
+        self.crypt = crypt
+        self.src = src
+        self.header = V3 + V3_PARAMS.pack(crypt.segment_size, 0, salt)
+        self.aead = AESGCM(crypt._segment_key(salt))
+
+        self.current = memoryview(bytearray(crypt.segment_size))
+        self.following = memoryview(bytearray(crypt.segment_size))
+        self.out = memoryview(bytearray(crypt.segment_size + TAG_SIZE))
+        self.rest = memoryview(self.header)[offset:]
+
+        self.count = None
+        self.index = 0
+        self.done = False
+        # bytes of the next sealed segment that lie before `offset`
+        self.skip = 0
+
+        if offset > V3_HEADER_SIZE:
+            position = src.tell()
+            end = src.seek(0, io.SEEK_END)
+
+            if offset >= crypt.encrypted_size(end - position):
+                self.done = True
+            else:
+                self.index, self.skip = divmod(offset - V3_HEADER_SIZE, crypt.segment_size + TAG_SIZE)
+                src.seek(position + self.index * crypt.segment_size)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        written = 0
+
+        while written < len(view):
+            if self.rest:
+                count = min(len(view) - written, len(self.rest))
+                view[written:written + count] = self.rest[:count]
+                self.rest = self.rest[count:]
+                written += count
+                continue
+
+            if self.done:
+                break
+
+            segment_size = self.crypt.segment_size
+            if self.count is None:
+                self.count = read_into(self.src, self.current)
+
+            space = len(view) - written
+            if space < self.count + TAG_SIZE and written:
+                break
+
+            following_count = read_into(self.src, self.following) if self.count == segment_size else 0
+            last = following_count == 0
+
+            segment = self.current[:self.count]
+            if space >= self.count + TAG_SIZE and not self.skip:
+                written += len(self.crypt._seal(self.aead, self.header, self.index, last, segment, view[written:]))
+            else:
+                self.rest = self.crypt._seal(self.aead, self.header, self.index, last, segment, self.out)[self.skip:]
+                self.skip = 0
+
+            self.done = last
+            self.current, self.following = self.following, self.current
+            self.count = following_count
+            self.index += 1
+
+        return written
+
+
+class Segmenter:
+    """Cut a stream into `size` byte pieces, flagging the last (possibly short) one"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buffer = bytearray()
+        self.pending = None
+
+    def feed(self, chunk: bytes) -> list:
+        segments = []
+        view = memoryview(chunk)
+
+        while view:
+            if self.pending is not None:
+                segments.append((self.pending, False))
+                self.pending = None
+
+            if self.buffer or len(view) < self.size:
+                missing = self.size - len(self.buffer)
+                self.buffer += view[:missing]
+                view = view[missing:]
+
+                if len(self.buffer) == self.size:
+                    self.pending = bytes(self.buffer)
+                    self.buffer.clear()
+            else:
+                # whole segment inside the chunk, copy it out once
+                self.pending = bytes(view[:self.size])
+                view = view[self.size:]
+
+        return segments
+
+    def finish(self) -> tuple:
+        if self.pending is not None:
+            return self.pending, True
+
+        return bytes(self.buffer), True
+
+
+class Holdback:
+    """Pass a stream through, keeping its last `size` bytes back.
+
+    Every chunk costs O(size) work: the held bytes are at most `size` long,
+    and pieces of longer chunks are passed on as memoryviews without copying,
+    which is safe because bytes are immutable.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.held = b""
+
+    def feed(self, chunk: bytes) -> tuple:
+        held = self.held
+        count = len(chunk)
+
+        if count >= self.size:
+            cut = count - self.size
+            self.held = bytes(chunk[cut:])
+
+            if not cut:
+                return (held,) if held else ()
+
+            piece = memoryview(chunk)[:cut]
+            return (held, piece) if held else (piece,)
+
+        joined = held + chunk
+        cut = len(joined) - self.size
+        if cut <= 0:
+            self.held = joined
+            return ()
+
+        self.held = joined[cut:]
+        return (joined[:cut],)
+
+    def tail(self) -> bytes:
+        if len(self.held) < self.size:
+            raise ValueError(f"Not enough data to read {self.size} bytes")
+
+        return self.held
 
 
 if __name__ == "__main__":
     key = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
-    iv = bytes.fromhex("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
 
-    crypt = Crypt(key, iv)
+    crypt = Crypt(key)
 
     with open(__file__, "rb") as f:
         encrypted_data = crypt.encrypt(iter(lambda: f.read(1024), b""))
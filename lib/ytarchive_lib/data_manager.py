@@ -1,20 +1,53 @@
+import os
 import json
 import boto3
+import functools
+import botocore.config
 import logging
 from botocore.exceptions import ClientError
-from to_file_like_obj import to_file_like_obj
 from enum import StrEnum, auto
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections import defaultdict
-from typing import BinaryIO
+import asyncio
+import hashlib
+import secrets
+import itertools
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator, BinaryIO, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import psycopg
 from psycopg.rows import dict_row
 
-from .crypt_v2 import Crypt
-from .utils import hash_string
-from .db import DB
+from .crypt import Crypt as LegacyCrypt
+from .crypt_v2 import Crypt, V2, V3, SALT_SIZE
+from .utils import aiterate, hash_string, peak_rss, RateLimiter
+from .uploader import MultipartUploader, UploadProgress, DEFAULT_PART_SIZE, DEFAULT_WORKERS, MiB
+from .cache import DownloadCache
+from .downloader import RangedDownloader, DEFAULT_RANGE_SIZE, DEFAULT_WORKERS as DEFAULT_DOWNLOAD_WORKERS
+from .db import DB, DEFAULT_MIN_SIZE as DEFAULT_DB_POOL_MIN_SIZE, DEFAULT_MAX_SIZE as DEFAULT_DB_POOL_MAX_SIZE
+
+
+# blocking S3 calls of the async methods run in a pool of this many threads
+DEFAULT_S3_THREADS = 8
+# attempts of every S3 request, adaptive mode also backs off when throttled
+S3_MAX_ATTEMPTS = 5
+
+# archive/ keys are sha256 hex digests, listed in parallel by their first digit
+INVENTORY_PREFIXES = [f"archive/{digit}" for digit in "0123456789abcdef"]
+
+# the archive key of a src_items row, as archive_key computes it
+ARCHIVE_KEY_SQL = "'archive/' || encode(sha256(convert_to(items.provider || ':' || items.id, 'UTF8')), 'hex')"
+
+# size of the optional download cache, enabled by DOWNLOAD_CACHE_DIR
+DEFAULT_CACHE_SIZE = 10 * 1024 * MiB
+
+# a download job renews the lease on its item while it works, another job may take over the item once it expired
+DEFAULT_LEASE = timedelta(minutes=5)
+
+# multipart uploads older than this are no longer resumed by the hourly download job
+STALE_UPLOAD_AGE = timedelta(days=1)
 
 
 @dataclass
@@ -24,6 +57,8 @@ class SrcItem:
         DONE = auto()
         WARNING = auto()
         LEGACY_DONE = auto()
+        # claimed by a download job, see claim_src_item
+        IN_PROGRESS = auto()
 
     provider: str
     id: str
@@ -60,6 +95,12 @@ class SrcItem:
             await cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_src_items_priority ON src_items(priority);
             """)
+            # the lease of an IN_PROGRESS item, added after the table
+            await cursor.execute("""
+                ALTER TABLE src_items
+                ADD COLUMN IF NOT EXISTS lease_owner TEXT,
+                ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+            """)
             await connection.commit()
 
 
@@ -134,23 +175,182 @@ class VideoMetadata:
             await connection.commit()
 
 
+@dataclass
+class LegacyMigration:
+    class State(StrEnum):
+        STARTED = auto()
+        RESTORING = auto()
+        DONE = auto()
+        FAILED = auto()
+
+    provider: str
+    id: str
+    state: State
+    started_at: datetime = None
+    error: str = None
+
+    @classmethod
+    async def setup_db(cls, connection: psycopg.Connection):
+        async with connection.cursor() as cursor:
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS legacy_migrations (
+                    provider     TEXT NOT NULL,
+                    id           TEXT NOT NULL,
+                    state        TEXT,
+                    started_at   TIMESTAMPTZ,
+                    finished_at  TIMESTAMPTZ,
+                    error        TEXT,
+                    PRIMARY KEY (provider, id)
+                );
+            """)
+            await connection.commit()
+
+
+@dataclass
+class Verification:
+    key: str
+    ok: bool
+    size: int = None
+    error: str = None
+    verified_at: datetime = None
+
+    @classmethod
+    async def setup_db(cls, connection: psycopg.Connection):
+        async with connection.cursor() as cursor:
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS verifications (
+                    key          TEXT PRIMARY KEY,
+                    ok           BOOLEAN NOT NULL,
+                    size         BIGINT,
+                    error        TEXT,
+                    verified_at  TIMESTAMPTZ NOT NULL
+                );
+            """)
+            await connection.commit()
+
+
+@dataclass
+class PendingUpload:
+    """A multipart upload of an archive that a later run can resume"""
+    key: str
+    upload_id: str
+    salt: bytes
+    part_size: int
+    source_size: int
+    source_hash: str
+    parts: dict[int, str] = field(default_factory=dict)
+    created_at: datetime = None
+
+    @classmethod
+    async def setup_db(cls, connection: psycopg.Connection):
+        async with connection.cursor() as cursor:
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pending_uploads (
+                    key          TEXT PRIMARY KEY,
+                    upload_id    TEXT NOT NULL,
+                    salt         BYTEA NOT NULL,
+                    part_size    BIGINT NOT NULL,
+                    source_size  BIGINT NOT NULL,
+                    source_hash  TEXT NOT NULL,
+                    created_at   TIMESTAMPTZ NOT NULL
+                );
+            """)
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pending_upload_parts (
+                    key          TEXT NOT NULL REFERENCES pending_uploads(key) ON DELETE CASCADE,
+                    part_number  INTEGER NOT NULL,
+                    etag         TEXT NOT NULL,
+                    PRIMARY KEY (key, part_number)
+                );
+            """)
+            await connection.commit()
+
+
+@dataclass
+class ArchiveObject:
+    key: str
+    size: int
+    etag: str
+    uploaded_at: datetime = None
+    # new objects are STANDARD until the lifecycle rule moves them, the sync picks that up
+    storage_class: str = "STANDARD"
+
+    @classmethod
+    async def setup_db(cls, connection: psycopg.Connection):
+        async with connection.cursor() as cursor:
+            await cursor.execute("""
+                CREATE TABLE IF NOT EXISTS archive_objects (
+                    key            TEXT PRIMARY KEY,
+                    size           BIGINT NOT NULL,
+                    etag           TEXT NOT NULL,
+                    uploaded_at    TIMESTAMPTZ NOT NULL,
+                    storage_class  TEXT NOT NULL
+                );
+            """)
+            await connection.commit()
+
+
 class DataManager:
+    """Access to the database and the bucket.
+
+    Every write method commits on its own, unless it runs inside
+    transaction(), which commits all of them at once. The statements run
+    for every item are prepared, those of one call are pipelined.
+    """
+
     @classmethod
     async def create(cls, config):
         self = cls()
 
+        self.s3_threads = int(config.get("S3_THREADS", DEFAULT_S3_THREADS))
+        self.s3_executor = ThreadPoolExecutor(self.s3_threads, thread_name_prefix="s3")
         self.s3 = self._create_s3_client(config)
         self.bucket = self.s3.Bucket(config["BUCKET_NAME"])
+        self.uploader = MultipartUploader(
+            self.s3.meta.client,
+            config["BUCKET_NAME"],
+            part_size=int(config.get("UPLOAD_PART_SIZE_MB", DEFAULT_PART_SIZE // MiB)) * MiB,
+            workers=int(config.get("UPLOAD_WORKERS", DEFAULT_WORKERS)),
+            memory_budget=int(config["UPLOAD_MEMORY_MB"]) * MiB if config.get("UPLOAD_MEMORY_MB") else None,
+        )
+        self.downloader = RangedDownloader(
+            self.s3.meta.client,
+            config["BUCKET_NAME"],
+            range_size=int(config.get("DOWNLOAD_RANGE_SIZE_MB", DEFAULT_RANGE_SIZE // MiB)) * MiB,
+            workers=int(config.get("DOWNLOAD_WORKERS", DEFAULT_DOWNLOAD_WORKERS)),
+        )
         self.cryptor = Crypt(
             bytes.fromhex(config["DATA_KEY"]),
             #bytes.fromhex(config["DATA_IV"]),
+            workers=int(config.get("CRYPT_WORKERS", 1)),
+            compression_level=int(config["COMPRESSION_LEVEL"]) if config.get("COMPRESSION_LEVEL") else None,
+            compression_threads=int(config.get("COMPRESSION_THREADS", 0)),
         )
+        self.cache = None
+        if config.get("DOWNLOAD_CACHE_DIR"):
+            self.cache = DownloadCache(
+                Path(config["DOWNLOAD_CACHE_DIR"]),
+                int(config.get("DOWNLOAD_CACHE_MB", DEFAULT_CACHE_SIZE // MiB)) * MiB,
+            )
+        self.legacy_cryptor = None
+        if config.get("DATA_IV"):
+            self.legacy_cryptor = LegacyCrypt(
+                bytes.fromhex(config["DATA_KEY"]),
+                bytes.fromhex(config["DATA_IV"]),
+            )
         self.async_exit_stack = contextlib.AsyncExitStack()
-        self.db = await DB.create(config["DB_ACCESS"])
+        self.db = await DB.create(
+            config["DB_ACCESS"],
+            min_size=int(config.get("DB_POOL_MIN_SIZE", DEFAULT_DB_POOL_MIN_SIZE)),
+            max_size=int(config.get("DB_POOL_MAX_SIZE", DEFAULT_DB_POOL_MAX_SIZE)),
+            # 0 behind a pooler that cannot keep prepared statements
+            prepare=config.get("DB_PREPARE", "1") != "0",
+        )
 
         return self
 
     async def __aenter__(self):
+        self.async_exit_stack.callback(self.s3_executor.shutdown)
         await self.async_exit_stack.enter_async_context(self.db)
         await self._init()
         return self
@@ -159,13 +359,25 @@ class DataManager:
         await self.async_exit_stack.aclose()
 
     async def _init(self):
-        await SrcItem.setup_db(self.db.connection)
-        await Warning.setup_db(self.db.connection)
-        await Playlist.setup_db(self.db.connection)
-        await VideoMetadata.setup_db(self.db.connection)
+        async with self.db.connection() as connection:
+            await SrcItem.setup_db(connection)
+            await Warning.setup_db(connection)
+            await Playlist.setup_db(connection)
+            await VideoMetadata.setup_db(connection)
+            await LegacyMigration.setup_db(connection)
+            await Verification.setup_db(connection)
+            await PendingUpload.setup_db(connection)
+            await ArchiveObject.setup_db(connection)
+
+    def transaction(self, pipeline: bool = False):
+        """Unit of work, `async with data_manager.transaction():` commits the writes in the block once.
+
+        With `pipeline` the writes are sent without waiting for each other.
+        """
+        return self.db.transaction(pipeline)
 
     async def add_src_item(self, item: SrcItem):
-        async with self.db.connection.cursor() as cursor:
+        async with self.db.connection() as connection, connection.cursor() as cursor:
             await cursor.execute("""
                     INSERT INTO src_items (provider, id, url, title, channel, channel_id, channel_url, duration, state, priority)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
@@ -182,15 +394,15 @@ class DataManager:
                     item.duration,
                     str(item.state),
                     item.priority,
-                )
+                ),
+                prepare=True,
             )
 
             inserted = await cursor.fetchone()
-            await self.db.connection.commit()
             return inserted is not None
 
     async def add_warning(self, warning: Warning):
-        async with self.db.connection.cursor() as cursor:
+        async with self.db.connection() as connection, connection.cursor() as cursor:
             await cursor.execute("""
                 INSERT INTO warnings (provider, id, warning_id, message, state)
                 VALUES (%s, %s, %s, %s, %s)
@@ -202,14 +414,65 @@ class DataManager:
                 warning.warning_id,
                 warning.message,
                 str(warning.state),
-            ))
+            ), prepare=True)
 
             inserted = await cursor.fetchone()
-            await self.db.connection.commit()
             return inserted is not None
 
+    async def add_src_items_bulk(self, items: list[SrcItem]) -> set[tuple[str, str]]:
+        """Bulk add_src_item, returns the (provider, id) of the items that were new"""
+        return await self._insert_bulk(
+            "src_items",
+            ["provider", "id", "url", "title", "channel", "channel_id", "channel_url", "duration", "state", "priority"],
+            [
+                (item.provider, item.id, item.url, item.title, item.channel, item.channel_id, item.channel_url, item.duration, str(item.state), item.priority)
+                for item in items
+            ],
+        )
+
+    async def add_warnings_bulk(self, warnings: list[Warning]) -> set[tuple[str, str]]:
+        """Bulk add_warning, returns the (provider, id) of the warnings that were new"""
+        return await self._insert_bulk(
+            "warnings",
+            ["provider", "id", "warning_id", "message", "state"],
+            [(warning.provider, warning.id, warning.warning_id, warning.message, str(warning.state)) for warning in warnings],
+        )
+
+    async def _insert_bulk(self, table: str, columns: list[str], rows: list[tuple]) -> set[tuple[str, str]]:
+        """COPY `rows` into a temporary table and insert those not in `table` yet with one statement.
+
+        One round trip per statement instead of one per row, duplicates
+        within `rows` are inserted once.
+        """
+        if not rows:
+            return set()
+
+        names = ", ".join(columns)
+
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute(f"""
+                CREATE TEMP TABLE {table}_bulk (LIKE {table} INCLUDING DEFAULTS);
+            """)
+
+            async with cursor.copy(f"COPY {table}_bulk ({names}) FROM STDIN") as copy:
+                for row in rows:
+                    await copy.write_row(row)
+
+            await cursor.execute(f"""
+                INSERT INTO {table} ({names})
+                SELECT {names} FROM {table}_bulk
+                ON CONFLICT (provider, id) DO NOTHING
+                RETURNING provider, id;
+            """)
+            inserted = {(provider, id) for provider, id in await cursor.fetchall()}
+
+            # a transaction may run more batches before it commits
+            await cursor.execute(f"DROP TABLE {table}_bulk;")
+
+            return inserted
+
     async def add_playlist(self, playlist: Playlist):
-        async with self.db.connection.cursor() as cursor:
+        async with self.db.connection() as connection, connection.cursor() as cursor:
             await cursor.execute("""
                 INSERT INTO playlists (url)
                 VALUES (%s)
@@ -218,11 +481,10 @@ class DataManager:
             """, (playlist.url,))
 
             inserted = await cursor.fetchone()
-            await self.db.connection.commit()
             return inserted is not None
 
     async def add_video_metadata(self, metadata: VideoMetadata):
-        async with self.db.connection.cursor() as cursor:
+        async with self.db.connection() as connection, connection.cursor() as cursor:
             await cursor.execute("""
                 INSERT INTO video_metadata (provider, id, chapters, description, raw_data)
                 VALUES (%s, %s, %s, %s, %s)
@@ -240,11 +502,10 @@ class DataManager:
             ))
 
             inserted = await cursor.fetchone()
-            await self.db.connection.commit()
             return inserted is not None
 
     async def get_playlists(self):
-        async with self.db.connection.cursor(row_factory=dict_row) as cursor:
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
             await cursor.execute("""
                 SELECT url FROM playlists;
             """)
@@ -253,7 +514,7 @@ class DataManager:
                 yield Playlist(url=row['url'])
 
     async def get_src_items_by_state(self, state: SrcItem.State):
-        async with self.db.connection.cursor(row_factory=dict_row) as cursor:
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
             await cursor.execute("""
                 SELECT provider, id, url, title, channel, channel_id, channel_url, duration, state, priority
                 FROM src_items
@@ -265,7 +526,7 @@ class DataManager:
                 yield self._create_src_item(row)
 
     async def mark_as_done(self, provider: str, id: str):
-        async with self.db.connection.cursor() as cursor:
+        async with self.db.connection() as connection, connection.cursor() as cursor:
             await cursor.execute("""
                 UPDATE src_items
                 SET state = %s
@@ -274,13 +535,94 @@ class DataManager:
                 str(SrcItem.State.DONE),
                 provider,
                 id,
+            ), prepare=True)
+
+    async def claim_src_item(self, owner: str, lease: timedelta = DEFAULT_LEASE) -> SrcItem | None:
+        """Lease a NEW item to `owner` for `lease` and mark it IN_PROGRESS, None when there is none.
+
+        Items with a pending upload come first, so a killed run is finished
+        before anything else, then a random one of the highest priority.
+        Jobs claiming at the same time skip each other's rows instead of
+        waiting, every item goes to one of them.
+        """
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(f"""
+                UPDATE src_items
+                SET state = %s, lease_owner = %s, lease_expires_at = now() + %s
+                WHERE (provider, id) = (
+                    SELECT provider, id
+                    FROM src_items AS items
+                    WHERE state = %s
+                    ORDER BY EXISTS (SELECT 1 FROM pending_uploads WHERE key = {ARCHIVE_KEY_SQL}) DESC, priority DESC, random()
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING provider, id, url, title, channel, channel_id, channel_url, duration, state, priority;
+            """, (str(SrcItem.State.IN_PROGRESS), owner, lease, str(SrcItem.State.NEW)))
+
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+
+            return self._create_src_item(row)
+
+    async def renew_lease(self, provider: str, id: str, owner: str, lease: timedelta = DEFAULT_LEASE) -> bool:
+        """Extend the lease of `owner` on an item by `lease` from now, False when it no longer holds it"""
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                UPDATE src_items
+                SET lease_expires_at = now() + %s
+                WHERE provider = %s AND id = %s AND state = %s AND lease_owner = %s
+                RETURNING 1;
+            """, (lease, provider, id, str(SrcItem.State.IN_PROGRESS), owner), prepare=True)
+
+            return await cursor.fetchone() is not None
+
+    async def release_src_item(self, provider: str, id: str, owner: str, state: SrcItem.State) -> bool:
+        """End the lease of `owner` on an item, moving it to `state`; False when it no longer held it"""
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                UPDATE src_items
+                SET state = %s, lease_owner = NULL, lease_expires_at = NULL
+                WHERE provider = %s AND id = %s AND state = %s AND lease_owner = %s
+                RETURNING 1;
+            """, (str(state), provider, id, str(SrcItem.State.IN_PROGRESS), owner), prepare=True)
+
+            return await cursor.fetchone() is not None
+
+    async def reclaim_expired_leases(self) -> int:
+        """Put IN_PROGRESS items whose job stopped renewing the lease back to NEW, returns how many"""
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                UPDATE src_items
+                SET state = %s, lease_owner = NULL, lease_expires_at = NULL
+                WHERE state = %s AND lease_expires_at < now();
+            """, (str(SrcItem.State.NEW), str(SrcItem.State.IN_PROGRESS)))
+
+            return cursor.rowcount
+
+    async def set_src_items_state(self, items: list[SrcItem], state: SrcItem.State) -> int:
+        """Move `items` to `state` in one statement, skipping those whose state changed since they were read"""
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                UPDATE src_items
+                SET state = %s
+                FROM unnest(%s::text[], %s::text[], %s::text[]) AS read(provider, id, state)
+                WHERE src_items.provider = read.provider
+                  AND src_items.id = read.id
+                  AND src_items.state = read.state;
+            """, (
+                str(state),
+                [item.provider for item in items],
+                [item.id for item in items],
+                [str(item.state) for item in items],
             ))
 
-            await self.db.connection.commit()
+            return cursor.rowcount
 
     async def get_warnings(self, state: Warning.State = None):
         """Get warnings with associated src_item data"""
-        async with self.db.connection.cursor(row_factory=dict_row) as cursor:
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
             query = """
                 SELECT
                     w.provider as w_provider, w.id as w_id, w.warning_id, w.message, w.state as w_state,
@@ -316,7 +658,7 @@ class DataManager:
 
     async def clear_warning(self, provider: str, id: str):
         """Clear a warning by marking src_item as NEW and warning as OVERRIDDEN"""
-        async with self.db.connection.cursor() as cursor:
+        async with self.db.connection() as connection, connection.pipeline(), connection.cursor() as cursor:
             await cursor.execute("""
                 UPDATE src_items
                 SET state = %s
@@ -326,7 +668,7 @@ class DataManager:
                 provider,
                 id,
                 str(SrcItem.State.WARNING),
-            ))
+            ), prepare=True)
 
             await cursor.execute("""
                 UPDATE warnings
@@ -336,44 +678,539 @@ class DataManager:
                 str(Warning.State.OVERRIDDEN),
                 provider,
                 id,
+            ), prepare=True)
+
+    async def get_legacy_migration(self, provider: str, id: str):
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("""
+                SELECT provider, id, state, started_at, error
+                FROM legacy_migrations
+                WHERE provider = %s AND id = %s;
+            """, (provider, id))
+
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+
+            return LegacyMigration(
+                provider=row['provider'],
+                id=row['id'],
+                state=LegacyMigration.State(row['state']),
+                started_at=row['started_at'],
+                error=row['error'],
+            )
+
+    async def set_legacy_migration_state(self, provider: str, id: str, state: LegacyMigration.State, error: str = None):
+        """Record migration progress, a finished migration also marks the src_item as DONE"""
+        async with self.db.connection() as connection, connection.pipeline(), connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO legacy_migrations (provider, id, state, started_at, finished_at, error)
+                VALUES (%(provider)s, %(id)s, %(state)s, now(), NULL, %(error)s)
+                ON CONFLICT (provider, id) DO UPDATE
+                SET state = EXCLUDED.state,
+                    started_at = CASE WHEN EXCLUDED.state = %(started)s THEN now() ELSE legacy_migrations.started_at END,
+                    finished_at = CASE WHEN EXCLUDED.state = %(done)s THEN now() ELSE NULL END,
+                    error = EXCLUDED.error;
+            """, {
+                'provider': provider,
+                'id': id,
+                'state': str(state),
+                'error': error,
+                'started': str(LegacyMigration.State.STARTED),
+                'done': str(LegacyMigration.State.DONE),
+            }, prepare=True)
+
+            if state == LegacyMigration.State.DONE:
+                await cursor.execute("""
+                    UPDATE src_items
+                    SET state = %s
+                    WHERE provider = %s AND id = %s AND state = %s;
+                """, (
+                    str(SrcItem.State.DONE),
+                    provider,
+                    id,
+                    str(SrcItem.State.LEGACY_DONE),
+                ), prepare=True)
+
+    async def add_verification(self, verification: Verification):
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO verifications (key, ok, size, error, verified_at)
+                VALUES (%s, %s, %s, %s, now())
+                ON CONFLICT (key) DO UPDATE
+                SET ok = EXCLUDED.ok,
+                    size = EXCLUDED.size,
+                    error = EXCLUDED.error,
+                    verified_at = EXCLUDED.verified_at;
+            """, (
+                verification.key,
+                verification.ok,
+                verification.size,
+                verification.error,
+            ), prepare=True)
+
+    async def get_verification(self, key: str):
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("""
+                SELECT key, ok, size, error, verified_at
+                FROM verifications
+                WHERE key = %s;
+            """, (key,))
+
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+
+            return Verification(**row)
+
+    async def get_verified_keys(self, max_age: timedelta) -> set[str]:
+        """Keys successfully verified within `max_age`"""
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                SELECT key
+                FROM verifications
+                WHERE ok AND verified_at > now() - %s;
+            """, (max_age,))
+
+            return {key for (key,) in await cursor.fetchall()}
+
+    async def add_archive_object(self, obj: ArchiveObject):
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO archive_objects (key, size, etag, uploaded_at, storage_class)
+                VALUES (%s, %s, %s, now(), %s)
+                ON CONFLICT (key) DO UPDATE
+                SET size = EXCLUDED.size,
+                    etag = EXCLUDED.etag,
+                    uploaded_at = EXCLUDED.uploaded_at,
+                    storage_class = EXCLUDED.storage_class;
+            """, (obj.key, obj.size, obj.etag, obj.storage_class))
+
+    async def get_archive_object(self, key: str):
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("""
+                SELECT key, size, etag, uploaded_at, storage_class
+                FROM archive_objects
+                WHERE key = %s;
+            """, (key,))
+
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+
+            return ArchiveObject(**row)
+
+    async def get_archive_objects(self) -> list[ArchiveObject]:
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("""
+                SELECT key, size, etag, uploaded_at, storage_class
+                FROM archive_objects
+                ORDER BY key;
+            """)
+
+            return [ArchiveObject(**row) for row in await cursor.fetchall()]
+
+    async def get_src_items_by_archive_object(self, state: SrcItem.State, exists: bool) -> list[SrcItem]:
+        """Items in `state` that have (`exists`) or lack an object in archive_objects"""
+        condition = "EXISTS" if exists else "NOT EXISTS"
+
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(f"""
+                SELECT provider, id, url, title, channel, channel_id, channel_url, duration, state, priority
+                FROM src_items AS items
+                WHERE state = %s
+                  AND {condition} (
+                      SELECT 1 FROM archive_objects AS objects WHERE objects.key = {ARCHIVE_KEY_SQL}
+                  )
+                ORDER BY provider, id;
+            """, (str(state),))
+
+            return [self._create_src_item(row) for row in await cursor.fetchall()]
+
+    async def get_orphaned_archive_objects(self) -> list[ArchiveObject]:
+        """Objects in archive_objects that no src_items row leads to"""
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(f"""
+                SELECT key, size, etag, uploaded_at, storage_class
+                FROM archive_objects AS objects
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM src_items AS items WHERE objects.key = {ARCHIVE_KEY_SQL}
+                )
+                ORDER BY key;
+            """)
+
+            return [ArchiveObject(**row) for row in await cursor.fetchall()]
+
+    async def sync_archive_objects(self) -> int:
+        """Rebuild archive_objects from the bucket, returns the number of objects in it.
+
+        The archive/ keys are hex digests, the 16 prefixes of their first
+        digit are listed in parallel, each page by page. The listing is
+        copied into a temporary table and merged in one transaction; rows of
+        objects gone from the bucket are removed, unless an upload recorded
+        them after the listing started.
+        """
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("SELECT clock_timestamp();")
+            (started,) = await cursor.fetchone()
+
+        listed = await asyncio.gather(*(self._run_s3(self._list_archive_objects, prefix) for prefix in INVENTORY_PREFIXES))
+        objects = [obj for part in listed for obj in part]
+
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                CREATE TEMP TABLE archive_objects_sync (LIKE archive_objects);
+            """)
+
+            async with cursor.copy("COPY archive_objects_sync (key, size, etag, uploaded_at, storage_class) FROM STDIN") as copy:
+                for obj in objects:
+                    await copy.write_row((obj.key, obj.size, obj.etag, obj.uploaded_at, obj.storage_class))
+
+            await cursor.execute("""
+                INSERT INTO archive_objects (key, size, etag, uploaded_at, storage_class)
+                SELECT key, size, etag, uploaded_at, storage_class
+                FROM archive_objects_sync
+                ON CONFLICT (key) DO UPDATE
+                SET size = EXCLUDED.size,
+                    etag = EXCLUDED.etag,
+                    uploaded_at = EXCLUDED.uploaded_at,
+                    storage_class = EXCLUDED.storage_class;
+            """)
+            await cursor.execute("""
+                DELETE FROM archive_objects AS objects
+                WHERE uploaded_at < %s
+                  AND NOT EXISTS (SELECT 1 FROM archive_objects_sync AS sync WHERE sync.key = objects.key);
+            """, (started,))
+            removed = cursor.rowcount
+
+            await cursor.execute("DROP TABLE archive_objects_sync;")
+
+        logging.info(f"Synced {len(objects)} archive objects, {sum(obj.size for obj in objects) / MiB:.0f} MiB, removed {removed} gone from the bucket")
+
+        return len(objects)
+
+    async def add_pending_upload(self, upload: PendingUpload):
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO pending_uploads (key, upload_id, salt, part_size, source_size, source_hash, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, now());
+            """, (
+                upload.key,
+                upload.upload_id,
+                upload.salt,
+                upload.part_size,
+                upload.source_size,
+                upload.source_hash,
             ))
 
-            await self.db.connection.commit()
+    async def add_pending_upload_part(self, key: str, part_number: int, etag: str):
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO pending_upload_parts (key, part_number, etag)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (key, part_number) DO UPDATE
+                SET etag = EXCLUDED.etag;
+            """, (key, part_number, etag), prepare=True)
+
+    async def get_pending_upload(self, key: str):
+        async with self.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("""
+                SELECT key, upload_id, salt, part_size, source_size, source_hash, created_at
+                FROM pending_uploads
+                WHERE key = %s;
+            """, (key,))
+
+            row = await cursor.fetchone()
+            if row is None:
+                return None
 
-    def upload_file(self, provider: str, id: str, file: BinaryIO):
-        def gen():
-            while chunk := file.read(1024):
-                yield chunk
+            await cursor.execute("""
+                SELECT part_number, etag
+                FROM pending_upload_parts
+                WHERE key = %s;
+            """, (key,))
+
+            parts = {part['part_number']: part['etag'] for part in await cursor.fetchall()}
+            return PendingUpload(**row, parts=parts)
+
+    async def get_pending_upload_keys(self) -> set[str]:
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                SELECT key
+                FROM pending_uploads;
+            """)
+
+            return {key for (key,) in await cursor.fetchall()}
+
+    async def remove_pending_upload(self, key: str):
+        async with self.db.connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("""
+                DELETE FROM pending_uploads
+                WHERE key = %s;
+            """, (key,))
+
+    async def abort_stale_uploads(self, max_age: timedelta = STALE_UPLOAD_AGE) -> int:
+        """Abort multipart uploads of archives started more than `max_age` ago, returns how many"""
+        def stale():
+            cutoff = datetime.now(timezone.utc) - max_age
+            paginator = self.s3.meta.client.get_paginator("list_multipart_uploads")
+
+            for page in paginator.paginate(Bucket=self.bucket.name, Prefix="archive/"):
+                for upload in page.get("Uploads", []):
+                    if upload["Initiated"] < cutoff:
+                        yield upload["Key"], upload["UploadId"]
+
+        aborted = 0
+        for key, upload_id in await self._run_s3(lambda: list(stale())):
+            logging.info(f"Aborting stale upload {upload_id} of {key}")
+            await self._run_s3(self.uploader.abort, key, upload_id)
+
+            pending = await self.get_pending_upload(key)
+            if pending is not None and pending.upload_id == upload_id:
+                await self.remove_pending_upload(key)
+
+            aborted += 1
+
+        return aborted
+
+    async def aupload_file(self, provider: str, id: str, file: BinaryIO, memory_budget: int = None) -> ArchiveObject:
+        """Async upload_file, the transfer runs in the S3 executor and the object is recorded in archive_objects"""
+        uploaded = await self._run_s3(self.upload_file, provider, id, file, memory_budget)
+        await self.add_archive_object(uploaded)
+        return uploaded
+
+    async def adownload_file(self, provider: str, id: str) -> AsyncGenerator:
+        """Async download_file, ranges are fetched and decrypted in the S3 executor"""
+        async for chunk in aiterate(self.download_file(provider, id), self.s3_executor):
+            yield chunk
+
+    async def averify_object(self, key: str, limiter: RateLimiter = None) -> int:
+        """Async verify_object, also checking the object against the ETag recorded at upload"""
+        uploaded = await self.get_archive_object(key)
+        return await self._run_s3(self.verify_object, key, limiter, uploaded.etag if uploaded else None)
+
+    async def amigrate_legacy_object(self, provider: str, id: str) -> LegacyMigration.State:
+        return await self._run_s3(self.migrate_legacy_object, provider, id)
+
+    async def _run_s3(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.s3_executor, functools.partial(func, *args))
+
+    def archive_key(self, provider: str, id: str) -> str:
+        return self._archive_object(provider, id).key
+
+    def _list_archive_objects(self, prefix: str) -> list[ArchiveObject]:
+        paginator = self.s3.meta.client.get_paginator("list_objects_v2")
+
+        return [
+            ArchiveObject(
+                key=item["Key"],
+                size=item["Size"],
+                etag=item["ETag"],
+                uploaded_at=item["LastModified"],
+                storage_class=item.get("StorageClass", "STANDARD"),
+            )
+            for page in paginator.paginate(Bucket=self.bucket.name, Prefix=prefix)
+            for item in page.get("Contents", [])
+        ]
+
+    def verify_object(self, key: str, limiter: RateLimiter = None, etag: str = None) -> int:
+        """Decrypt an archive object and discard the plaintext, returning its size.
+
+        Raises if the object is truncated or fails authentication, or with
+        PreconditionFailed when it is not the object with `etag`.
+        """
+        body = self.bucket.Object(key).get(**({"IfMatch": etag} if etag else {}))["Body"]
+
+        chunks = body.iter_chunks(chunk_size=1024 * 1024)
+        if limiter is not None:
+            chunks = limiter.throttle(chunks)
+
+        first = next(chunks, b"")
+        chunks = itertools.chain([first], chunks)
+
+        if first[:len(V3)] in (V2, V3):
+            cryptor = self.cryptor
+        elif self.legacy_cryptor is not None:
+            cryptor = self.legacy_cryptor
+        else:
+            raise ValueError(f"Unsupported version: {first[:len(V3)]}")
+
+        size = 0
+        for chunk in cryptor.decrypt(chunks):
+            size += len(chunk)
+
+        return size
 
-        encrypted = to_file_like_obj(self.cryptor.encrypt(gen()))
+    def upload_file(self, provider: str, id: str, file: BinaryIO, memory_budget: int = None) -> ArchiveObject:
+        """Encrypt and upload `file`, part size and concurrency are planned within `memory_budget` bytes"""
+        # parts are read from the reader, uncompressed segments are encrypted straight into them
+        encrypted = self.cryptor.encrypt_reader(file)
+        return self._upload(self._archive_object(provider, id), encrypted, self._remaining_size(file), memory_budget)
 
-        key = hash_string(f"{provider}:{id}")
-        logging.info(f"Uploading file to archive/{key}")
+    async def upload_file_resumable(self, provider: str, id: str, file: BinaryIO, memory_budget: int = None) -> ArchiveObject:
+        """Like upload_file, but a run killed mid-upload is continued by the next one.
 
-        obj = self.bucket.Object(f"archive/{key}")
+        The upload ID, salt and completed parts are kept in pending_uploads.
+        The archive is rebuilt by the next run, so a pending upload is only
+        continued when the new archive has the same hash; otherwise it is
+        aborted and the upload starts over. Re-encrypting with the stored
+        salt reproduces the uploaded parts byte for byte.
+        """
+        obj = self._archive_object(provider, id)
+        source_size, source_hash = await self._run_s3(self._hash_file, file)
 
-        res = obj.upload_fileobj(
+        pending = await self.get_pending_upload(obj.key)
+        if pending is not None and (pending.source_size, pending.source_hash) != (source_size, source_hash):
+            logging.info(f"Archive of {obj.key} changed since upload {pending.upload_id}, starting over")
+            await self._run_s3(self.uploader.abort, obj.key, pending.upload_id)
+            await self.remove_pending_upload(obj.key)
+            pending = None
+
+        loop = asyncio.get_running_loop()
+
+        def call(coroutine):
+            # the upload runs in a worker thread, the pool belongs to the loop
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+        def upload(pending: PendingUpload | None):
+            salt = pending.salt if pending else secrets.token_bytes(SALT_SIZE)
+            progress = UploadProgress(pending.upload_id, pending.part_size, pending.parts) if pending else None
+
+            def on_created(progress: UploadProgress):
+                call(self.add_pending_upload(PendingUpload(
+                    key=obj.key,
+                    upload_id=progress.upload_id,
+                    salt=salt,
+                    part_size=progress.part_size,
+                    source_size=source_size,
+                    source_hash=source_hash,
+                )))
+
+            def on_part(number: int, etag: str):
+                call(self.add_pending_upload_part(obj.key, number, etag))
+
+            file.seek(0)
+            encrypted = self.cryptor.encrypt_reader(file, salt, progress.offset if progress else 0)
+            return self._upload(obj, encrypted, source_size, memory_budget, progress, on_created, on_part)
+
+        try:
+            try:
+                uploaded = await self._run_s3(upload, pending)
+            except ClientError as e:
+                if pending is None or e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                    raise
+
+                logging.info(f"Upload {pending.upload_id} of {obj.key} no longer exists, starting over")
+                await self.remove_pending_upload(obj.key)
+                uploaded = await self._run_s3(upload, None)
+        except Exception:
+            # the uploader aborted the upload, only a killed run leaves it for the next one
+            await self.remove_pending_upload(obj.key)
+            raise
+
+        await self.add_archive_object(uploaded)
+        await self.remove_pending_upload(obj.key)
+        return uploaded
+
+    @staticmethod
+    def _hash_file(file: BinaryIO) -> tuple[int, str]:
+        file.seek(0)
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+        return file.tell(), digest
+
+    @staticmethod
+    def _remaining_size(file: BinaryIO) -> int | None:
+        # BytesIO has a fileno() that raises, seeking works for it and for files alike
+        if not file.seekable():
+            return None
+
+        position = file.tell()
+        end = file.seek(0, os.SEEK_END)
+        file.seek(position)
+        return end - position
+
+    def migrate_legacy_object(self, provider: str, id: str) -> LegacyMigration.State:
+        """Re-encrypt a legacy CBC object with the current format, streaming it back into the same key"""
+        if self.legacy_cryptor is None:
+            raise ValueError("DATA_IV is required to read legacy objects")
+
+        obj = self._archive_object(provider, id)
+        obj.load()
+
+        if obj.storage_class == "GLACIER":
+            if obj.restore is None:
+                logging.info(f"Restoring {obj.key} from GLACIER")
+                obj.restore_object(RestoreRequest={"Days": 2})
+                return LegacyMigration.State.RESTORING
+
+            if 'ongoing-request="true"' in obj.restore:
+                return LegacyMigration.State.RESTORING
+
+        # an earlier attempt may have replaced the object and failed afterwards,
+        # CBC-decrypting the new object would destroy the only copy
+        header = obj.get(Range=f"bytes=0-{len(V3) - 1}")["Body"].read()
+        if header in (V2, V3):
+            logging.info(f"{obj.key} was migrated by an earlier attempt")
+            return LegacyMigration.State.DONE
+
+        body = obj.get()["Body"]
+        decrypted = self.legacy_cryptor.decrypt(body.iter_chunks(chunk_size=1024 * 1024))
+
+        # the new object only replaces the old one once the upload completes
+        # the plaintext is never longer than the padded CBC ciphertext
+        self._upload(obj, self.cryptor.encrypt(decrypted), obj.content_length)
+
+        return LegacyMigration.State.DONE
+
+    def _upload(
+        self,
+        obj,
+        encrypted: Iterable[bytes] | BinaryIO,
+        size: int = None,
+        memory_budget: int = None,
+        progress: UploadProgress = None,
+        on_created: Callable[[UploadProgress], None] = None,
+        on_part: Callable[[int, str], None] = None,
+    ) -> ArchiveObject:
+        """Upload an encrypted stream, `size` is the plaintext size when known.
+
+        The uploader checks every part and the completed object against their
+        MD5, so there is no need to wait for the object to show up.
+        """
+        logging.info(f"Uploading file to {obj.key}")
+
+        result = self.uploader.upload(
+            obj.key,
             encrypted,
-            ExtraArgs={"Tagging": "archive=true"},
-            Config=boto3.s3.transfer.TransferConfig(
-                multipart_chunksize=128 * 1024 * 1024,
-                #multipart_threshold=128 * 1024 * 1024,
-            ),
+            {"Tagging": "archive=true"},
+            size=self.cryptor.encrypted_size(size) if size is not None else None,
+            memory_budget=memory_budget,
+            progress=progress,
+            on_created=on_created,
+            on_part=on_part,
         )
-        logging.info(f"Uploaded to bucket with status {res}")
+        logging.info(f"Uploaded {result.size} bytes in {result.parts} parts, ETag {result.etag}, peak RSS {peak_rss() / MiB:.0f} MiB")
 
-        res = obj.wait_until_exists()
-        logging.info(f"Wait status {res}")
+        return ArchiveObject(key=obj.key, size=result.size, etag=result.etag)
 
     def download_file(self, provider: str, id: str) -> BinaryIO:
-        key = hash_string(f"{provider}:{id}")
+        """Download and decrypt an archive object, through the download cache when there is one"""
+        obj = self._archive_object(provider, id)
+
+        if self.cache is None:
+            return self.cryptor.decrypt(self.downloader.download(obj.key))
+
+        # the entry and the download are checked against the same ETag
+        head = self.s3.meta.client.head_object(Bucket=self.bucket.name, Key=obj.key)
 
-        obj = self.bucket.Object(f"archive/{key}")
+        encrypted = self.cache.get(obj.key, head["ETag"])
+        if encrypted is None:
+            encrypted = self.cache.put(obj.key, head["ETag"], self.downloader.download(obj.key, head))
 
-        resp = obj.get()
-        body = resp["Body"]
+        return self.cryptor.decrypt(encrypted)
 
-        return self.cryptor.decrypt(body.iter_chunks(chunk_size=1024 * 1024))
+    def _archive_object(self, provider: str, id: str):
+        return self.bucket.Object(f"archive/{hash_string(f'{provider}:{id}')}")
 
     def _create_s3_client(self, config):
         session = boto3.Session(
@@ -382,9 +1219,22 @@ class DataManager:
             aws_secret_access_key=config["SECRET_KEY"],
         )
 
+        # every S3 thread may run an upload or download with its own workers
+        transfer_workers = max(
+            int(config.get("UPLOAD_WORKERS", DEFAULT_WORKERS)),
+            int(config.get("DOWNLOAD_WORKERS", DEFAULT_DOWNLOAD_WORKERS)),
+        )
+
         resource = session.resource(
             's3',
             endpoint_url=config["API_ENDPOINT"],
+            config=botocore.config.Config(
+                max_pool_connections=self.s3_threads * transfer_workers,
+                tcp_keepalive=True,
+                connect_timeout=10,
+                read_timeout=60,
+                retries={"mode": "adaptive", "max_attempts": S3_MAX_ATTEMPTS},
+            ),
         )
 
         return resource
@@ -1,19 +1,124 @@
+import time
+import logging
+import contextlib
+from contextvars import ContextVar
+from typing import AsyncIterator
+
 import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+DEFAULT_MIN_SIZE = 1
+DEFAULT_MAX_SIZE = 8
+# waiting longer than this for a connection is logged, the pool is too small
+SLOW_CHECKOUT = 1.0
 
 
 class DB:
+    """A pool of connections, every task checks out its own for the statements it runs.
+
+    Connections are checked before they are handed out, one dropped by the
+    server is replaced instead of failing the task that gets it. Each
+    checkout is its own transaction, committed when it is returned, unless
+    it runs inside transaction().
+
+    Statements run with prepare=True are parsed and planned once per
+    connection, later executions only send the parameters. `prepare=False`
+    turns that off for poolers in front of the server that cannot keep
+    prepared statements.
+    """
+
     @classmethod
-    async def create(cls, connection_string: str):
+    async def create(
+        cls,
+        connection_string: str,
+        min_size: int = DEFAULT_MIN_SIZE,
+        max_size: int = DEFAULT_MAX_SIZE,
+        prepare: bool = True,
+    ):
         self = cls()
 
         self.connection_string = connection_string
-        self.connection = await psycopg.AsyncConnection.connect(self.connection_string)
+        self.pool = AsyncConnectionPool(
+            self.connection_string,
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={} if prepare else {"prepare_threshold": None},
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+        await self.pool.open(wait=True)
+        self.opened = time.monotonic()
+        self.commits = 0
+        # the connection of the transaction() block the current task runs in
+        self._transaction: ContextVar[psycopg.AsyncConnection | None] = ContextVar(f"transaction-{id(self)}", default=None)
 
         return self
 
+    @contextlib.asynccontextmanager
+    async def connection(self) -> AsyncIterator[psycopg.AsyncConnection]:
+        """Check out a connection, committed on success and rolled back on error.
+
+        Inside transaction() the connection of the transaction is used and
+        left for it to commit.
+        """
+        current = self._transaction.get()
+        if current is not None:
+            yield current
+            return
+
+        started = time.monotonic()
+
+        async with self.pool.connection() as connection:
+            waited = time.monotonic() - started
+            if waited > SLOW_CHECKOUT:
+                logging.warning(f"Waited {waited:.1f}s for a DB connection, {self.pool.max_size} are in use")
+
+            yield connection
+
+        self.commits += 1
+
+    @contextlib.asynccontextmanager
+    async def transaction(self, pipeline: bool = False) -> AsyncIterator[psycopg.AsyncConnection]:
+        """Run every statement of the block on one connection and commit them together at its end.
+
+        Nothing is committed when the block raises. A nested transaction()
+        joins the outer one, so do tasks started in the block, which then
+        take turns on its connection.
+
+        With `pipeline` statements are sent without waiting for their
+        results, only fetching a result waits for the ones before it. An
+        error then surfaces at a later statement or at the end of the
+        block. COPY is not available in a pipeline.
+        """
+        current = self._transaction.get()
+        if current is not None:
+            async with current.pipeline() if pipeline else contextlib.nullcontext():
+                yield current
+            return
+
+        async with self.connection() as connection:
+            token = self._transaction.set(connection)
+            try:
+                async with connection.pipeline() if pipeline else contextlib.nullcontext():
+                    yield connection
+            finally:
+                self._transaction.reset(token)
+
+    def log_stats(self):
+        stats = self.pool.get_stats()
+        elapsed = time.monotonic() - self.opened
+        utilization = stats.get("usage_ms", 0) / 1000 / max(elapsed * self.pool.max_size, 1e-9)
+
+        logging.info(
+            f"DB pool: {stats.get('requests_num', 0)} checkouts, {stats.get('requests_queued', 0)} waited "
+            f"{stats.get('requests_wait_ms', 0) / 1000:.1f}s in total, "
+            f"{stats.get('pool_size', 0)}/{self.pool.max_size} connections, {utilization:.0%} utilized, {self.commits} commits"
+        )
+
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await self.connection.close()
+        self.log_stats()
+        await self.pool.close()
         return False
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ytarchive_lib.config import load_config
+from ytarchive_lib.crypt import Crypt as LegacyCrypt
+from ytarchive_lib.crypt_v2 import Crypt, V2, V3
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+
+MiB = 1024 * 1024
+
+
+def load_keys(config) -> tuple[bytes, bytes]:
+    """DATA_KEY and DATA_IV, falling back to the TF_VAR_* variables used by tofu"""
+    key = config.get("DATA_KEY") or config.get("TF_VAR_data_key")
+    iv = config.get("DATA_IV") or config.get("TF_VAR_data_iv")
+
+    if not key:
+        raise ValueError("DATA_KEY is not set")
+
+    return bytes.fromhex(key), bytes.fromhex(iv) if iv else None
+
+
+def detect_version(path: Path) -> bytes:
+    """V2 or V3 for GCM objects, V1 for the legacy CBC format which has no header"""
+    with open(path, "rb") as f:
+        version = f.read(len(V3))
+
+    return version if version in (V2, V3) else b"V1:"
+
+
+def decrypt_file(src: Path, dst: Path, key: bytes, iv: bytes = None, buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Decrypt `src` into `dst`, returns the number of bytes written.
+
+    The output is written next to `dst` first and only renamed into place
+    once the whole file decrypted and authenticated.
+    """
+    if detect_version(src) == b"V1:":
+        if iv is None:
+            raise ValueError(f"{src} is in the legacy format, DATA_IV is required")
+
+        cryptor = LegacyCrypt(key, iv)
+    else:
+        cryptor = Crypt(key)
+
+    partial = dst.with_name(dst.name + ".part")
+
+    try:
+        with open(src, "rb", buffering=buffer_size) as f, open(partial, "wb", buffering=buffer_size) as out:
+            written = cryptor.decrypt_into(f, out, buffer_size)
+
+        os.replace(partial, dst)
+    finally:
+        partial.unlink(missing_ok=True)
+
+    return written
+
+
+def collect_inputs(inputs: list[Path]) -> list[Path]:
+    files = []
+
+    for path in inputs:
+        if path.is_dir():
+            files.extend(sorted(child for child in path.iterdir() if child.is_file()))
+        else:
+            files.append(path)
+
+    return files
+
+
+def output_paths(files: list[Path], output: Path, suffix: str) -> list[Path]:
+    # a single file may be decrypted to an explicit file name, as before
+    if len(files) == 1 and not output.is_dir():
+        return [output]
+
+    output.mkdir(parents=True, exist_ok=True)
+    return [output / (file.name + suffix) for file in files]
+
+
+def decrypt_files(files: list[Path], outputs: list[Path], key: bytes, iv: bytes, jobs: int, buffer_size: int) -> list[Path]:
+    """Decrypt files in `jobs` processes, printing progress; returns the files that failed"""
+    total_in = sum(file.stat().st_size for file in files)
+    done_in = 0
+    failed = []
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = {
+            executor.submit(decrypt_file, src, dst, key, iv, buffer_size): src
+            for src, dst in zip(files, outputs)
+        }
+
+        for index, future in enumerate(as_completed(futures), start=1):
+            src = futures[future]
+            done_in += src.stat().st_size
+            elapsed = time.perf_counter() - started
+
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Failed to decrypt {src}: {type(e).__name__}: {e}")
+                failed.append(src)
+                status = "FAILED"
+            else:
+                status = "ok"
+
+            print(
+                f"[{index}/{len(files)}] {status} {src.name} "
+                f"{done_in / MiB:.1f}/{total_in / MiB:.1f} MiB, {done_in / max(elapsed, 1e-9) / 1e6:.1f} MB/s",
+                file=sys.stderr,
+            )
+
+    elapsed = time.perf_counter() - started
+    print(f"Decrypted {len(files) - len(failed)}/{len(files)} files, {total_in / MiB:.1f} MiB in {elapsed:.1f}s", file=sys.stderr)
+
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Decrypt archive objects downloaded from the bucket")
+
+    parser.add_argument("inputs", type=Path, nargs="+", help="Files or directories of files to decrypt")
+    parser.add_argument("output", type=Path, help="Output file for a single input, otherwise output directory")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Files decrypted in parallel")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE // MiB, help="Read and write buffer size in MiB")
+    parser.add_argument("--suffix", default=".zip", help="Suffix of the files written into an output directory")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    key, iv = load_keys(load_config())
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        logging.info("Nothing to decrypt")
+        return
+
+    outputs = output_paths(files, args.output, args.suffix)
+
+    failed = decrypt_files(files, outputs, key, iv, max(args.jobs, 1), args.buffer_size * MiB)
+    if failed:
+        sys.exit(1)
@@ -2,16 +2,19 @@ import os
 import logging
 import json
 import yt_dlp
-import random
+import socket
 import shutil
+import secrets
 import zipfile
 import asyncio
+import contextlib
+from datetime import timedelta
 from pathlib import Path
 from dataclasses import asdict
 from pprint import pprint
 
 from ytarchive_lib.config import load_config
-from ytarchive_lib.data_manager import DataManager, SrcItem, VideoMetadata
+from ytarchive_lib.data_manager import DataManager, SrcItem, VideoMetadata, DEFAULT_LEASE
 
 DOWNLOAD_FOLDER = "/tmp/ytarchive"
 
@@ -65,66 +68,91 @@ def download(url):
         return info
 
 
-def archive_files(archive_path):
-    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+def archive_files(archive_path, compression=zipfile.ZIP_DEFLATED):
+    # a stable order gives the same archive for the same download, so an interrupted upload can be resumed
+    with zipfile.ZipFile(archive_path, 'w', compression) as zip_file:
         for root, dirs, files in os.walk(DOWNLOAD_FOLDER):
-            for file in files:
+            dirs.sort()
+            for file in sorted(files):
                 file_path = os.path.join(root, file)
                 zip_file.write(file_path, os.path.relpath(file_path, DOWNLOAD_FOLDER))
 
 
-async def get_possible_items(data_manager):
-    new_items = []
-    async for item in data_manager.get_src_items_by_state(SrcItem.State.NEW):
-        new_items.append(item)
-
-    logging.info(f"Found {len(new_items)} NEW items")
-
-    if new_items:
-        priority = new_items[0].priority
-        new_items = [item for item in new_items if item.priority == priority]
-
-    logging.info(f"Found {len(new_items)} prioritized items")
-    return new_items
-
-
-async def amain():
+@contextlib.asynccontextmanager
+async def heartbeat(data_manager, item: SrcItem, owner: str, lease: timedelta = DEFAULT_LEASE):
+    """Renew the lease on `item` while the block runs"""
+    async def renew():
+        while True:
+            await asyncio.sleep(lease.total_seconds() / 3)
+            if not await data_manager.renew_lease(item.provider, item.id, owner, lease):
+                logging.warning(f"Lease of {owner} on {item.provider}:{item.id} was lost")
+
+    task = asyncio.create_task(renew())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+async def process_item(data_manager, item: SrcItem):
+    # blocking work runs in threads, the heartbeat keeps running meanwhile
+    info = await asyncio.to_thread(download, item.url)
+    if "automatic_captions" in info:
+        del info["automatic_captions"]
+
+    video_metadata = VideoMetadata(
+        provider=item.provider,
+        id=item.id,
+        chapters=json.dumps(info.get('chapters') or []),
+        description=info.get('description', ""),
+        raw_data=json.dumps(info),
+    )
+    await data_manager.add_video_metadata(video_metadata)
+    logging.info(f"Stored video metadata for: {item.title}")
+
+    with open(Path(DOWNLOAD_FOLDER) / "src_item.json", "w") as f:
+        json.dump(asdict(item), f, default=str)
+
+    archive = "/tmp/.files.zip"
+    compression = zipfile.ZIP_DEFLATED
+    if data_manager.cryptor.compression_level is not None:
+        # the cryptor compresses the whole archive, deflating it first only costs CPU
+        compression = zipfile.ZIP_STORED
+    await asyncio.to_thread(archive_files, archive, compression)
+
+    with open(archive, "rb") as f:
+        await data_manager.upload_file_resumable(item.provider, item.id, f)
+
+
+async def amain(lease: timedelta = DEFAULT_LEASE):
     config = load_config()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
 
     async with await DataManager.create(config) as data_manager:
-        new_items = await get_possible_items(data_manager)
+        reclaimed = await data_manager.reclaim_expired_leases()
+        if reclaimed:
+            logging.info(f"Reclaimed {reclaimed} items whose job stopped")
 
-        if not new_items:
+        selected_item = await data_manager.claim_src_item(owner, lease)
+        if selected_item is None:
             logging.info("No items to download")
             return
 
-        selected_item = random.choice(new_items)
         logging.info(f"Selected item: {selected_item}")
 
-        info = download(selected_item.url)
-        if "automatic_captions" in info:
-            del info["automatic_captions"]
+        try:
+            async with heartbeat(data_manager, selected_item, owner, lease):
+                await process_item(data_manager, selected_item)
+        except Exception:
+            # the next run retries it, resuming the upload where there is one
+            await data_manager.release_src_item(selected_item.provider, selected_item.id, owner, SrcItem.State.NEW)
+            raise
 
-        video_metadata = VideoMetadata(
-            provider=selected_item.provider,
-            id=selected_item.id,
-            chapters=json.dumps(info.get('chapters') or []),
-            description=info.get('description', ""),
-            raw_data=json.dumps(info),
-        )
-        await data_manager.add_video_metadata(video_metadata)
-        logging.info(f"Stored video metadata for: {selected_item.title}")
-
-        with open(Path(DOWNLOAD_FOLDER) / "src_item.json", "w") as f:
-            json.dump(asdict(selected_item), f, default=str)
-
-        archive = "/tmp/.files.zip"
-        archive_files(archive)
-
-        with open(archive, "rb") as f:
-            data_manager.upload_file(selected_item.provider, selected_item.id, f)
-
-        await data_manager.mark_as_done(selected_item.provider, selected_item.id)
+        if not await data_manager.release_src_item(selected_item.provider, selected_item.id, owner, SrcItem.State.DONE):
+            logging.warning(f"Uploaded {selected_item.provider}:{selected_item.id} after its lease was taken over")
+            return
 
         logging.info(f"Successfully processed item: {selected_item.title}")
 
@@ -0,0 +1,109 @@
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError, IncompleteReadError, ResponseStreamingError
+
+from .uploader import is_transient
+
+MiB = 1024 * 1024
+
+DEFAULT_RANGE_SIZE = 8 * MiB
+DEFAULT_WORKERS = 4
+DEFAULT_READ_AHEAD = 2
+DEFAULT_RETRIES = 3
+
+
+class RangedDownloader:
+    """Download an object as concurrent ranged GETs, yielded in order.
+
+    `workers` threads fetch ranges of `range_size` bytes and up to
+    `read_ahead` more finished ranges wait for the consumer, so memory stays
+    at (workers + read_ahead + 1) ranges however slow the consumer is. Every
+    range is requested with the ETag seen at the start, an object replaced
+    mid-download fails instead of mixing two versions. A range failing with
+    a transient error is retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        range_size: int = DEFAULT_RANGE_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        read_ahead: int = DEFAULT_READ_AHEAD,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = 1.0,
+    ):
+        if range_size < 1:
+            raise ValueError(f"Invalid range size ({range_size}). Must be at least 1 byte.")
+
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers ({workers}). Must be at least 1.")
+
+        if read_ahead < 0:
+            raise ValueError(f"Invalid read ahead ({read_ahead}). Must not be negative.")
+
+        self.client = client
+        self.bucket = bucket
+        self.range_size = range_size
+        self.workers = workers
+        self.read_ahead = read_ahead
+        self.retries = retries
+        self.backoff = backoff
+
+    def download(self, key: str, head: dict = None) -> Generator:
+        """Yield the content of `key` in ranges of `range_size` bytes, logging the throughput once done.
+
+        `head` is a head_object response of `key` the caller already has.
+        """
+        if head is None:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+
+        size, etag = head["ContentLength"], head["ETag"]
+
+        started = time.perf_counter()
+        pending = deque()
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="download") as executor:
+            try:
+                for start in range(0, size, self.range_size):
+                    end = min(start + self.range_size, size) - 1
+                    pending.append(executor.submit(self._get_range, key, etag, start, end))
+
+                    if len(pending) > self.workers + self.read_ahead:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # the consumer may stop early, nothing more is fetched for it
+                for future in pending:
+                    future.cancel()
+
+        elapsed = time.perf_counter() - started
+        logging.info(
+            f"Downloaded {key}: {size / MiB:.1f} MiB in {elapsed:.1f}s, "
+            f"{size / max(elapsed, 1e-9) / 1e6:.1f} MB/s with {self.workers} workers"
+        )
+
+    def _get_range(self, key: str, etag: str, start: int, end: int) -> bytes:
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.client.get_object(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Range=f"bytes={start}-{end}",
+                    IfMatch=etag,
+                )
+                # botocore checks the body against Content-Length (IncompleteReadError)
+                return response["Body"].read()
+            except (ClientError, ConnectionError, HTTPClientError, IncompleteReadError, ResponseStreamingError) as e:
+                if attempt == self.retries or not is_transient(e):
+                    raise
+
+                delay = self.backoff * 2 ** attempt
+                logging.warning(f"Download of bytes {start}-{end} of {key} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
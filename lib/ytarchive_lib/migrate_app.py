@@ -0,0 +1,74 @@
+import time
+import logging
+import asyncio
+import argparse
+from collections import Counter
+
+from ytarchive_lib.config import load_config
+from ytarchive_lib.data_manager import DataManager, SrcItem, LegacyMigration
+
+DEFAULT_WORKERS = 2
+# leave room for the running migrations inside the 10 minute job timeout
+DEFAULT_TIME_LIMIT = 6 * 60
+
+
+async def migrate_item(data_manager, item) -> LegacyMigration.State:
+    previous = await data_manager.get_legacy_migration(item.provider, item.id)
+
+    if previous is not None and previous.state in (LegacyMigration.State.STARTED, LegacyMigration.State.FAILED):
+        logging.info(f"Retrying migration of {item.provider}:{item.id} after {previous.state}")
+
+    await data_manager.set_legacy_migration_state(item.provider, item.id, LegacyMigration.State.STARTED)
+
+    try:
+        state = await data_manager.amigrate_legacy_object(item.provider, item.id)
+    except Exception as e:
+        logging.exception(f"Failed to migrate {item.provider}:{item.id}")
+        await data_manager.set_legacy_migration_state(
+            item.provider, item.id, LegacyMigration.State.FAILED, error=str(e)
+        )
+        return LegacyMigration.State.FAILED
+
+    await data_manager.set_legacy_migration_state(item.provider, item.id, state)
+    return state
+
+
+async def amain(workers: int = DEFAULT_WORKERS, time_limit: float = DEFAULT_TIME_LIMIT, limit: int = None):
+    config = load_config()
+    deadline = time.monotonic() + time_limit
+
+    async with await DataManager.create(config) as data_manager:
+        items = []
+        async for item in data_manager.get_src_items_by_state(SrcItem.State.LEGACY_DONE):
+            items.append(item)
+
+        if limit is not None:
+            items = items[:limit]
+
+        logging.info(f"Found {len(items)} legacy items")
+
+        semaphore = asyncio.Semaphore(workers)
+        stats = Counter()
+
+        async def worker(item):
+            async with semaphore:
+                if time.monotonic() > deadline:
+                    stats["skipped"] += 1
+                    return
+
+                stats[str(await migrate_item(data_manager, item))] += 1
+
+        await asyncio.gather(*[worker(item) for item in items])
+
+        logging.info(f"Migration finished: {dict(stats)}")
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-encrypt legacy archive objects with the current format')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Objects migrated concurrently')
+    parser.add_argument('--time-limit', type=float, default=DEFAULT_TIME_LIMIT, help='Seconds after which no new objects are started')
+    parser.add_argument('--limit', type=int, default=None, help='Migrate at most this many objects')
+
+    args = parser.parse_args()
+    asyncio.run(amain(args.workers, args.time_limit, args.limit))
@@ -76,27 +76,40 @@ async def amain():
             data = get_flat_playlist(playlist.url)
 
             warnings = []
+            # a playlist listing a video twice adds it once, as the first entry
+            items = {}
+            item_warnings = {}
 
-            async def process_entry(entry):
+            for entry in data["entries"]:
                 item = make_item(entry)
+                key = (item.provider, item.id)
+                if key in items:
+                    continue
 
                 warning = detect_warnings(item)
                 if warning:
                     item.state = SrcItem.State.WARNING
+                    item_warnings[key] = warning
 
-                added = await data_manager.add_src_item(item)
+                items[key] = item
 
-                if not added:
-                    return
+            # the whole playlist goes in with one COPY, only the new items get their warnings
+            async with data_manager.transaction():
+                added = await data_manager.add_src_items_bulk(list(items.values()))
+                added_warnings = await data_manager.add_warnings_bulk([
+                    warning for key, warning in item_warnings.items() if key in added
+                ])
 
-                if warning:
-                    await data_manager.add_warning(warning)
+            for key, item in items.items():
+                if key not in added:
+                    continue
+
+                warning = item_warnings.get(key)
+                if key in added_warnings:
                     warnings.append(warning.message)
 
                 logging.info(f"Item added. {item=}, {warning=}")
 
-            await asyncio.gather(*[process_entry(entry) for entry in data["entries"]])
-
         logging.info("Done")
 
     if warnings:
@@ -0,0 +1,63 @@
+import time
+import logging
+import asyncio
+import argparse
+
+from ytarchive_lib.config import load_config
+from ytarchive_lib.data_manager import DataManager, SrcItem
+
+
+async def amain(fix: bool = False, sync: bool = True) -> dict[str, list]:
+    """Compare src_items against the archive objects, optionally fixing the item states.
+
+    - NEW items with an object were uploaded by a run that crashed before
+      marking them, they are marked DONE.
+    - DONE and LEGACY_DONE items without an object lost it, they are reset
+      to NEW and downloaded again.
+    - Objects of no item are only reported.
+    """
+    config = load_config()
+
+    async with await DataManager.create(config) as data_manager:
+        started = time.monotonic()
+
+        if sync:
+            await data_manager.sync_archive_objects()
+
+        report = {
+            "uploaded": await data_manager.get_src_items_by_archive_object(SrcItem.State.NEW, exists=True),
+            "missing": [
+                *await data_manager.get_src_items_by_archive_object(SrcItem.State.DONE, exists=False),
+                *await data_manager.get_src_items_by_archive_object(SrcItem.State.LEGACY_DONE, exists=False),
+            ],
+            "orphaned": await data_manager.get_orphaned_archive_objects(),
+        }
+
+        for item in report["uploaded"]:
+            print(f"uploaded but {item.state}: {item.provider}:{item.id} {item.title}")
+
+        for item in report["missing"]:
+            print(f"no object but {item.state}: {item.provider}:{item.id} {item.title}")
+
+        for obj in report["orphaned"]:
+            print(f"no item: {obj.key} {obj.size} bytes")
+
+        if fix:
+            async with data_manager.transaction():
+                done = await data_manager.set_src_items_state(report["uploaded"], SrcItem.State.DONE)
+                new = await data_manager.set_src_items_state(report["missing"], SrcItem.State.NEW)
+            logging.info(f"Marked {done} items DONE and reset {new} items to NEW")
+
+        counts = {name: len(found) for name, found in report.items()}
+        logging.info(f"Reconciliation finished in {time.monotonic() - started:.1f}s: {counts}")
+
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare item states against the archive objects in the bucket')
+    parser.add_argument('--fix', action='store_true', help='Mark uploaded items DONE and reset items without an object to NEW')
+    parser.add_argument('--no-sync', action='store_true', help='Use archive_objects as it is instead of listing the bucket first')
+
+    args = parser.parse_args()
+    asyncio.run(amain(fix=args.fix, sync=not args.no_sync))
@@ -0,0 +1,394 @@
+import time
+import base64
+import hashlib
+import logging
+import itertools
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import BinaryIO, Callable, Iterable
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+from .crypt_v2 import Segmenter
+from .utils import read_into
+
+MiB = 1024 * 1024
+
+DEFAULT_PART_SIZE = 32 * MiB
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 2
+DEFAULT_RETRIES = 3
+# S3 limits
+MIN_PART_SIZE = 5 * MiB
+MAX_PART_SIZE = 5 * 1024 * MiB
+MAX_PARTS = 10_000
+
+# error codes worth another attempt, anything else (AccessDenied, NoSuchUpload, ...) fails at once
+TRANSIENT_ERRORS = {"InternalError", "ServiceUnavailable", "SlowDown", "RequestTimeout", "BadDigest", "500", "502", "503", "504"}
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed S3 request is worth another attempt, connection errors always are"""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in TRANSIENT_ERRORS
+
+    return True
+
+
+def composite_etag(part_etags: list[str]) -> str:
+    """ETag S3 gives a multipart object: the MD5 of the part MD5s and the number of parts"""
+    digest = hashlib.md5(b"".join(bytes.fromhex(etag.strip('"')) for etag in part_etags))
+    return f'"{digest.hexdigest()}-{len(part_etags)}"'
+
+
+@dataclass
+class UploadResult:
+    etag: str
+    size: int
+    parts: int
+
+
+@dataclass
+class UploadPlan:
+    part_size: int
+    workers: int
+    queue_size: int
+
+    @property
+    def memory(self) -> int:
+        """Part buffers alive at once: uploading, queued, the one being submitted and the one being filled"""
+        return self.part_size * (self.workers + self.queue_size + 2)
+
+
+@dataclass
+class UploadProgress:
+    """State of a multipart upload, enough to resume it from another process"""
+    upload_id: str
+    part_size: int
+    # part number -> ETag of the completed parts
+    parts: dict[int, str] = field(default_factory=dict)
+
+    @property
+    def next_part(self) -> int:
+        """The first part not uploaded yet, a resumed stream starts with it"""
+        number = 1
+        while number in self.parts:
+            number += 1
+
+        return number
+
+    @property
+    def offset(self) -> int:
+        """Position in the stream of the first part not uploaded yet"""
+        return (self.next_part - 1) * self.part_size
+
+
+class MultipartUploader:
+    """Upload a stream of chunks as an S3 multipart upload.
+
+    The calling thread pulls the stream (and so runs the encryption) and cuts
+    it into parts, `workers` threads upload them. At most `workers` parts are
+    uploading and `queue_size` more wait for a worker, the stream is not pulled
+    further until one finishes. With the finished part waiting to be submitted
+    and the next one being filled, memory stays at (workers + queue_size + 2)
+    parts. A part failing with a transient error is retried with exponential
+    backoff, once it runs out of retries the whole upload is aborted.
+
+    Every part is sent with its Content-MD5 and its ETag checked against it,
+    the ETag of the completed object against the one the parts add up to.
+    A returned upload is complete and intact without asking S3 again.
+
+    With a `memory_budget` the part size and concurrency are planned per
+    upload from its size, so that memory never exceeds the budget.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        part_size: int = DEFAULT_PART_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = 1.0,
+        memory_budget: int = None,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"Invalid part size ({part_size}). Must be at least {MIN_PART_SIZE} bytes.")
+
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers ({workers}). Must be at least 1.")
+
+        if queue_size < 0:
+            raise ValueError(f"Invalid queue size ({queue_size}). Must not be negative.")
+
+        if memory_budget is not None and memory_budget < 3 * MIN_PART_SIZE:
+            raise ValueError(f"Invalid memory budget ({memory_budget}). Must be at least {3 * MIN_PART_SIZE} bytes.")
+
+        self.client = client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.backoff = backoff
+        self.memory_budget = memory_budget
+
+    def upload(
+        self,
+        key: str,
+        chunks: Iterable[bytes] | BinaryIO,
+        extra_args: dict = None,
+        size: int = None,
+        memory_budget: int = None,
+        progress: UploadProgress = None,
+        on_created: Callable[[UploadProgress], None] = None,
+        on_part: Callable[[int, str], None] = None,
+    ) -> UploadResult:
+        """Upload `chunks` to `key`, returns the ETag and size of the object.
+
+        `chunks` may also be a reader, each part is then read straight into
+        its own buffer with readinto.
+
+        `size` is an upper bound of the stream length, parts are made large
+        enough to stay within MAX_PARTS before anything is uploaded.
+        `memory_budget` overrides the one of the uploader for this upload.
+
+        To make an upload resumable, `on_created` receives its progress once
+        it is created and `on_part` every completed part, both are called in
+        the calling thread. Passing that `progress` back continues the upload,
+        `chunks` must then start at `progress.offset` of the same stream.
+        """
+        budget = memory_budget or self.memory_budget
+
+        if progress is None:
+            plan = self.plan(size, budget)
+            upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                **(extra_args or {}),
+            )["UploadId"]
+
+            progress = UploadProgress(upload_id, plan.part_size)
+            if on_created is not None:
+                on_created(progress)
+        else:
+            plan = self.plan(size, budget, part_size=progress.part_size)
+            logging.info(f"Resuming upload of {key} at part {progress.next_part}, {len(progress.parts)} parts done")
+
+        logging.info(
+            f"Uploading {key} in parts of {plan.part_size // MiB} MiB with {plan.workers} workers, "
+            f"up to {plan.memory // MiB} MiB of part buffers"
+        )
+
+        try:
+            parts, size = self._upload_parts(key, progress, chunks, plan, on_part)
+
+            response = self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=progress.upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            logging.exception(f"Aborting upload of {key}")
+            self.abort(key, progress.upload_id)
+            raise
+
+        etag = composite_etag([part["ETag"] for part in parts])
+        if response["ETag"] != etag:
+            raise ValueError(f"Upload of {key} completed with ETag {response['ETag']}, its parts add up to {etag}")
+
+        return UploadResult(etag, size, len(parts))
+
+    def abort(self, key: str, upload_id: str):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            # NoSuchUpload for an upload that expired, an error here must not hide the original one
+            logging.warning(f"Failed to abort upload {upload_id} of {key}: {e}")
+
+    def part_size_for(self, size: int = None) -> int:
+        """The configured part size, grown to whole MiB when `size` would need more than MAX_PARTS"""
+        if size is None:
+            return self.part_size
+
+        return max(self.part_size, self._smallest_part_size(size))
+
+    def plan(self, size: int = None, memory_budget: int = None, part_size: int = None) -> UploadPlan:
+        """Part size and concurrency for an upload of at most `size` bytes.
+
+        Without a budget these are the configured ones, with parts grown to
+        fit MAX_PARTS. With a budget, parts shrink so that all workers fit in
+        it, but not below the size MAX_PARTS needs (nor the configured size
+        when `size` is unknown); past that the workers and then the queue are
+        cut. Parts are never larger than the object and workers never
+        outnumber the parts. A given `part_size` (a resumed upload) is kept
+        as it is.
+        """
+        fixed = part_size is not None
+        if not fixed:
+            part_size = self.part_size_for(size)
+
+        if memory_budget is None:
+            return UploadPlan(part_size, self.workers, self.queue_size)
+
+        if not fixed:
+            smallest = part_size
+            if size is not None:
+                smallest = self._smallest_part_size(size)
+                # a part larger than the whole object only reserves memory
+                part_size = max(min(part_size, self._round_up(size)), smallest)
+
+            fitting = memory_budget // (self.workers + self.queue_size + 2) // MiB * MiB
+            part_size = min(max(fitting, smallest), part_size)
+
+        slots = memory_budget // part_size - 2
+        if slots < 1:
+            raise ValueError(f"Upload of {size} bytes does not fit a memory budget of {memory_budget} bytes")
+
+        workers = min(self.workers, slots)
+        if size is not None:
+            workers = min(workers, max(-(-size // part_size), 1))
+
+        return UploadPlan(part_size, workers, min(self.queue_size, slots - workers))
+
+    @classmethod
+    def _smallest_part_size(cls, size: int) -> int:
+        part_size = cls._round_up(-(-size // MAX_PARTS))
+        if part_size > MAX_PART_SIZE:
+            raise ValueError(f"Upload of {size} bytes does not fit in {MAX_PARTS} parts")
+
+        return part_size
+
+    @staticmethod
+    def _round_up(size: int) -> int:
+        return max(-(-size // MiB) * MiB, MIN_PART_SIZE)
+
+    def _upload_parts(
+        self,
+        key: str,
+        progress: UploadProgress,
+        chunks: Iterable[bytes] | BinaryIO,
+        plan: UploadPlan,
+        on_part: Callable[[int, str], None] = None,
+    ) -> tuple[list[dict], int]:
+        """Upload the parts of `chunks`, returns them for the completion and the size of the object"""
+        first = progress.next_part
+        parts = [{"PartNumber": number, "ETag": etag} for number, etag in progress.parts.items() if number < first]
+        # all parts but the last are full
+        size = resumed = (first - 1) * plan.part_size
+        pending = set()
+
+        def collect(futures):
+            for future in futures:
+                part = future.result()
+                parts.append(part)
+                if on_part is not None:
+                    on_part(part["PartNumber"], part["ETag"])
+
+        with ThreadPoolExecutor(plan.workers, thread_name_prefix="upload") as executor:
+            try:
+                # an empty stream still needs its one empty part, a resumed one is complete
+                for number, body in enumerate(self._parts(chunks, plan.part_size, empty=first == 1), start=first):
+                    # only reachable without a size hint or when the hint was too small
+                    if number > MAX_PARTS:
+                        raise ValueError(f"Upload of {key} needs more than {MAX_PARTS} parts of {plan.part_size} bytes")
+
+                    size += len(body)
+
+                    # completed out of order by an earlier attempt
+                    if number in progress.parts:
+                        parts.append({"PartNumber": number, "ETag": progress.parts[number]})
+                        continue
+
+                    pending.add(executor.submit(self._upload_part, key, progress.upload_id, number, body))
+
+                    if len(pending) >= plan.workers + plan.queue_size:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+                done, pending = wait(pending)
+                collect(done)
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        if first > 1 and size == resumed:
+            # killed after its last part, only S3 knows how long that one was
+            size = self._uploaded_size(key, progress.upload_id)
+
+        return sorted(parts, key=lambda part: part["PartNumber"]), size
+
+    def _uploaded_size(self, key: str, upload_id: str) -> int:
+        size, marker = 0, 0
+
+        while True:
+            response = self.client.list_parts(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+            size += sum(part["Size"] for part in response.get("Parts", []))
+
+            if not response.get("IsTruncated"):
+                return size
+
+            marker = response["NextPartNumberMarker"]
+
+    def _parts(self, chunks: Iterable[bytes] | BinaryIO, part_size: int, empty: bool = True):
+        if hasattr(chunks, "readinto"):
+            yield from self._read_parts(chunks, part_size, empty)
+            return
+
+        segmenter = Segmenter(part_size)
+        count = 0
+
+        for chunk in chunks:
+            for part, _ in segmenter.feed(chunk):
+                count += 1
+                yield part
+
+        part, _ = segmenter.finish()
+        # an empty last part is only needed for an empty stream
+        if part or (empty and not count):
+            yield part
+
+    @staticmethod
+    def _read_parts(reader: BinaryIO, part_size: int, empty: bool = True):
+        for number in itertools.count():
+            part = bytearray(part_size)
+            count = read_into(reader, memoryview(part))
+
+            if count == part_size:
+                yield part
+                continue
+
+            # an empty last part is only needed for an empty stream
+            if count or (empty and not number):
+                yield part[:count]
+
+            return
+
+    def _upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> dict:
+        digest = hashlib.md5(body)
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                    # S3 rejects a part that arrives corrupted (BadDigest)
+                    ContentMD5=base64.b64encode(digest.digest()).decode(),
+                )
+
+                if response["ETag"].strip('"') != digest.hexdigest():
+                    raise ValueError(f"ETag {response['ETag']} of part {number} of {key} does not match its MD5")
+
+                return {"PartNumber": number, "ETag": response["ETag"]}
+            except (ClientError, ConnectionError, HTTPClientError) as e:
+                if attempt == self.retries or not is_transient(e):
+                    raise
+
+                delay = self.backoff * 2 ** attempt
+                logging.warning(f"Upload of part {number} of {key} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
@@ -1,5 +1,104 @@
+import time
+import asyncio
 import hashlib
+import resource
+import threading
+from concurrent.futures import Executor
+from typing import AsyncGenerator, BinaryIO, Callable, Iterable
+
+# below this many bytes a thread hop costs more than the work itself
+OFFLOAD_THRESHOLD = 64 * 1024
 
 
 def hash_string(string: str):
-    return hashlib.sha256(string.encode()).hexdigest()
\ No newline at end of file
+    return hashlib.sha256(string.encode()).hexdigest()
+
+
+def read_into(file: BinaryIO, view: memoryview) -> int:
+    """Fill `view` from `file`, returning less than len(view) bytes only at EOF"""
+    total = 0
+
+    while total < len(view):
+        if hasattr(file, "readinto"):
+            count = file.readinto(view[total:])
+        else:
+            data = file.read(len(view) - total)
+            count = len(data)
+            view[total:total + count] = data
+
+        if not count:
+            break
+
+        total += count
+
+    return total
+
+
+def write_all(file: BinaryIO, data) -> int:
+    """Write all of `data` to `file`, looping on short writes; writers returning None wrote everything"""
+    view = memoryview(data)
+
+    while view:
+        written = file.write(view)
+        if written is None:
+            break
+
+        view = view[written:]
+
+    return len(data)
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def offload(executor: Executor, size: int, func: Callable, *args):
+    """Run `func` in `executor` when it processes at least OFFLOAD_THRESHOLD bytes"""
+    if size < OFFLOAD_THRESHOLD:
+        return func(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def aiterate(iterable: Iterable, executor: Executor = None) -> AsyncGenerator:
+    """Pull a blocking iterable in `executor` one item at a time, closing it when the consumer stops"""
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    done = object()
+
+    try:
+        while (item := await loop.run_in_executor(executor, next, iterator, done)) is not done:
+            yield item
+    finally:
+        if hasattr(iterator, "close"):
+            await loop.run_in_executor(executor, iterator.close)
+
+
+class RateLimiter:
+    """Throttle the combined throughput of all threads to `rate` bytes per second"""
+
+    def __init__(self, rate: float, clock: Callable = time.monotonic, sleep: Callable = time.sleep):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive: {rate}")
+
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = clock()
+
+    def acquire(self, size: int):
+        with self._lock:
+            now = self._clock()
+            start = max(self._next, now)
+            self._next = start + size / self.rate
+
+        if start > now:
+            self._sleep(start - now)
+
+    def throttle(self, chunks: Iterable[bytes]):
+        for chunk in chunks:
+            self.acquire(len(chunk))
+            yield chunk
@@ -0,0 +1,117 @@
+import math
+import time
+import random
+import logging
+import asyncio
+import argparse
+from collections import Counter
+from datetime import timedelta
+
+import ytarchive_lib.notify as notify
+from ytarchive_lib.config import load_config
+from ytarchive_lib.data_manager import DataManager, Verification
+from ytarchive_lib.utils import RateLimiter
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_AGE_DAYS = 30
+# leave room for the running verifications inside the 10 minute job timeout
+DEFAULT_TIME_LIMIT = 6 * 60
+
+
+async def verify_object(data_manager, key: str, limiter: RateLimiter = None) -> Verification:
+    try:
+        size = await data_manager.averify_object(key, limiter)
+    except Exception as e:
+        logging.exception(f"Verification of {key} failed")
+        verification = Verification(key=key, ok=False, error=f"{type(e).__name__}: {e}")
+    else:
+        verification = Verification(key=key, ok=True, size=size)
+
+    await data_manager.add_verification(verification)
+    return verification
+
+
+async def amain(
+    workers: int = DEFAULT_WORKERS,
+    sample: float = 1.0,
+    rate: float = None,
+    max_age: timedelta = timedelta(days=DEFAULT_MAX_AGE_DAYS),
+    time_limit: float = DEFAULT_TIME_LIMIT,
+):
+    config = load_config()
+    deadline = time.monotonic() + time_limit
+    limiter = RateLimiter(rate) if rate else None
+
+    async with await DataManager.create(config) as data_manager:
+        # the daily run also cleans up uploads that the download job never resumed
+        aborted = await data_manager.abort_stale_uploads()
+        if aborted:
+            logging.info(f"Aborted {aborted} stale uploads")
+
+        verified = await data_manager.get_verified_keys(max_age)
+        # the daily LIST of the bucket refreshes the inventory the other jobs query
+        await data_manager.sync_archive_objects()
+        objects = await data_manager.get_archive_objects()
+
+        stats = Counter()
+        keys = []
+        for obj in objects:
+            if obj.key in verified:
+                stats["recent"] += 1
+            elif obj.storage_class == "GLACIER":
+                stats["glacier"] += 1
+            else:
+                keys.append(obj.key)
+
+        keys = random.sample(keys, math.ceil(len(keys) * sample))
+        logging.info(f"Verifying {len(keys)} of {len(objects)} objects")
+
+        semaphore = asyncio.Semaphore(workers)
+        failed = []
+        started = time.monotonic()
+
+        async def worker(key):
+            async with semaphore:
+                if time.monotonic() > deadline:
+                    stats["skipped"] += 1
+                    return
+
+                verification = await verify_object(data_manager, key, limiter)
+                if verification.ok:
+                    stats["ok"] += 1
+                    stats["bytes"] += verification.size
+                else:
+                    stats["failed"] += 1
+                    failed.append(verification)
+
+        await asyncio.gather(*[worker(key) for key in keys])
+
+        elapsed = time.monotonic() - started
+        logging.info(f"Verification finished in {elapsed:.1f}s, {stats['bytes'] / max(elapsed, 1e-9) / 1e6:.1f} MB/s: {dict(stats)}")
+
+    if failed:
+        message = "\n".join(f"Verification failed: {v.key}: {v.error}" for v in failed)
+        notify.send_message(message, config)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that archive objects decrypt and authenticate')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Objects verified concurrently')
+    parser.add_argument('--sample', type=float, default=1.0, help='Fraction of the unverified objects to check')
+    parser.add_argument('--rate', type=float, default=None, help='Download limit in MB/s shared by all workers')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_DAYS, help='Days before a verified object is checked again')
+    parser.add_argument('--time-limit', type=float, default=DEFAULT_TIME_LIMIT, help='Seconds after which no new objects are started')
+
+    args = parser.parse_args()
+    if not 0 < args.sample <= 1:
+        parser.error("--sample must be in (0, 1]")
+
+    asyncio.run(amain(
+        workers=args.workers,
+        sample=args.sample,
+        rate=args.rate * 1e6 if args.rate else None,
+        max_age=timedelta(days=args.max_age),
+        time_limit=args.time_limit,
+    ))
@@ -111,7 +111,7 @@ async def clear_warnings(args):
     logging.info(f"Found {len(to_clear)} warnings marked for clearing")
     print(f"\nFound {len(to_clear)} warnings marked for clearing:")
 
-    async with await DataManager.create(config) as data_manager:
+    async with await DataManager.create(config) as data_manager, data_manager.transaction():
         cleared_count = 0
         for warning in to_clear:
             provider = warning['provider']
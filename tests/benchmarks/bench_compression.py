@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import random
+import zipfile
+import argparse
+import tempfile
+from pathlib import Path
+from ytarchive_lib.crypt_v2 import Crypt
+
+MiB = 1024 * 1024
+KEY = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
+
+# (name, zip method, zstd level, zstd threads)
+CONFIGS = [
+    ("deflate", zipfile.ZIP_DEFLATED, None, 0),
+    ("stored", zipfile.ZIP_STORED, None, 0),
+    ("stored+zstd1", zipfile.ZIP_STORED, 1, 0),
+    ("stored+zstd3", zipfile.ZIP_STORED, 3, 0),
+    ("stored+zstd3 t2", zipfile.ZIP_STORED, 3, 2),
+    ("stored+zstd9", zipfile.ZIP_STORED, 9, 0),
+    ("deflate+zstd3", zipfile.ZIP_DEFLATED, 3, 0),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CPU time against uploaded bytes for the archive compression options")
+
+    parser.add_argument("--dir", type=Path, default=None, help="Downloaded item to archive, a synthetic one is generated by default")
+    parser.add_argument("--media-size", type=int, default=64, help="Size of the synthetic media file in MiB")
+    parser.add_argument("--filter", default="", help="Only run configs containing this string")
+
+    return parser.parse_args()
+
+
+def words(rng, count):
+    vocabulary = ["the", "video", "channel", "music", "game", "review", "today", "about", "this", "and",
+                  "subscribe", "world", "new", "best", "how", "to", "make", "first", "time", "live"]
+    return " ".join(rng.choice(vocabulary) for _ in range(count))
+
+
+def make_item(path: Path, media_size: int):
+    """A yt-dlp download: already compressed media plus its text side files"""
+    rng = random.Random(0)
+
+    (path / "Video [abc].webm").write_bytes(os.urandom(media_size * MiB))
+    (path / "Video [abc].webp").write_bytes(os.urandom(100 * 1024))
+    (path / "Video [abc].description").write_text(words(rng, 300))
+
+    info = {
+        "id": "abc",
+        "title": words(rng, 8),
+        "description": words(rng, 300),
+        "formats": [
+            {
+                "format_id": str(i),
+                "url": f"https://rr{i}.googlevideo.com/videoplayback?expire=1700000000&id={rng.getrandbits(64):x}&itag={i}&source=youtube",
+                "ext": rng.choice(["mp4", "webm", "m4a"]),
+                "filesize": rng.randrange(MiB, 100 * MiB),
+                "http_headers": {"User-Agent": "Mozilla/5.0", "Accept": "text/html"},
+                "fragments": [{"url": f"sq/{j}", "duration": 5.0} for j in range(50)],
+            }
+            for i in range(100)
+        ],
+        "subtitles": {lang: [{"ext": "vtt", "url": f"https://www.youtube.com/api/timedtext?lang={lang}"}] for lang in ["en", "de", "fr", "ja"]},
+    }
+    (path / "Video [abc].info.json").write_text(json.dumps(info))
+
+    for lang in ["en", "de", "fr", "ja"]:
+        cues = "\n\n".join(
+            f"00:{i // 60 % 60:02}:{i % 60:02}.000 --> 00:{i // 60 % 60:02}:{i % 60:02}.900\n{words(rng, 8)}"
+            for i in range(3000)
+        )
+        (path / f"Video [abc].{lang}.vtt").write_text(f"WEBVTT\n\n{cues}")
+
+
+def archive(src: Path, dst: Path, method):
+    with zipfile.ZipFile(dst, "w", method) as zip_file:
+        for file in sorted(src.iterdir()):
+            zip_file.write(file, file.name)
+
+
+def cpu_time():
+    # includes the zstd worker threads
+    return time.process_time()
+
+
+def measure(src: Path, tmp: Path, method, level, threads):
+    archive_path = tmp / "archive.zip"
+
+    cpu, wall = cpu_time(), time.perf_counter()
+
+    archive(src, archive_path, method)
+
+    crypt = Crypt(KEY, compression_level=level, compression_threads=threads)
+    uploaded = 0
+    with open(archive_path, "rb") as f:
+        for chunk in crypt.encrypt(iter(lambda: f.read(MiB), b"")):
+            uploaded += len(chunk)
+
+    return cpu_time() - cpu, time.perf_counter() - wall, uploaded
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+
+        src = args.dir
+        if src is None:
+            src = tmp / "item"
+            src.mkdir()
+            make_item(src, args.media_size)
+
+        total = sum(file.stat().st_size for file in src.iterdir())
+        text = sum(file.stat().st_size for file in src.iterdir() if file.suffix in (".json", ".vtt", ".description"))
+        print(f"cpus: {os.cpu_count()}, item: {total / MiB:.1f} MiB, text: {text / MiB:.1f} MiB")
+        print(f"{'config':>16} {'cpu s':>8} {'wall s':>8} {'uploaded MiB':>13} {'ratio':>7}")
+
+        for name, method, level, threads in CONFIGS:
+            if args.filter not in name:
+                continue
+
+            cpu, wall, uploaded = measure(src, tmp, method, level, threads)
+            print(f"{name:>16} {cpu:>8.2f} {wall:>8.2f} {uploaded / MiB:>13.2f} {uploaded / total:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
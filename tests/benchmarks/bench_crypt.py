@@ -0,0 +1,188 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from ytarchive_lib import crypt, crypt_v2
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+MiB = 1024 * 1024
+KEY = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
+IV = bytes.fromhex("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crypto throughput and memory benchmarks, compared against a stored baseline")
+
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="Baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--repeat", type=int, default=3, help="Minimum timed runs per case, the best one counts")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Keep repeating a case for at least this many seconds")
+    parser.add_argument("--filter", default="", help="Only run cases containing this string")
+
+    return parser.parse_args()
+
+
+def cases():
+    for module in ["crypt", "crypt_v2"]:
+        for op in ["encrypt", "decrypt"]:
+            for payload in [4 * MiB, 64 * MiB]:
+                for chunk in [1024, MiB]:
+                    yield dict(module=module, api="gen", op=op, payload=payload, chunk=chunk)
+
+                yield dict(module=module, api="into", op=op, payload=payload, chunk=None)
+
+
+def case_name(case):
+    chunk = f"{case['chunk'] // 1024}k" if case["chunk"] else "buffered"
+    return f"{case['module']}.{case['api']}.{case['op']}.{case['payload'] // MiB}M.{chunk}"
+
+
+class NullWriter:
+    def write(self, data):
+        return len(data)
+
+
+def setup(case):
+    cryptor = crypt.Crypt(KEY, IV) if case["module"] == "crypt" else crypt_v2.Crypt(KEY)
+
+    data = os.urandom(case["payload"])
+    if case["op"] == "decrypt":
+        data = b"".join(cryptor.encrypt([data]))
+
+    if case["api"] == "gen":
+        chunks = [data[i:i + case["chunk"]] for i in range(0, len(data), case["chunk"])]
+        process = cryptor.encrypt if case["op"] == "encrypt" else cryptor.decrypt
+
+        def run():
+            for _ in process(chunks):
+                pass
+    else:
+        process = cryptor.encrypt_into if case["op"] == "encrypt" else cryptor.decrypt_into
+
+        def run():
+            process(io.BytesIO(data), NullWriter())
+
+    return run
+
+
+def proc_status(field):
+    # kilobytes, e.g. "VmHWM:     1234 kB"
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+
+
+def reset_peak_rss():
+    """Current RSS after resetting the peak, so setup memory (payload, chunks) is not counted.
+
+    ru_maxrss cannot be reset: setup already pushed it above anything the
+    cases allocate, which left rss_peak at 0 for most of them. Linux resets
+    VmHWM to the current RSS on a write of 5 to clear_refs.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError as e:
+        raise RuntimeError("Measuring peak RSS needs a writable /proc/self/clear_refs (Linux)") from e
+
+    return proc_status("VmRSS")
+
+
+def peak_rss():
+    return proc_status("VmHWM")
+
+
+def run_case(case, repeat, min_time):
+    run = setup(case)
+
+    rss_before = reset_peak_rss()
+
+    times = []
+    while len(times) < repeat or sum(times) < min_time:
+        times.append(timed(run))
+    best = min(times)
+
+    rss_peak = peak_rss() - rss_before
+
+    tracemalloc.start()
+    run()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mb_per_s": round(case["payload"] / 1e6 / best, 1),
+        "alloc_peak": alloc_peak,
+        "rss_peak": rss_peak,
+    }
+
+
+def timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def compare(name, result, baseline, tolerance):
+    problems = []
+
+    if result["mb_per_s"] < baseline["mb_per_s"] * (1 - tolerance):
+        problems.append(f"throughput {result['mb_per_s']} MB/s < baseline {baseline['mb_per_s']} MB/s")
+
+    for key in ["alloc_peak", "rss_peak"]:
+        # 1 MiB of slack keeps tiny numbers from flapping
+        if result[key] > baseline[key] * (1 + tolerance) + MiB:
+            problems.append(f"{key} {result[key]} B > baseline {baseline[key]} B")
+
+    return [f"{name}: {problem}" for problem in problems]
+
+
+def main():
+    args = parse_args()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    results = {}
+    problems = []
+
+    print(f"{'case':<40} {'MB/s':>9} {'alloc peak':>12} {'rss peak':>12} {'baseline MB/s':>14}")
+
+    for case in cases():
+        name = case_name(case)
+        if args.filter not in name:
+            continue
+
+        # a fresh process per case keeps peak RSS separate
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(run_case, case, args.repeat, args.min_time).result()
+
+        results[name] = result
+
+        reference = baseline.get(name)
+        print(f"{name:<40} {result['mb_per_s']:>9} {result['alloc_peak']:>12} {result['rss_peak']:>12} {reference['mb_per_s'] if reference else '-':>14}")
+
+        if reference and not args.update_baseline:
+            problems += compare(name, result, reference, args.tolerance)
+
+    if args.update_baseline:
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import time
+import argparse
+from ytarchive_lib.crypt_v2 import Crypt
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure crypt_v2 throughput against the number of workers")
+
+    parser.add_argument("--size", type=int, default=256, help="Payload size in MiB")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="Input chunk size in bytes")
+    parser.add_argument("--segment-size", type=int, default=1024 * 1024, help="V3 segment size in bytes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to measure")
+
+    return parser.parse_args()
+
+
+def chunks(data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def measure(func):
+    start = time.perf_counter()
+    for _ in func():
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+
+    key = os.urandom(32)
+    data = os.urandom(args.size * 1024 * 1024)
+    encrypted = b"".join(Crypt(key, args.segment_size).encrypt(chunks(data, args.chunk_size)))
+
+    print(f"cpus: {os.cpu_count()}, payload: {args.size} MiB, segment: {args.segment_size} B, chunk: {args.chunk_size} B")
+    print(f"{'workers':>8} {'encrypt MB/s':>14} {'decrypt MB/s':>14}")
+
+    for workers in args.workers:
+        crypt = Crypt(key, args.segment_size, workers=workers)
+
+        encrypt_time = measure(lambda: crypt.encrypt(chunks(data, args.chunk_size)))
+        decrypt_time = measure(lambda: crypt.decrypt(chunks(encrypted, args.chunk_size)))
+
+        mb = len(data) / 1e6
+        print(f"{workers:>8} {mb / encrypt_time:>14.1f} {mb / decrypt_time:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import time
+import argparse
+from ytarchive_lib.crypt_v2 import Crypt
+
+CHUNK_SIZES = [1, 16, 1024, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure crypt_v2 prefix/suffix splitting cost per chunk size")
+
+    parser.add_argument("--size", type=int, default=64, help="Payload size in MiB")
+    parser.add_argument("--max-chunks", type=int, default=200_000, help="Cap on chunks per run, shrinks the payload for tiny chunks")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=CHUNK_SIZES, help="Chunk sizes in bytes")
+
+    return parser.parse_args()
+
+
+def measure(func):
+    start = time.perf_counter()
+    for _ in func():
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+
+    crypt = Crypt(os.urandom(32))
+    payload = os.urandom(args.size * 1024 * 1024)
+
+    print(f"{'chunk B':>10} {'chunks':>9} {'ns/chunk':>10} {'suffix MB/s':>12} {'prefix MB/s':>12}")
+
+    for chunk_size in args.chunk_sizes:
+        data = payload[:min(len(payload), chunk_size * args.max_chunks)]
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+        suffix_time = measure(lambda: crypt._get_suffix(16, chunks).rest)
+        prefix_time = measure(lambda: crypt._get_prefix(16, chunks)[1])
+
+        mb = len(data) / 1e6
+        print(f"{chunk_size:>10} {len(chunks):>9} {suffix_time / len(chunks) * 1e9:>10.0f} {mb / suffix_time:>12.1f} {mb / prefix_time:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+import argparse
+from ytarchive_lib.db import DB
+from ytarchive_lib.data_manager import DataManager, SrcItem
+
+# rows of the benchmark, removed before and after every run
+PROVIDER = "bench"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latency of the per-item statements: text against prepared, waited for against pipelined")
+
+    parser.add_argument("--db", default=os.environ.get("TESTS_DB_ACCESS"), help="Connection string of a scratch database, TESTS_DB_ACCESS by default")
+    parser.add_argument("--items", type=int, default=1000, help="Items written per run")
+
+    return parser.parse_args()
+
+
+def make_items(count: int) -> list[SrcItem]:
+    return [
+        SrcItem(PROVIDER, f"video{i}", f"https://youtu.be/video{i}", "title", "channel", "channel_id", "channel_url", 60)
+        for i in range(count)
+    ]
+
+
+async def write(data_manager, items):
+    # what download_app and migrate_app run for every item
+    for item in items:
+        await data_manager.add_src_item(item)
+        await data_manager.mark_as_done(item.provider, item.id)
+
+
+async def per_call(data_manager, items):
+    await write(data_manager, items)
+
+
+async def transaction(data_manager, items):
+    async with data_manager.transaction():
+        await write(data_manager, items)
+
+
+async def pipelined_transaction(data_manager, items):
+    # mark_as_done has no result to wait for, add_src_item returns whether it inserted
+    async with data_manager.transaction(pipeline=True):
+        for item in items:
+            await data_manager.mark_as_done(item.provider, item.id)
+
+
+PATHS = [
+    ("per call", per_call),
+    ("1 tx", transaction),
+    ("1 tx, pipeline", pipelined_transaction),
+]
+
+
+async def clean(data_manager):
+    async with data_manager.db.connection() as connection:
+        await connection.execute("DELETE FROM src_items WHERE provider = %s", (PROVIDER,))
+
+
+async def run(args, prepare: bool):
+    # only the database side of DataManager is needed
+    data_manager = DataManager()
+    data_manager.db = await DB.create(args.db, min_size=1, max_size=1, prepare=prepare)
+
+    async with data_manager.db:
+        await data_manager._init()
+        items = make_items(args.items)
+
+        for name, path in PATHS:
+            await clean(data_manager)
+            if path is pipelined_transaction:
+                # only the updates are pipelined, the rows exist already
+                await data_manager.add_src_items_bulk(items)
+
+            statements = args.items * (1 if path is pipelined_transaction else 2)
+            started = time.perf_counter()
+
+            await path(data_manager, items)
+
+            wall = time.perf_counter() - started
+            print(f"{'prepared' if prepare else 'text':>9} {name:>16} {statements:>10} {wall:>8.2f} {wall / statements * 1e6:>12.0f}")
+
+        await clean(data_manager)
+
+
+async def amain():
+    args = parse_args()
+    if not args.db:
+        raise SystemExit("--db or TESTS_DB_ACCESS is required")
+
+    print(f"{'':>9} {'path':>16} {'statements':>10} {'wall s':>8} {'us/statement':>12}")
+
+    for prepare in (False, True):
+        await run(args, prepare)
+
+
+if __name__ == "__main__":
+    asyncio.run(amain())
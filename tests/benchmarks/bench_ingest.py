@@ -0,0 +1,99 @@
+import os
+import time
+import asyncio
+import argparse
+from ytarchive_lib.db import DB
+from ytarchive_lib.data_manager import DataManager, SrcItem, Warning
+
+# rows of the benchmark, removed before and after every run
+PROVIDER = "bench"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Commits and time of ingesting a playlist into src_items and warnings")
+
+    parser.add_argument("--db", default=os.environ.get("TESTS_DB_ACCESS"), help="Connection string of a scratch database, TESTS_DB_ACCESS by default")
+    parser.add_argument("--items", type=int, default=2000, help="Entries in the playlist")
+
+    return parser.parse_args()
+
+
+def make_playlist(count: int) -> list[tuple[SrcItem, Warning | None]]:
+    entries = []
+
+    for i in range(count):
+        item = SrcItem(PROVIDER, f"video{i}", f"https://youtu.be/video{i}", "title", "channel", "channel_id", "channel_url", 60)
+
+        warning = None
+        # about as often as in the real playlist
+        if i % 10 == 0:
+            item.state = SrcItem.State.WARNING
+            warning = Warning(PROVIDER, item.id, "too_long", "Item duration is too long")
+
+        entries.append((item, warning))
+
+    return entries
+
+
+async def per_item(data_manager, entries):
+    # playlist_app before the bulk path: an INSERT and a commit per row
+    for item, warning in entries:
+        if await data_manager.add_src_item(item) and warning:
+            await data_manager.add_warning(warning)
+
+
+async def per_item_transaction(data_manager, entries):
+    async with data_manager.transaction():
+        await per_item(data_manager, entries)
+
+
+async def bulk_transaction(data_manager, entries):
+    # playlist_app now
+    async with data_manager.transaction():
+        added = await data_manager.add_src_items_bulk([item for item, _ in entries])
+        await data_manager.add_warnings_bulk([warning for item, warning in entries if warning and (item.provider, item.id) in added])
+
+
+PATHS = [
+    ("per item", per_item),
+    ("per item, 1 tx", per_item_transaction),
+    ("bulk, 1 tx", bulk_transaction),
+]
+
+
+async def clean(data_manager):
+    async with data_manager.db.connection() as connection:
+        await connection.execute("DELETE FROM warnings WHERE provider = %s", (PROVIDER,))
+        await connection.execute("DELETE FROM src_items WHERE provider = %s", (PROVIDER,))
+
+
+async def amain():
+    args = parse_args()
+    if not args.db:
+        raise SystemExit("--db or TESTS_DB_ACCESS is required")
+
+    # only the database side of DataManager is needed
+    data_manager = DataManager()
+    data_manager.db = await DB.create(args.db)
+
+    async with data_manager.db:
+        await data_manager._init()
+        entries = make_playlist(args.items)
+
+        print(f"playlist: {args.items} entries")
+        print(f"{'path':>16} {'commits':>8} {'wall s':>8} {'rows/s':>8}")
+
+        for name, path in PATHS:
+            await clean(data_manager)
+            commits, started = data_manager.db.commits, time.perf_counter()
+
+            await path(data_manager, entries)
+
+            wall = time.perf_counter() - started
+            print(f"{name:>16} {data_manager.db.commits - commits:>8} {wall:>8.2f} {args.items / wall:>8.0f}")
+
+        await clean(data_manager)
+
+
+if __name__ == "__main__":
+    asyncio.run(amain())
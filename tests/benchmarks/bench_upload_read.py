@@ -0,0 +1,68 @@
+import os
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from ytarchive_lib.crypt_v2 import Crypt
+from ytarchive_lib.uploader import MultipartUploader
+
+MiB = 1024 * 1024
+KEY = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reading an archive into encrypted upload parts: chunk generator against readinto")
+
+    parser.add_argument("--size", type=int, default=256, help="Size of the archive in MiB")
+    parser.add_argument("--part-size", type=int, default=32, help="Part size in MiB")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per path, the best one counts")
+
+    return parser.parse_args()
+
+
+def chunks_path(crypt, f, read_size):
+    # the path upload_file took before: read loop, encrypt generator, parts joined by the Segmenter
+    return crypt.encrypt(iter(lambda: f.read(read_size), b""))
+
+
+def reader_path(crypt, f):
+    return crypt.encrypt_reader(f)
+
+
+PATHS = [
+    ("chunks 1k", lambda crypt, f: chunks_path(crypt, f, 1024)),
+    ("chunks 1M", lambda crypt, f: chunks_path(crypt, f, MiB)),
+    ("reader", reader_path),
+]
+
+
+def measure(path: Path, uploader: MultipartUploader, source, part_size: int):
+    crypt = Crypt(KEY)
+
+    cpu, wall = time.process_time(), time.perf_counter()
+
+    with open(path, "rb") as f:
+        for _ in uploader._parts(source(crypt, f), part_size):
+            pass
+
+    return time.process_time() - cpu, time.perf_counter() - wall
+
+
+def main():
+    args = parse_args()
+    uploader = MultipartUploader(None, "bucket")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "archive.zip"
+        path.write_bytes(os.urandom(args.size * MiB))
+
+        print(f"archive: {args.size} MiB, parts: {args.part_size} MiB")
+        print(f"{'path':>10} {'cpu s':>8} {'wall s':>8} {'MB/s':>8}")
+
+        for name, source in PATHS:
+            cpu, wall = min(measure(path, uploader, source, args.part_size * MiB) for _ in range(args.repeat))
+            print(f"{name:>10} {cpu:>8.2f} {wall:>8.2f} {args.size * MiB / 1e6 / wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
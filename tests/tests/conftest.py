@@ -77,7 +77,7 @@ def delete_all(data_manager):
 async def delete_all_db(data_manager):
     assert "main" not in os.environ["DB_ACCESS"]
 
-    async with data_manager.db.connection.cursor() as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor() as cursor:
         # Get all tables in public schema
         await cursor.execute("""
             SELECT table_name
@@ -98,7 +98,7 @@ async def delete_all_db(data_manager):
             deleted_count = cursor.rowcount
             logging.info(f"deleted {deleted_count} rows from {table_name}")
 
-        await data_manager.db.connection.commit()
+        await connection.commit()
         logging.info("database cleaned")
 
 
@@ -144,7 +144,7 @@ async def check_items(data_manager, expected):
 
 
 async def check_warnings(data_manager, expected):
-    async with data_manager.db.connection.cursor(row_factory=dict_row) as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
         await cursor.execute("""
             SELECT provider, id, warning_id, message, state
             FROM warnings
@@ -184,7 +184,7 @@ async def print_db(data_manager):
 
     logging.info("database contents:")
 
-    async with data_manager.db.connection.cursor() as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor() as cursor:
         await cursor.execute("""
             SELECT table_name
             FROM information_schema.tables
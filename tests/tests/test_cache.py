@@ -0,0 +1,114 @@
+import os
+import pytest
+from ytarchive_lib.cache import DownloadCache, PARTIAL_PREFIX
+
+KEY = "archive/0123abcd"
+
+
+def chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def put(cache, key, etag, data):
+    assert b"".join(cache.put(key, etag, chunks(data, 100))) == data
+
+
+def entries(cache):
+    return sorted(path.name for path in cache.directory.iterdir())
+
+
+def test_miss_then_hit(tmp_path):
+    cache = DownloadCache(tmp_path, 10_000)
+    data = os.urandom(1000)
+
+    assert cache.get(KEY, '"etag"') is None
+    put(cache, KEY, '"etag"', data)
+
+    assert b"".join(cache.get(KEY, '"etag"')) == data
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert entries(cache) == ["0123abcd.etag"]
+
+
+def test_other_etag_is_a_miss(tmp_path):
+    cache = DownloadCache(tmp_path, 10_000)
+    put(cache, KEY, '"old"', b"old object")
+
+    assert cache.get(KEY, '"new"') is None
+
+    put(cache, KEY, '"new"', b"new object")
+
+    # the replaced version is dropped
+    assert entries(cache) == ["0123abcd.new"]
+    assert b"".join(cache.get(KEY, '"new"')) == b"new object"
+
+
+def test_incomplete_download_is_not_cached(tmp_path):
+    cache = DownloadCache(tmp_path, 10_000)
+
+    passed = cache.put(KEY, '"etag"', chunks(bytes(1000), 100))
+    next(passed)
+    passed.close()
+
+    assert entries(cache) == []
+
+
+def test_failed_download_is_not_cached(tmp_path):
+    cache = DownloadCache(tmp_path, 10_000)
+
+    def failing():
+        yield b"data"
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        b"".join(cache.put(KEY, '"etag"', failing()))
+
+    assert entries(cache) == []
+
+
+def test_entry_larger_than_the_cache(tmp_path):
+    cache = DownloadCache(tmp_path, 500)
+
+    put(cache, KEY, '"etag"', bytes(1000))
+
+    assert entries(cache) == []
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DownloadCache(tmp_path, 2500)
+
+    for i, name in enumerate(["a", "b"]):
+        put(cache, f"archive/{name}", '"etag"', bytes(1000))
+        os.utime(tmp_path / f"{name}.etag", (i, i))
+
+    # reading a makes b the least recently used
+    b"".join(cache.get("archive/a", '"etag"'))
+    put(cache, "archive/c", '"etag"', bytes(1000))
+
+    assert entries(cache) == ["a.etag", "c.etag"]
+
+
+def test_evicted_entry_stays_readable(tmp_path):
+    cache = DownloadCache(tmp_path, 1000)
+    data = os.urandom(1000)
+    put(cache, KEY, '"etag"', data)
+
+    reading = cache.get(KEY, '"etag"')
+    put(cache, "archive/other", '"etag"', bytes(1000))
+
+    assert entries(cache) == ["other.etag"]
+    assert b"".join(reading) == data
+
+
+def test_partial_files_are_not_evicted(tmp_path):
+    cache = DownloadCache(tmp_path, 1000)
+    (tmp_path / f"{PARTIAL_PREFIX}other").write_bytes(bytes(5000))
+
+    put(cache, KEY, '"etag"', bytes(1000))
+
+    assert entries(cache) == [f"{PARTIAL_PREFIX}other", "0123abcd.etag"]
+
+
+def test_invalid_size(tmp_path):
+    with pytest.raises(ValueError, match="cache size"):
+        DownloadCache(tmp_path, -1)
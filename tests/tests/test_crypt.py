@@ -1,4 +1,5 @@
 import pytest
+import io
 from ytarchive_lib.crypt import Crypt
 
 
@@ -6,14 +7,17 @@ from ytarchive_lib.crypt import Crypt
 def test_key():
     return bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
 
+
 @pytest.fixture
 def test_iv():
     return bytes.fromhex("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
 
+
 @pytest.fixture
 def crypt(test_key, test_iv):
     return Crypt(test_key, test_iv)
 
+
 def test_encrypt_decrypt_roundtrip(crypt):
     original_data = b"Hello, World! This is a test message."
 
@@ -25,6 +29,7 @@ def test_encrypt_decrypt_roundtrip(crypt):
 
     assert decrypted_data == original_data
 
+
 def test_encrypt_same_result_different_chunk_sizes(crypt):
     original_data = b"This is a test message that will be split into different chunk sizes to verify encryption consistency."
 
@@ -42,6 +47,7 @@ def test_encrypt_same_result_different_chunk_sizes(crypt):
     assert encrypted_single == encrypted_medium_chunks
     assert encrypted_small_chunks == encrypted_medium_chunks
 
+
 def test_encrypt_decrypt_multiple_chunks(crypt):
     original_chunks = [b"First chunk", b"Second chunk", b"Third chunk"]
     original_data = b"".join(original_chunks)
@@ -54,6 +60,7 @@ def test_encrypt_decrypt_multiple_chunks(crypt):
 
     assert decrypted_data == original_data
 
+
 def test_encrypt_decrypt_empty_data(crypt):
     original_data = b""
 
@@ -65,6 +72,7 @@ def test_encrypt_decrypt_empty_data(crypt):
 
     assert decrypted_data == original_data
 
+
 def test_encrypt_decrypt_large_data(crypt):
     original_data = b"A" * 10000
 
@@ -76,6 +84,7 @@ def test_encrypt_decrypt_large_data(crypt):
 
     assert decrypted_data == original_data
 
+
 def test_encrypt_output_different_from_input(crypt):
     original_data = b"Test data for encryption"
 
@@ -85,6 +94,7 @@ def test_encrypt_output_different_from_input(crypt):
     assert encrypted_data != original_data
     assert len(encrypted_data) > len(original_data)
 
+
 def test_same_input_produces_same_output(crypt):
     original_data = b"Deterministic test"
 
@@ -96,6 +106,7 @@ def test_same_input_produces_same_output(crypt):
 
     assert encrypted_data1 == encrypted_data2
 
+
 def test_different_keys_produce_different_outputs(test_iv):
     key1 = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
     key2 = bytes.fromhex("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
@@ -110,6 +121,7 @@ def test_different_keys_produce_different_outputs(test_iv):
 
     assert encrypted_data1 != encrypted_data2
 
+
 def test_different_ivs_produce_different_outputs(test_key):
     iv1 = bytes.fromhex("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
     iv2 = bytes.fromhex("cccccccccccccccccccccccccccccccc")
@@ -124,14 +136,17 @@ def test_different_ivs_produce_different_outputs(test_key):
 
     assert encrypted_data1 != encrypted_data2
 
+
 def test_encrypt_non_bytes_raises_assertion_error(crypt):
     with pytest.raises(AssertionError):
         list(crypt.encrypt(["not bytes"]))
 
+
 def test_decrypt_non_bytes_raises_assertion_error(crypt):
     with pytest.raises(AssertionError):
         list(crypt.decrypt(["not bytes"]))
 
+
 def test_partial_decryption_chunks(crypt):
     original_data = b"Test partial decryption with multiple chunks"
 
@@ -147,6 +162,7 @@ def test_partial_decryption_chunks(crypt):
 
     assert decrypted_data == original_data
 
+
 def test_generator_behavior(crypt):
     original_data = b"Test generator behavior"
 
@@ -161,6 +177,7 @@ def test_generator_behavior(crypt):
     assert hasattr(decrypted_gen, '__iter__')
     assert hasattr(decrypted_gen, '__next__')
 
+
 def test_invalid_key_sizes(test_iv):
     with pytest.raises(ValueError, match="Invalid key size.*Must be exactly 256 bits"):
         Crypt(b"a" * 15, test_iv)
@@ -180,6 +197,7 @@ def test_invalid_key_sizes(test_iv):
     with pytest.raises(ValueError, match="Invalid key size.*Must be exactly 256 bits"):
         Crypt(b"a" * 24, test_iv)
 
+
 def test_invalid_iv_sizes(test_key):
     with pytest.raises(ValueError, match="Invalid IV size.*Must be 16 bytes"):
         Crypt(test_key, b"a" * 15)
@@ -194,4 +212,45 @@ def test_invalid_iv_sizes(test_key):
         Crypt(test_key, b"a" * 8)
 
     with pytest.raises(ValueError, match="Invalid IV size.*Must be 16 bytes"):
-        Crypt(test_key, b"a" * 32)
\ No newline at end of file
+        Crypt(test_key, b"a" * 32)
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 31, 32, 33, 1000])
+@pytest.mark.parametrize("chunk_size", [16, 17, 1024])
+def test_encrypt_into_matches_generator(crypt, size, chunk_size):
+    original_data = bytes(i % 256 for i in range(size))
+
+    encrypted = io.BytesIO()
+    written = crypt.encrypt_into(io.BytesIO(original_data), encrypted, chunk_size=chunk_size)
+
+    assert encrypted.getvalue() == b"".join(crypt.encrypt([original_data]))
+    assert written == len(encrypted.getvalue())
+
+    decrypted = io.BytesIO()
+    written = crypt.decrypt_into(io.BytesIO(encrypted.getvalue()), decrypted, chunk_size=chunk_size)
+
+    assert decrypted.getvalue() == original_data
+    assert written == size
+
+
+def test_decrypt_into_invalid_padding(crypt):
+    encrypted = io.BytesIO()
+    crypt.encrypt_into(io.BytesIO(b"Test data"), encrypted)
+
+    with pytest.raises(ValueError, match="Invalid padding bytes"):
+        crypt.decrypt_into(io.BytesIO(encrypted.getvalue()[:-16] + b"\x00" * 16), io.BytesIO())
+
+
+async def test_async_matches_generator(crypt):
+    original_data = bytes(i % 256 for i in range(200_000))
+    chunks = [original_data[i:i+70_000] for i in range(0, len(original_data), 70_000)]
+
+    async def agen(chunks):
+        for chunk in chunks:
+            yield chunk
+
+    encrypted_data = b"".join([chunk async for chunk in crypt.aencrypt(agen(chunks))])
+    assert encrypted_data == b"".join(crypt.encrypt(chunks))
+
+    decrypted_data = b"".join([chunk async for chunk in crypt.adecrypt(agen([encrypted_data]))])
+    assert decrypted_data == original_data
@@ -1,7 +1,14 @@
 import pytest
 import logging
 import itertools
+import random
+import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import zstandard
 import cryptography.exceptions
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import ytarchive_lib.crypt_v2 as crypt_v2
 from ytarchive_lib.crypt_v2 import Crypt
 
 
@@ -243,3 +250,607 @@ def test_invalid_key_sizes():
 
     with pytest.raises(ValueError, match="Invalid key size.*Must be exactly 256 bits"):
         Crypt(b"a" * 24)
+
+
+def encrypt_v2(key, data):
+    nonce = bytes(range(16))
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce)).encryptor()
+    encrypted = encryptor.update(data) + encryptor.finalize()
+    return b"V2:" + nonce + encrypted + encryptor.tag
+
+
+@pytest.fixture
+def segmented_crypt(test_key):
+    return Crypt(test_key, segment_size=16)
+
+
+def split(data, chunk_size):
+    return [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def test_encrypt_writes_v3_header(crypt):
+    encrypted_data = b"".join(crypt.encrypt([b"data"]))
+
+    assert encrypted_data.startswith(b"V3:")
+    assert len(encrypted_data) == crypt_v2.V3_HEADER_SIZE + 4 + 16
+
+
+def test_decrypt_v2_object(crypt, test_key):
+    original_data = b"Data written by the V2 format" * 100
+
+    encrypted_data = encrypt_v2(test_key, original_data)
+
+    assert b"".join(crypt.decrypt(split(encrypted_data, 7))) == original_data
+
+
+def test_decrypt_v2_object_modified(crypt, test_key):
+    encrypted_data = bytearray(encrypt_v2(test_key, b"Data written by the V2 format"))
+    encrypted_data[25] ^= 1
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        list(crypt.decrypt([bytes(encrypted_data)]))
+
+
+def test_decrypt_unsupported_version(crypt):
+    with pytest.raises(ValueError, match="Unsupported version: V9:"):
+        list(crypt.decrypt([b"V9:" + b"\x00" * 64]))
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 17, 31, 32, 33, 100])
+@pytest.mark.parametrize("chunk_size", [1, 5, 16, 17, 1000])
+def test_segmented_roundtrip(segmented_crypt, size, chunk_size):
+    original_data = bytes(i % 256 for i in range(size))
+
+    encrypted_data = b"".join(segmented_crypt.encrypt(split(original_data, chunk_size)))
+
+    assert len(encrypted_data) == segmented_crypt.encrypted_size(size)
+
+    decrypted_data = b"".join(segmented_crypt.decrypt(split(encrypted_data, chunk_size)))
+
+    assert decrypted_data == original_data
+
+
+def test_segmented_decrypt_uses_header_segment_size(segmented_crypt, test_key):
+    original_data = b"Segment size is read from the header" * 10
+
+    encrypted_data = b"".join(segmented_crypt.encrypt([original_data]))
+
+    assert b"".join(Crypt(test_key).decrypt([encrypted_data])) == original_data
+
+
+def test_segmented_reject_truncated_at_segment_boundary(segmented_crypt):
+    encrypted_data = b"".join(segmented_crypt.encrypt([b"A" * 40]))
+
+    truncated = encrypted_data[:crypt_v2.V3_HEADER_SIZE + 2 * (16 + 16)]
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        list(segmented_crypt.decrypt([truncated]))
+
+
+def test_segmented_reject_truncated_tag(segmented_crypt):
+    encrypted_data = b"".join(segmented_crypt.encrypt([b"A" * 40]))
+
+    truncated = encrypted_data[:crypt_v2.V3_HEADER_SIZE + 2 * (16 + 16) + 8]
+
+    with pytest.raises(ValueError, match="Not enough data to read 16 bytes"):
+        list(segmented_crypt.decrypt([truncated]))
+
+
+def test_segmented_reject_reordered_segments(segmented_crypt):
+    encrypted_data = b"".join(segmented_crypt.encrypt([b"A" * 16 + b"B" * 16 + b"C" * 8]))
+
+    header = encrypted_data[:crypt_v2.V3_HEADER_SIZE]
+    segments = split(encrypted_data[crypt_v2.V3_HEADER_SIZE:], 32)
+    reordered = header + segments[1] + segments[0] + segments[2]
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        list(segmented_crypt.decrypt([reordered]))
+
+
+def test_segmented_reject_modified_header(segmented_crypt):
+    encrypted_data = bytearray(b"".join(segmented_crypt.encrypt([b"A" * 40])))
+    encrypted_data[crypt_v2.V3_HEADER_SIZE - 1] ^= 1
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        list(segmented_crypt.decrypt([bytes(encrypted_data)]))
+
+
+def test_segmented_reject_unknown_flags(segmented_crypt):
+    encrypted_data = bytearray(b"".join(segmented_crypt.encrypt([b"A" * 40])))
+    encrypted_data[7] = 2
+
+    with pytest.raises(ValueError, match="Unsupported flags"):
+        list(segmented_crypt.decrypt([bytes(encrypted_data)]))
+
+
+@pytest.mark.parametrize("start, end", [
+    (0, 100), (0, 1), (5, 6), (15, 17), (16, 32), (30, 70), (99, 100), (90, 1000), (100, 200), (50, 50),
+])
+def test_decrypt_range(segmented_crypt, start, end):
+    original_data = bytes(i % 256 for i in range(100))
+
+    encrypted_data = b"".join(segmented_crypt.encrypt([original_data]))
+
+    reads = []
+    def read(offset, length):
+        reads.append((offset, length))
+        return encrypted_data[offset:offset + length]
+
+    decrypted = b"".join(segmented_crypt.decrypt_range(read, len(encrypted_data), start, end))
+
+    assert decrypted == original_data[start:end]
+
+    # header plus only the segments covering the range
+    end = min(end, len(original_data))
+    segments = (end - 1) // 16 - start // 16 + 1 if start < end else 0
+    assert len(reads) == 1 + segments
+
+
+def test_decrypt_range_rejects_v2(crypt, test_key):
+    encrypted_data = encrypt_v2(test_key, b"A" * 100)
+
+    with pytest.raises(ValueError, match="Range decryption is not supported"):
+        list(crypt.decrypt_range(lambda offset, length: encrypted_data[offset:offset + length], len(encrypted_data), 0, 10))
+
+
+def test_invalid_segment_sizes(test_key):
+    with pytest.raises(ValueError, match="Invalid segment size"):
+        Crypt(test_key, segment_size=0)
+
+    with pytest.raises(ValueError, match="Invalid segment size"):
+        Crypt(test_key, segment_size=2 ** 32)
+
+
+@pytest.mark.parametrize("workers", [2, 3, 8])
+@pytest.mark.parametrize("size", [0, 15, 16, 17, 1000])
+def test_parallel_roundtrip(test_key, workers, size):
+    parallel_crypt = Crypt(test_key, segment_size=16, workers=workers)
+    serial_crypt = Crypt(test_key, segment_size=16)
+
+    original_data = bytes(i % 256 for i in range(size))
+
+    encrypted_data = b"".join(parallel_crypt.encrypt(split(original_data, 7)))
+
+    assert b"".join(serial_crypt.decrypt([encrypted_data])) == original_data
+    assert b"".join(parallel_crypt.decrypt(split(encrypted_data, 7))) == original_data
+
+
+def test_parallel_reject_modified_segment(test_key):
+    parallel_crypt = Crypt(test_key, segment_size=16, workers=4)
+
+    encrypted_data = bytearray(b"".join(parallel_crypt.encrypt([b"A" * 1000])))
+    encrypted_data[crypt_v2.V3_HEADER_SIZE + 32 * 20] ^= 1
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        list(parallel_crypt.decrypt([bytes(encrypted_data)]))
+
+
+def test_invalid_workers(test_key):
+    with pytest.raises(ValueError, match="Invalid number of workers"):
+        Crypt(test_key, workers=0)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_holdback_random_chunks(seed):
+    rnd = random.Random(seed)
+    data = bytes(rnd.randrange(256) for _ in range(rnd.randrange(16, 2000)))
+
+    chunks = []
+    position = 0
+    while position < len(data):
+        size = rnd.choice([0, 1, 2, 7, 15, 16, 17, 100])
+        chunks.append(data[position:position + size])
+        position += size
+
+    holdback = crypt_v2.Holdback(16)
+    passed = b"".join(b"".join(holdback.feed(chunk)) for chunk in chunks)
+
+    assert passed == data[:-16]
+    assert holdback.tail() == data[-16:]
+
+
+@pytest.mark.parametrize("segment_size", [1, 3, 16])
+def test_split(crypt, segment_size):
+    data = bytes(range(50))
+
+    for chunk_size in [1, 2, 3, 16, 17, 50]:
+        pieces = list(crypt._split(split(data, chunk_size), segment_size))
+
+        assert b"".join(piece for piece, _ in pieces) == data
+        assert [last for _, last in pieces] == [False] * (len(pieces) - 1) + [True]
+        assert all(len(piece) == segment_size for piece, _ in pieces[:-1])
+        assert 0 < len(pieces[-1][0]) <= segment_size
+
+
+class SlowReader(io.RawIOBase):
+    """Returns at most `step` bytes per read, like a socket or an HTTP body"""
+
+    def __init__(self, data, step):
+        self.data = io.BytesIO(data)
+        self.step = step
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.data.read(min(len(buffer), self.step))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 17, 32, 33, 100])
+@pytest.mark.parametrize("step", [1, 7, 1000])
+def test_encrypt_into_decrypt_into(segmented_crypt, size, step):
+    original_data = bytes(i % 256 for i in range(size))
+
+    encrypted = io.BytesIO()
+    written = segmented_crypt.encrypt_into(SlowReader(original_data, step), encrypted)
+
+    assert written == len(encrypted.getvalue()) == segmented_crypt.encrypted_size(size)
+    assert b"".join(segmented_crypt.decrypt([encrypted.getvalue()])) == original_data
+
+    decrypted = io.BytesIO()
+    written = segmented_crypt.decrypt_into(SlowReader(encrypted.getvalue(), step), decrypted)
+
+    assert written == size
+    assert decrypted.getvalue() == original_data
+
+
+@pytest.mark.parametrize("size", [0, 1, 100])
+def test_decrypt_into_generator_output(segmented_crypt, size):
+    original_data = bytes(i % 256 for i in range(size))
+
+    encrypted_data = b"".join(segmented_crypt.encrypt(split(original_data, 7)))
+
+    decrypted = io.BytesIO()
+    segmented_crypt.decrypt_into(io.BytesIO(encrypted_data), decrypted)
+
+    assert decrypted.getvalue() == original_data
+
+
+@pytest.mark.parametrize("chunk_size", [1, 16, 17, 1024])
+def test_decrypt_into_v2_object(crypt, test_key, chunk_size):
+    original_data = b"Data written by the V2 format" * 100
+
+    decrypted = io.BytesIO()
+    crypt.decrypt_into(io.BytesIO(encrypt_v2(test_key, original_data)), decrypted, chunk_size=chunk_size)
+
+    assert decrypted.getvalue() == original_data
+
+
+def test_decrypt_into_v2_object_modified(crypt, test_key):
+    encrypted_data = bytearray(encrypt_v2(test_key, b"Data written by the V2 format"))
+    encrypted_data[-1] ^= 1
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        crypt.decrypt_into(io.BytesIO(bytes(encrypted_data)), io.BytesIO())
+
+
+def test_decrypt_into_writes_only_verified_segments(segmented_crypt):
+    encrypted_data = bytearray(b"".join(segmented_crypt.encrypt([b"A" * 16 + b"B" * 16 + b"C" * 8])))
+    encrypted_data[crypt_v2.V3_HEADER_SIZE + 32 + 3] ^= 1
+
+    decrypted = io.BytesIO()
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        segmented_crypt.decrypt_into(io.BytesIO(bytes(encrypted_data)), decrypted)
+
+    assert decrypted.getvalue() == b"A" * 16
+
+
+def test_decrypt_into_truncated(segmented_crypt):
+    encrypted_data = b"".join(segmented_crypt.encrypt([b"A" * 40]))
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        segmented_crypt.decrypt_into(io.BytesIO(encrypted_data[:crypt_v2.V3_HEADER_SIZE + 64]), io.BytesIO())
+
+    with pytest.raises(ValueError, match="Not enough data to read 3 bytes"):
+        segmented_crypt.decrypt_into(io.BytesIO(b"V3"), io.BytesIO())
+
+
+class ShortWriter(io.BytesIO):
+    def write(self, data):
+        return super().write(bytes(data[:5]))
+
+
+def test_into_short_writes(segmented_crypt):
+    original_data = bytes(i % 256 for i in range(100))
+
+    encrypted = ShortWriter()
+    written = segmented_crypt.encrypt_into(io.BytesIO(original_data), encrypted)
+
+    assert written == len(encrypted.getvalue()) == segmented_crypt.encrypted_size(len(original_data))
+
+    decrypted = ShortWriter()
+    segmented_crypt.decrypt_into(io.BytesIO(encrypted.getvalue()), decrypted)
+
+    assert decrypted.getvalue() == original_data
+
+
+def read_all(reader, buffer_size):
+    buffer = bytearray(buffer_size)
+    data = bytearray()
+
+    while count := reader.readinto(buffer):
+        data += buffer[:count]
+
+    return bytes(data)
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 17, 32, 33, 100])
+@pytest.mark.parametrize("buffer_size", [1, 7, 32, 33, 100, 10000])
+def test_encrypt_reader(segmented_crypt, size, buffer_size):
+    original_data = bytes(i % 256 for i in range(size))
+
+    reader = segmented_crypt.encrypt_reader(SlowReader(original_data, 5))
+    assert isinstance(reader, crypt_v2.EncryptingReader)
+
+    encrypted_data = read_all(reader, buffer_size)
+
+    assert len(encrypted_data) == segmented_crypt.encrypted_size(size)
+    assert b"".join(segmented_crypt.decrypt([encrypted_data])) == original_data
+
+
+def test_encrypt_reader_aligned_reads(segmented_crypt):
+    reader = segmented_crypt.encrypt_reader(io.BytesIO(bytes(40)))
+    buffer = bytearray(32)
+
+    # the header alone, then one sealed segment per read
+    assert reader.readinto(buffer) == crypt_v2.V3_HEADER_SIZE
+    assert [reader.readinto(buffer) for _ in range(4)] == [32, 32, 8 + 16, 0]
+
+
+@pytest.mark.parametrize("crypt_args", [dict(), dict(compression_level=3)])
+@pytest.mark.parametrize("size", [0, 15, 16, 100])
+def test_encrypt_reader_offset(test_key, crypt_args, size):
+    crypt = Crypt(test_key, segment_size=16, **crypt_args)
+    original_data = bytes(i % 256 for i in range(size))
+    salt = bytes(range(16))
+
+    encrypted_data = crypt.encrypt_reader(io.BytesIO(original_data), salt).read()
+    assert b"".join(crypt.encrypt([original_data], salt)) == encrypted_data
+
+    for offset in range(len(encrypted_data) + 2):
+        reader = crypt.encrypt_reader(io.BytesIO(original_data), salt, offset)
+        assert read_all(reader, 7) == encrypted_data[offset:]
+
+
+@pytest.mark.parametrize("crypt_args", [dict(workers=3), dict(compression_level=3)])
+def test_encrypt_reader_generator_fallback(test_key, crypt_args):
+    crypt = Crypt(test_key, segment_size=16, **crypt_args)
+    original_data = bytes(i % 256 for i in range(1000))
+
+    reader = crypt.encrypt_reader(io.BytesIO(original_data))
+    assert isinstance(reader, crypt_v2.ChunkReader)
+
+    assert b"".join(crypt.decrypt([read_all(reader, 100)])) == original_data
+
+
+def test_into_parallel(test_key):
+    parallel_crypt = Crypt(test_key, segment_size=16, workers=3)
+    original_data = bytes(i % 256 for i in range(1000))
+
+    encrypted = io.BytesIO()
+    parallel_crypt.encrypt_into(io.BytesIO(original_data), encrypted)
+
+    decrypted = io.BytesIO()
+    parallel_crypt.decrypt_into(io.BytesIO(encrypted.getvalue()), decrypted)
+
+    assert decrypted.getvalue() == original_data
+
+
+async def agen(chunks):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+
+
+async def ajoin(chunks):
+    return b"".join([bytes(chunk) async for chunk in chunks])
+
+
+@pytest.mark.parametrize("size", [0, 15, 16, 17, 100])
+@pytest.mark.parametrize("workers", [1, 3])
+async def test_async_roundtrip(test_key, size, workers):
+    crypt = Crypt(test_key, segment_size=16, workers=workers)
+    original_data = bytes(i % 256 for i in range(size))
+
+    encrypted_data = await ajoin(crypt.aencrypt(agen(split(original_data, 7))))
+
+    assert b"".join(crypt.decrypt([encrypted_data])) == original_data
+    assert await ajoin(crypt.adecrypt(agen(split(encrypted_data, 5)))) == original_data
+
+
+async def test_async_offloads_to_executor(test_key):
+    crypt = Crypt(test_key, segment_size=16)
+    original_data = bytes(i % 256 for i in range(100))
+
+    with ThreadPoolExecutor(1, thread_name_prefix="crypt") as executor:
+        encrypted_data = await ajoin(crypt.aencrypt(agen([original_data]), executor))
+        decrypted_data = await ajoin(crypt.adecrypt(agen([encrypted_data]), executor))
+
+    assert decrypted_data == original_data
+
+
+async def test_async_decrypt_v2_object(crypt, test_key):
+    original_data = b"Data written by the V2 format" * 10000
+
+    encrypted_data = encrypt_v2(test_key, original_data)
+
+    assert await ajoin(crypt.adecrypt(agen(split(encrypted_data, 100_000)))) == original_data
+
+
+async def test_async_reject_modified(test_key):
+    crypt = Crypt(test_key, segment_size=16, workers=2)
+
+    encrypted_data = bytearray(await ajoin(crypt.aencrypt(agen([b"A" * 100]))))
+    encrypted_data[-1] ^= 1
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        await ajoin(crypt.adecrypt(agen([bytes(encrypted_data)])))
+
+
+async def test_async_decrypt_not_enough_data(crypt):
+    with pytest.raises(ValueError, match="Not enough data to read 3 bytes"):
+        await ajoin(crypt.adecrypt(agen([b"V"])))
+
+
+@pytest.fixture
+def compressing_crypt(test_key):
+    return Crypt(test_key, segment_size=16, compression_level=3)
+
+
+@pytest.mark.parametrize("size", [0, 1, 100, 10000])
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_compressed_roundtrip(compressing_crypt, crypt, size, chunk_size):
+    original_data = b"compressible " * size
+
+    encrypted_data = b"".join(compressing_crypt.encrypt(split(original_data, chunk_size)))
+
+    assert encrypted_data[7] == crypt_v2.FLAG_ZSTD
+    # any instance decompresses, whatever its own settings
+    assert b"".join(crypt.decrypt(split(encrypted_data, chunk_size))) == original_data
+
+
+@pytest.mark.parametrize("size", [0, 1, 1000, 200_000])
+def test_compressed_encrypted_size_is_upper_bound(compressing_crypt, size):
+    original_data = random.Random(size).randbytes(size)
+
+    encrypted_data = b"".join(compressing_crypt.encrypt([original_data]))
+
+    assert len(encrypted_data) <= compressing_crypt.encrypted_size(size)
+
+
+def test_compressed_is_smaller(compressing_crypt, crypt):
+    original_data = b"compressible " * 10000
+
+    compressed = b"".join(compressing_crypt.encrypt([original_data]))
+    uncompressed = b"".join(crypt.encrypt([original_data]))
+
+    assert uncompressed[7] == 0
+    assert len(compressed) < len(uncompressed) // 10
+
+
+@pytest.mark.parametrize("threads", [1, 2])
+def test_compressed_threads(test_key, threads):
+    crypt = Crypt(test_key, compression_level=3, compression_threads=threads, workers=2)
+    original_data = bytes(i % 251 for i in range(3 * 1024 * 1024))
+
+    encrypted_data = b"".join(crypt.encrypt(split(original_data, 100_000)))
+
+    assert b"".join(crypt.decrypt(split(encrypted_data, 100_000))) == original_data
+
+
+def test_compressed_reject_cleared_flag(compressing_crypt):
+    encrypted_data = bytearray(b"".join(compressing_crypt.encrypt([b"A" * 100])))
+    encrypted_data[7] = 0
+
+    with pytest.raises(cryptography.exceptions.InvalidTag):
+        list(compressing_crypt.decrypt([bytes(encrypted_data)]))
+
+
+def test_compressed_reject_truncated_frame(compressing_crypt):
+    frame = zstandard.ZstdCompressor().compress(b"A" * 1000)
+    compressing_crypt._compress = lambda data: [frame[:-4] + crypt_v2.ZSTD_TRAILER.pack(1000)]
+
+    encrypted_data = b"".join(compressing_crypt.encrypt([b""]))
+
+    with pytest.raises(ValueError, match="Truncated zstd frame"):
+        list(compressing_crypt.decrypt([encrypted_data]))
+
+
+def test_compressed_reject_missing_trailer(compressing_crypt):
+    compressing_crypt._compress = lambda data: [zstandard.ZstdCompressor().compress(b"A" * 1000)]
+
+    encrypted_data = b"".join(compressing_crypt.encrypt([b""]))
+
+    with pytest.raises(ValueError, match="Truncated zstd frame"):
+        list(compressing_crypt.decrypt([encrypted_data]))
+
+
+def test_compressed_output_is_bounded(test_key):
+    crypt = Crypt(test_key, compression_level=3)
+    size = 256 * 1024 * 1024
+
+    encrypted_data = b"".join(crypt.encrypt(itertools.repeat(bytes(1024 * 1024), 256)))
+    assert len(encrypted_data) < 64 * 1024
+
+    chunks = [len(chunk) for chunk in crypt.decrypt([encrypted_data])]
+
+    assert sum(chunks) == size
+    assert max(chunks) <= crypt_v2.DEFAULT_CHUNK_SIZE
+
+
+async def test_compressed_async_output_is_bounded(test_key):
+    crypt = Crypt(test_key, compression_level=3)
+
+    encrypted_data = b"".join(crypt.encrypt(itertools.repeat(bytes(1024 * 1024), 64)))
+
+    with ThreadPoolExecutor(1) as executor:
+        chunks = [len(chunk) async for chunk in crypt.adecrypt(agen([encrypted_data]), executor)]
+
+    assert sum(chunks) == 64 * 1024 * 1024
+    assert max(chunks) <= crypt_v2.DEFAULT_CHUNK_SIZE
+
+
+def test_chunk_reader():
+    reader = crypt_v2.ChunkReader([b"abc", b"", memoryview(b"defgh"), b"i"])
+
+    assert reader.read(2) == b"ab"
+    assert reader.read(5) == b"c"
+    assert reader.read(3) == b"def"
+    assert reader.read(1) == b"g"
+    assert reader.read() == b"hi"
+    assert reader.read(10) == b""
+
+
+def test_chunk_reader_readinto():
+    reader = crypt_v2.ChunkReader([b"abc", b"", b"defgh"])
+    buffer = bytearray(4)
+
+    assert reader.readinto(buffer) == 3
+    assert buffer[:3] == b"abc"
+    assert reader.readinto(buffer) == 4
+    assert buffer == b"defg"
+    assert reader.readinto(buffer) == 1
+    assert reader.readinto(buffer) == 0
+
+
+@pytest.mark.parametrize("size", [0, 100, 10000])
+def test_compressed_into(compressing_crypt, size):
+    original_data = b"compressible " * size
+
+    encrypted = io.BytesIO()
+    written = compressing_crypt.encrypt_into(io.BytesIO(original_data), encrypted)
+    assert written == len(encrypted.getvalue())
+
+    decrypted = io.BytesIO()
+    compressing_crypt.decrypt_into(io.BytesIO(encrypted.getvalue()), decrypted)
+
+    assert decrypted.getvalue() == original_data
+
+
+def test_compressed_decrypt_range(compressing_crypt):
+    encrypted_data = b"".join(compressing_crypt.encrypt([b"A" * 100]))
+
+    def read(offset, length):
+        return encrypted_data[offset:offset + length]
+
+    with pytest.raises(ValueError, match="compressed"):
+        list(compressing_crypt.decrypt_range(read, len(encrypted_data), 0, 10))
+
+
+@pytest.mark.parametrize("size", [0, 100, 100_000])
+async def test_compressed_async_roundtrip(compressing_crypt, crypt, size):
+    original_data = b"compressible " * size
+
+    with ThreadPoolExecutor(1) as executor:
+        encrypted_data = await ajoin(compressing_crypt.aencrypt(agen(split(original_data, 70_000)), executor))
+        decrypted_data = await ajoin(crypt.adecrypt(agen(split(encrypted_data, 5)), executor))
+
+    assert b"".join(crypt.decrypt([encrypted_data])) == original_data
+    assert decrypted_data == original_data
+
+
+def test_invalid_compression_level(test_key):
+    with pytest.raises(ValueError, match="Invalid compression level"):
+        Crypt(test_key, compression_level=23)
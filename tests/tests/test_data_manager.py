@@ -1,10 +1,18 @@
 import pytest
 import io
+import time
+import asyncio
+import os
+import hashlib
+from datetime import timedelta
 import ytarchive_lib.data_manager as dm
 import ytarchive_lib.config as config
+from ytarchive_lib.cache import DownloadCache
 from psycopg.rows import dict_row
 from conftest import generate_id, check_items, check_warnings
 
+MiB = 1024 * 1024
+
 
 @pytest.fixture(scope="function", autouse=True)
 def enable_bucket_cleanup(bucket_cleanup):
@@ -31,6 +39,52 @@ def make_item(state=dm.SrcItem.State.NEW):
     )
 
 
+async def test_db_connections_run_in_parallel(data_manager):
+    async def sleep():
+        async with data_manager.db.connection() as connection:
+            await connection.execute("SELECT pg_sleep(0.5)")
+
+    started = time.monotonic()
+    await asyncio.gather(*[sleep() for _ in range(4)])
+
+    assert time.monotonic() - started < 1.5
+
+
+async def test_transaction(data_manager):
+    commits = data_manager.db.commits
+
+    async with data_manager.transaction():
+        await data_manager.add_src_item(make_item())
+        await data_manager.mark_as_done("youtube", "vROdVsU_K80")
+
+    assert data_manager.db.commits == commits + 1
+    await check_items(data_manager, [make_item(state=dm.SrcItem.State.DONE)])
+
+
+async def test_transaction_rolled_back(data_manager):
+    with pytest.raises(RuntimeError):
+        async with data_manager.transaction():
+            await data_manager.add_src_item(make_item())
+            async with data_manager.transaction():
+                await data_manager.mark_as_done("youtube", "vROdVsU_K80")
+
+            raise RuntimeError()
+
+    await check_items(data_manager, [])
+
+
+async def test_pipelined_transaction(data_manager):
+    items = [dm.SrcItem("youtube", f"video{i}", "url", "title", "channel", "channel_id", "channel_url", 1) for i in range(10)]
+    await data_manager.add_src_items_bulk(items)
+
+    async with data_manager.transaction(pipeline=True):
+        for item in items:
+            await data_manager.mark_as_done(item.provider, item.id)
+
+    done = [item async for item in data_manager.get_src_items_by_state(dm.SrcItem.State.DONE)]
+    assert sorted(item.id for item in done) == sorted(item.id for item in items)
+
+
 async def test_add_src_item(data_manager):
     await data_manager.add_src_item(make_item())
 
@@ -63,6 +117,63 @@ async def test_add_src_item_warning(data_manager):
     )
 
 
+async def test_add_src_items_bulk(data_manager):
+    existing = make_item()
+    await data_manager.add_src_item(existing)
+
+    new = dm.SrcItem("youtube", "new", "url", "title", "channel", "channel_id", "channel_url", 1000, dm.SrcItem.State.WARNING)
+    added = await data_manager.add_src_items_bulk([existing, new, new])
+
+    assert added == {("youtube", "new")}
+    await check_items(data_manager, [existing, new])
+
+    warning = dm.Warning(provider="youtube", id="new", warning_id="too_long", message="Item duration is too long")
+    assert await data_manager.add_warnings_bulk([warning]) == {("youtube", "new")}
+    assert await data_manager.add_warnings_bulk([warning]) == set()
+    await check_warnings(data_manager, [warning])
+
+    assert await data_manager.add_src_items_bulk([]) == set()
+
+
+async def test_claim_src_item(data_manager):
+    await data_manager.add_src_item(make_item())
+
+    claims = await asyncio.gather(*[data_manager.claim_src_item(f"worker{i}") for i in range(4)])
+
+    # exactly one worker gets the item
+    claimed = [(i, item) for i, item in enumerate(claims) if item is not None]
+    assert len(claimed) == 1
+    owner, item = f"worker{claimed[0][0]}", claimed[0][1]
+    assert item.state == dm.SrcItem.State.IN_PROGRESS
+    assert await data_manager.claim_src_item("other") is None
+
+    assert await data_manager.renew_lease(item.provider, item.id, owner)
+    assert not await data_manager.renew_lease(item.provider, item.id, "other")
+    assert not await data_manager.release_src_item(item.provider, item.id, "other", dm.SrcItem.State.DONE)
+
+    assert await data_manager.release_src_item(item.provider, item.id, owner, dm.SrcItem.State.DONE)
+    await check_items(data_manager, [make_item(state=dm.SrcItem.State.DONE)])
+
+
+async def test_claim_prefers_pending_upload(data_manager):
+    items = [dm.SrcItem("youtube", f"video{i}", "url", "title", "channel", "channel_id", "channel_url", 1, priority=i) for i in range(3)]
+    await data_manager.add_src_items_bulk(items)
+    key = data_manager.archive_key("youtube", "video0")
+    await data_manager.add_pending_upload(dm.PendingUpload(key, "upload", bytes(16), 5 * MiB, 1, "hash"))
+
+    assert (await data_manager.claim_src_item("worker")).id == "video0"
+    assert (await data_manager.claim_src_item("worker")).id == "video2"
+
+
+async def test_reclaim_expired_leases(data_manager):
+    await data_manager.add_src_item(make_item())
+    item = await data_manager.claim_src_item("killed", lease=timedelta(seconds=-1))
+
+    assert await data_manager.reclaim_expired_leases() == 1
+    assert not await data_manager.renew_lease(item.provider, item.id, "killed")
+    assert (await data_manager.claim_src_item("worker")).id == item.id
+
+
 async def test_mark_as_done(data_manager):
     await data_manager.add_src_item(make_item())
 
@@ -82,6 +193,124 @@ def test_upload_file(data_manager):
     assert returned_file == test_data
 
 
+def test_download_file_cached(data_manager, tmp_path):
+    test_data = os.urandom(3 * MiB)
+    data_manager.upload_file("youtube", "TESTKEY", io.BytesIO(test_data))
+    data_manager.cache = DownloadCache(tmp_path, 100 * MiB)
+
+    assert b"".join(data_manager.download_file("youtube", "TESTKEY")) == test_data
+    assert b"".join(data_manager.download_file("youtube", "TESTKEY")) == test_data
+    assert (data_manager.cache.hits, data_manager.cache.misses) == (1, 1)
+
+
+async def test_aupload_adownload_file(data_manager):
+    test_data = os.urandom(20 * MiB)
+
+    uploaded = await data_manager.aupload_file("youtube", "TESTKEY", io.BytesIO(test_data))
+
+    chunks = [chunk async for chunk in data_manager.adownload_file("youtube", "TESTKEY")]
+    assert b"".join(chunks) == test_data
+
+    recorded = await data_manager.get_archive_object(uploaded.key)
+    head = data_manager.s3.meta.client.head_object(Bucket=data_manager.bucket.name, Key=uploaded.key)
+    assert (recorded.size, recorded.etag) == (head["ContentLength"], head["ETag"])
+    assert await data_manager.averify_object(uploaded.key) == len(test_data)
+
+
+async def test_sync_archive_objects(data_manager):
+    first = await data_manager.aupload_file("youtube", "TESTKEY", io.BytesIO(b"first"))
+    second = await data_manager.aupload_file("youtube", "TESTKEY2", io.BytesIO(b"second"))
+    # uploaded by a run that crashed before recording it, and a row of a deleted object
+    async with data_manager.db.connection() as connection:
+        await connection.execute("DELETE FROM archive_objects WHERE key = %s", (second.key,))
+        await connection.execute("""
+            INSERT INTO archive_objects (key, size, etag, uploaded_at, storage_class)
+            VALUES ('archive/gone', 1, '"etag"', now() - interval '1 day', 'STANDARD')
+        """)
+
+    assert await data_manager.sync_archive_objects() == 2
+
+    objects = await data_manager.get_archive_objects()
+    assert [(obj.key, obj.size, obj.etag) for obj in objects] == sorted([
+        (first.key, first.size, first.etag),
+        (second.key, second.size, second.etag),
+    ])
+
+
+async def test_reconcile_archive_objects(data_manager):
+    def item(id, state):
+        return dm.SrcItem("youtube", id, "url", "title", "channel", "channel_id", "channel_url", 1, state)
+
+    uploaded = item("uploaded", dm.SrcItem.State.NEW)
+    missing = item("missing", dm.SrcItem.State.DONE)
+    done = item("done", dm.SrcItem.State.DONE)
+    for src_item in (uploaded, missing, done, item("new", dm.SrcItem.State.NEW)):
+        await data_manager.add_src_item(src_item)
+        async with data_manager.db.connection() as connection:
+            await connection.execute("UPDATE src_items SET state = %s WHERE id = %s", (str(src_item.state), src_item.id))
+
+    for key in (data_manager.archive_key("youtube", "uploaded"), data_manager.archive_key("youtube", "done"), "archive/orphaned"):
+        await data_manager.add_archive_object(dm.ArchiveObject(key=key, size=1, etag='"etag"'))
+
+    assert await data_manager.get_src_items_by_archive_object(dm.SrcItem.State.NEW, exists=True) == [uploaded]
+    assert await data_manager.get_src_items_by_archive_object(dm.SrcItem.State.DONE, exists=False) == [missing]
+    assert [obj.key for obj in await data_manager.get_orphaned_archive_objects()] == ["archive/orphaned"]
+
+    assert await data_manager.set_src_items_state([uploaded], dm.SrcItem.State.DONE) == 1
+    # read before the state changed
+    assert await data_manager.set_src_items_state([uploaded], dm.SrcItem.State.DONE) == 0
+    assert await data_manager.get_src_items_by_archive_object(dm.SrcItem.State.NEW, exists=True) == []
+
+
+async def start_interrupted_upload(data_manager, data, salt, source_hash):
+    """The state a run killed after the first part leaves behind"""
+    key = data_manager.archive_key("youtube", "TESTKEY")
+    client = data_manager.s3.meta.client
+    encrypted = data_manager.cryptor.encrypt_reader(io.BytesIO(data), salt).read()
+
+    upload_id = client.create_multipart_upload(Bucket=data_manager.bucket.name, Key=key)["UploadId"]
+    etag = client.upload_part(
+        Bucket=data_manager.bucket.name,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=1,
+        Body=encrypted[:5 * MiB],
+    )["ETag"]
+
+    await data_manager.add_pending_upload(dm.PendingUpload(
+        key=key,
+        upload_id=upload_id,
+        salt=salt,
+        part_size=5 * MiB,
+        source_size=len(data),
+        source_hash=source_hash,
+    ))
+    await data_manager.add_pending_upload_part(key, 1, etag)
+
+    return key
+
+
+async def test_upload_file_resumable(data_manager):
+    test_data = os.urandom(12 * MiB)
+    key = await start_interrupted_upload(data_manager, test_data, os.urandom(16), hashlib.sha256(test_data).hexdigest())
+    assert await data_manager.get_pending_upload_keys() == {key}
+
+    await data_manager.upload_file_resumable("youtube", "TESTKEY", io.BytesIO(test_data))
+
+    assert b"".join(data_manager.download_file("youtube", "TESTKEY")) == test_data
+    assert await data_manager.get_pending_upload(key) is None
+
+
+async def test_upload_file_resumable_changed_source(data_manager):
+    test_data = os.urandom(12 * MiB)
+    key = await start_interrupted_upload(data_manager, test_data, os.urandom(16), "other archive")
+
+    await data_manager.upload_file_resumable("youtube", "TESTKEY", io.BytesIO(test_data))
+
+    assert b"".join(data_manager.download_file("youtube", "TESTKEY")) == test_data
+    assert await data_manager.get_pending_upload(key) is None
+
+
 async def test_add_playlist(data_manager):
     playlist = dm.Playlist(url="https://www.youtube.com/playlist?list=PLs6f7LuYcgtn1IeWz1is9AXZd46F4V6qu")
 
@@ -436,7 +665,7 @@ async def test_add_video_metadata(data_manager):
     assert inserted is True
 
     # Verify the metadata was stored
-    async with data_manager.db.connection.cursor(row_factory=dict_row) as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
         await cursor.execute("""
             SELECT provider, id, chapters, description, raw_data
             FROM video_metadata
@@ -477,7 +706,7 @@ async def test_add_video_metadata_update(data_manager):
     assert second_insert is True
 
     # Verify only one record exists with updated values
-    async with data_manager.db.connection.cursor(row_factory=dict_row) as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
         await cursor.execute("""
             SELECT provider, id, chapters, description, raw_data
             FROM video_metadata
@@ -520,7 +749,7 @@ async def test_add_video_metadata_multiple(data_manager):
     await data_manager.add_video_metadata(metadata3)
 
     # Verify all three records exist
-    async with data_manager.db.connection.cursor(row_factory=dict_row) as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
         await cursor.execute("""
             SELECT provider, id, description
             FROM video_metadata
@@ -550,7 +779,7 @@ async def test_add_video_metadata_empty_fields(data_manager):
     assert inserted is True
 
     # Verify empty strings are stored correctly
-    async with data_manager.db.connection.cursor(row_factory=dict_row) as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
         await cursor.execute("""
             SELECT chapters, description
             FROM video_metadata
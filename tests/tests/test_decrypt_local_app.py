@@ -0,0 +1,88 @@
+import pytest
+import os
+import ytarchive_lib.decrypt_local_app as app
+from ytarchive_lib.crypt import Crypt as LegacyCrypt
+from ytarchive_lib.crypt_v2 import Crypt
+
+
+KEY = bytes.fromhex("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
+IV = bytes.fromhex("bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb")
+
+
+def write_encrypted(path, cryptor, data):
+    path.write_bytes(b"".join(cryptor.encrypt([data])))
+    return path
+
+
+@pytest.mark.parametrize("cryptor", [
+    LegacyCrypt(KEY, IV),
+    Crypt(KEY),
+    Crypt(KEY, segment_size=1000, compression_level=3),
+])
+@pytest.mark.parametrize("size", [0, 1, 100_000])
+def test_decrypt_file(tmp_path, cryptor, size):
+    data = os.urandom(size)
+    src = write_encrypted(tmp_path / "object", cryptor, data)
+
+    written = app.decrypt_file(src, tmp_path / "object.zip", KEY, IV, buffer_size=4096)
+
+    assert written == size
+    assert (tmp_path / "object.zip").read_bytes() == data
+    assert not (tmp_path / "object.zip.part").exists()
+
+
+def test_detect_version(tmp_path):
+    assert app.detect_version(write_encrypted(tmp_path / "v1", LegacyCrypt(KEY, IV), b"data")) == b"V1:"
+    assert app.detect_version(write_encrypted(tmp_path / "v3", Crypt(KEY), b"data")) == b"V3:"
+
+
+def test_decrypt_file_legacy_without_iv(tmp_path):
+    src = write_encrypted(tmp_path / "object", LegacyCrypt(KEY, IV), b"data")
+
+    with pytest.raises(ValueError, match="DATA_IV"):
+        app.decrypt_file(src, tmp_path / "object.zip", KEY)
+
+
+def test_decrypt_file_corrupted_leaves_no_output(tmp_path):
+    encrypted = bytearray(b"".join(Crypt(KEY).encrypt([b"data" * 1000])))
+    encrypted[-1] ^= 1
+    src = tmp_path / "object"
+    src.write_bytes(encrypted)
+
+    with pytest.raises(Exception):
+        app.decrypt_file(src, tmp_path / "object.zip", KEY)
+
+    assert list(tmp_path.iterdir()) == [src]
+
+
+def test_decrypt_files(tmp_path, capsys):
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+
+    data = {f"object{i}": os.urandom(1000 * i) for i in range(4)}
+    for name, content in data.items():
+        write_encrypted(inputs / name, Crypt(KEY) if name != "object0" else LegacyCrypt(KEY, IV), content)
+    (inputs / "broken").write_bytes(b"V3:broken")
+
+    files = app.collect_inputs([inputs])
+    outputs = app.output_paths(files, tmp_path / "out", ".zip")
+
+    failed = app.decrypt_files(files, outputs, KEY, IV, jobs=2, buffer_size=4096)
+
+    assert failed == [inputs / "broken"]
+    for name, content in data.items():
+        assert (tmp_path / "out" / f"{name}.zip").read_bytes() == content
+
+    assert "Decrypted 4/5 files" in capsys.readouterr().err
+
+
+def test_output_paths_single_file(tmp_path):
+    assert app.output_paths([tmp_path / "object"], tmp_path / "result.zip", ".zip") == [tmp_path / "result.zip"]
+
+
+def test_load_keys():
+    assert app.load_keys({"DATA_KEY": KEY.hex(), "DATA_IV": IV.hex()}) == (KEY, IV)
+    assert app.load_keys({"TF_VAR_data_key": KEY.hex()}) == (KEY, None)
+
+    with pytest.raises(ValueError, match="DATA_KEY"):
+        app.load_keys({})
@@ -127,7 +127,7 @@ async def test_download(data_manager, monkeypatch, print_bucket, print_db):
         assert "Dramatic Look [y8Kyi0WNg40].jpg" in filenames
         assert "src_item.json" in filenames
 
-    async with data_manager.db.connection.cursor(row_factory=dict_row) as cursor:
+    async with data_manager.db.connection() as connection, connection.cursor(row_factory=dict_row) as cursor:
         await cursor.execute("""
             SELECT provider, id, chapters, description, raw_data
             FROM video_metadata
@@ -0,0 +1,134 @@
+import io
+import pytest
+import threading
+from botocore.exceptions import ClientError, EndpointConnectionError
+from ytarchive_lib.downloader import RangedDownloader
+
+MiB = 1024 * 1024
+
+
+class FakeClient:
+    """In-memory stand-in for the ranged GETs of an S3 client"""
+
+    def __init__(self, objects, failures=None, gate=None):
+        self.objects = objects
+        self.failures = failures or {}
+        self.gate = gate
+        self.requested = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key]), "ETag": f'"{Key}-etag"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        assert IfMatch == f'"{Key}-etag"'
+        start, end = (int(value) for value in Range.removeprefix("bytes=").split("-"))
+
+        with self.lock:
+            self.requested.append(start)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        try:
+            if self.gate is not None:
+                self.gate.wait()
+
+            with self.lock:
+                failure = self.failures.get(start)
+                if failure:
+                    self.failures[start] = failure[1:]
+                    raise failure[0]
+
+            return {"Body": io.BytesIO(self.objects[Key][start:end + 1])}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def client_error(code="InternalError"):
+    return ClientError({"Error": {"Code": code, "Message": "boom"}}, "GetObject")
+
+
+@pytest.mark.parametrize("size", [0, 1, 99, 100, 101, 1000])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_download(size, workers):
+    data = bytes(i % 251 for i in range(size))
+    client = FakeClient({"key": data})
+    downloader = RangedDownloader(client, "bucket", range_size=100, workers=workers)
+
+    chunks = list(downloader.download("key"))
+
+    assert b"".join(chunks) == data
+    assert all(len(chunk) == 100 for chunk in chunks[:-1])
+    assert client.max_active <= workers
+
+
+def test_download_with_head():
+    client = FakeClient({"key": bytes(1000)})
+    client.head_object = None
+    downloader = RangedDownloader(client, "bucket", range_size=100)
+
+    assert b"".join(downloader.download("key", {"ContentLength": 1000, "ETag": '"key-etag"'})) == bytes(1000)
+
+
+def test_download_read_ahead_is_bounded():
+    gate = threading.Event()
+    client = FakeClient({"key": bytes(100 * 100)}, gate=gate)
+    downloader = RangedDownloader(client, "bucket", range_size=100, workers=2, read_ahead=3)
+
+    chunks = downloader.download("key")
+    result = []
+    thread = threading.Thread(target=lambda: result.append(next(chunks)))
+    thread.start()
+
+    # the first range is awaited once the workers and the read ahead are busy
+    while len(client.requested) < 2:
+        pass
+    gate.set()
+    thread.join()
+
+    assert len(client.requested) <= 2 + 3 + 1
+    assert len(b"".join([*result, *chunks])) == 100 * 100
+
+
+def test_download_stopped_early():
+    client = FakeClient({"key": bytes(100 * 100)})
+    downloader = RangedDownloader(client, "bucket", range_size=100, workers=2, read_ahead=0)
+
+    chunks = downloader.download("key")
+    next(chunks)
+    chunks.close()
+
+    assert len(client.requested) <= 4
+
+
+def test_download_retries_range():
+    data = bytes(i % 251 for i in range(1000))
+    client = FakeClient({"key": data}, failures={300: [client_error(), EndpointConnectionError(endpoint_url="x")]})
+    downloader = RangedDownloader(client, "bucket", range_size=100, backoff=0)
+
+    assert b"".join(downloader.download("key")) == data
+    assert client.requested.count(300) == 3
+
+
+def test_download_does_not_retry_permanent_errors():
+    client = FakeClient({"key": bytes(1000)}, failures={300: [client_error("PreconditionFailed")]})
+    downloader = RangedDownloader(client, "bucket", range_size=100, backoff=0)
+
+    with pytest.raises(ClientError, match="PreconditionFailed"):
+        b"".join(downloader.download("key"))
+
+    assert client.requested.count(300) == 1
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError, match="range size"):
+        RangedDownloader(FakeClient({}), "bucket", range_size=0)
+
+    with pytest.raises(ValueError, match="workers"):
+        RangedDownloader(FakeClient({}), "bucket", workers=0)
+
+    with pytest.raises(ValueError, match="read ahead"):
+        RangedDownloader(FakeClient({}), "bucket", read_ahead=-1)
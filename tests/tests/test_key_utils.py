@@ -1,4 +1,5 @@
 import pytest
+import contextlib
 import ytarchive_lib.data_manager as dm
 import ytarchive_lib.utils as utils
 
@@ -18,3 +19,75 @@ def test_hash_string_different_inputs():
 
     assert hash1 != hash2
 
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = utils.RateLimiter(100, clock=clock, sleep=clock.sleep)
+
+    limiter.acquire(100)
+    assert clock.now == 0.0
+
+    limiter.acquire(50)
+    assert clock.now == 1.0
+
+    limiter.acquire(50)
+    assert clock.now == 1.5
+
+
+def test_rate_limiter_idle():
+    clock = FakeClock()
+    limiter = utils.RateLimiter(100, clock=clock, sleep=clock.sleep)
+
+    limiter.acquire(100)
+    clock.now = 10.0
+
+    # idle time is not saved up for later bursts
+    limiter.acquire(100)
+    limiter.acquire(100)
+    assert clock.now == 11.0
+
+
+def test_rate_limiter_throttle():
+    clock = FakeClock()
+    limiter = utils.RateLimiter(10, clock=clock, sleep=clock.sleep)
+
+    assert list(limiter.throttle([b"a" * 10] * 3)) == [b"a" * 10] * 3
+    assert clock.now == 2.0
+
+
+def test_rate_limiter_invalid():
+    with pytest.raises(ValueError):
+        utils.RateLimiter(0)
+
+
+async def test_aiterate():
+    assert [item async for item in utils.aiterate(range(5))] == [0, 1, 2, 3, 4]
+
+
+async def test_aiterate_closes_source():
+    closed = []
+
+    def source():
+        try:
+            yield from range(100)
+        finally:
+            closed.append(True)
+
+    async with contextlib.aclosing(utils.aiterate(source())) as items:
+        async for item in items:
+            if item == 2:
+                break
+
+    assert closed == [True]
@@ -0,0 +1,119 @@
+import pytest
+import io
+import ytarchive_lib.migrate_app as app
+import ytarchive_lib.data_manager as dm
+from ytarchive_lib.utils import hash_string
+from conftest import check_items
+
+
+@pytest.fixture(scope="function", autouse=True)
+def enable_bucket_cleanup(bucket_cleanup):
+    yield
+
+
+@pytest.fixture(scope="function", autouse=True)
+def enable_db_cleanup(db_cleanup):
+    yield
+
+
+def make_item(id, state=dm.SrcItem.State.LEGACY_DONE):
+    return dm.SrcItem(
+        provider="youtube",
+        id=id,
+        url=f"https://www.youtube.com/watch?v={id}",
+        title=f"Video {id}",
+        channel="Channel",
+        channel_id="UCchannel",
+        channel_url="https://www.youtube.com/channel/UCchannel",
+        duration=100,
+        state=state,
+        priority=0,
+    )
+
+
+def put_legacy_object(data_manager, id, data):
+    encrypted = b"".join(data_manager.legacy_cryptor.encrypt([data]))
+    data_manager.bucket.put_object(
+        Key=f"archive/{hash_string(f'youtube:{id}')}",
+        Body=io.BytesIO(encrypted),
+    )
+
+
+async def test_migrate(data_manager):
+    data = {
+        "video1": b"first legacy video" * 1024 * 1024,
+        "video2": b"second legacy video",
+    }
+
+    for id, content in data.items():
+        await data_manager.add_src_item(make_item(id))
+        put_legacy_object(data_manager, id, content)
+
+    await data_manager.add_src_item(make_item("video3", state=dm.SrcItem.State.NEW))
+
+    stats = await app.amain()
+
+    assert stats == {"done": 2}
+
+    for id, content in data.items():
+        assert b"".join(data_manager.download_file("youtube", id)) == content
+
+        migration = await data_manager.get_legacy_migration("youtube", id)
+        assert migration.state == dm.LegacyMigration.State.DONE
+
+    await check_items(data_manager, [
+        make_item("video1", state=dm.SrcItem.State.DONE),
+        make_item("video2", state=dm.SrcItem.State.DONE),
+        make_item("video3", state=dm.SrcItem.State.NEW),
+    ])
+
+
+async def test_migrate_resume_after_upload(data_manager):
+    await data_manager.add_src_item(make_item("video1"))
+    put_legacy_object(data_manager, "video1", b"legacy content")
+
+    # an earlier run uploaded the new object and stopped before recording it
+    await data_manager.set_legacy_migration_state("youtube", "video1", dm.LegacyMigration.State.STARTED)
+    data_manager.migrate_legacy_object("youtube", "video1")
+
+    assert await app.amain() == {"done": 1}
+    assert b"".join(data_manager.download_file("youtube", "video1")) == b"legacy content"
+
+
+async def test_migrate_after_failed_attempt(data_manager):
+    await data_manager.add_src_item(make_item("video1"))
+    put_legacy_object(data_manager, "video1", b"legacy content")
+
+    # an earlier run replaced the object but failed before recording it
+    data_manager.migrate_legacy_object("youtube", "video1")
+    await data_manager.set_legacy_migration_state(
+        "youtube", "video1", dm.LegacyMigration.State.FAILED, error="wait_until_exists failed"
+    )
+
+    assert await app.amain() == {"done": 1}
+    assert b"".join(data_manager.download_file("youtube", "video1")) == b"legacy content"
+
+    migration = await data_manager.get_legacy_migration("youtube", "video1")
+    assert migration.state == dm.LegacyMigration.State.DONE
+    assert migration.error is None
+
+
+async def test_migrate_missing_object(data_manager):
+    await data_manager.add_src_item(make_item("video1"))
+
+    assert await app.amain() == {"failed": 1}
+
+    migration = await data_manager.get_legacy_migration("youtube", "video1")
+    assert migration.state == dm.LegacyMigration.State.FAILED
+    assert migration.error
+
+    await check_items(data_manager, [make_item("video1")])
+
+
+async def test_migrate_time_limit(data_manager):
+    await data_manager.add_src_item(make_item("video1"))
+    put_legacy_object(data_manager, "video1", b"legacy content")
+
+    assert await app.amain(time_limit=-1) == {"skipped": 1}
+
+    await check_items(data_manager, [make_item("video1")])
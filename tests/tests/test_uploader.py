@@ -0,0 +1,375 @@
+import io
+import base64
+import hashlib
+import pytest
+import time
+import threading
+from botocore.exceptions import ClientError, EndpointConnectionError
+from ytarchive_lib.uploader import MultipartUploader, UploadPlan, UploadProgress, UploadResult, MAX_PARTS, composite_etag
+
+MiB = 1024 * 1024
+
+
+class FakeClient:
+    """In-memory stand-in for the multipart calls of an S3 client"""
+
+    def __init__(self, failures=None, gate=None):
+        self.failures = failures or {}
+        self.gate = gate
+        self.parts = {}
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.objects = {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.calls.append(("create", Key, kwargs))
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        try:
+            if self.gate is not None:
+                self.gate.wait()
+
+            with self.lock:
+                failure = self.failures.get(PartNumber)
+                if failure:
+                    self.failures[PartNumber] = failure[1:]
+                    raise failure[0]
+
+                assert base64.b64decode(ContentMD5) == hashlib.md5(Body).digest()
+                self.parts[PartNumber] = bytes(Body)
+
+            return {"ETag": etag(Body)}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = MultipartUpload["Parts"]
+        assert [part["PartNumber"] for part in parts] == list(range(1, len(parts) + 1))
+        assert all(part["ETag"] == etag(self.parts[part["PartNumber"]]) for part in parts)
+
+        self.objects[Key] = b"".join(self.parts[part["PartNumber"]] for part in parts)
+        self.calls.append(("complete", Key))
+        return {"ETag": composite_etag([part["ETag"] for part in parts])}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker):
+        # two parts per page to go through the pagination
+        numbers = [number for number in sorted(self.parts) if number > PartNumberMarker][:2]
+        return {
+            "Parts": [{"PartNumber": number, "Size": len(self.parts[number])} for number in numbers],
+            "IsTruncated": bool(numbers) and numbers[-1] < max(self.parts),
+            "NextPartNumberMarker": numbers[-1] if numbers else 0,
+        }
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append(("abort", Key))
+
+
+def etag(data):
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def client_error():
+    return ClientError({"Error": {"Code": "InternalError", "Message": "boom"}}, "UploadPart")
+
+
+def chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.mark.parametrize("size", [0, 1, 5 * MiB, 5 * MiB + 1, 17 * MiB + 3])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_upload(size, workers):
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, workers=workers)
+    data = bytes(i % 251 for i in range(size))
+
+    result = uploader.upload("key", chunks(data, 100_000), {"Tagging": "archive=true"})
+
+    assert client.objects["key"] == data
+    assert result == UploadResult(client.complete_multipart_upload("bucket", "key", "upload-1", {"Parts": [
+        {"PartNumber": number, "ETag": etag(part)} for number, part in sorted(client.parts.items())
+    ]})["ETag"], size, len(client.parts))
+    assert client.calls[0] == ("create", "key", {"Tagging": "archive=true"})
+    assert client.calls[-1] == ("complete", "key")
+    assert all(len(part) == 5 * MiB for number, part in client.parts.items() if number < len(client.parts))
+
+
+@pytest.mark.parametrize("size", [0, 1, 5 * MiB, 5 * MiB + 1, 17 * MiB + 3])
+def test_upload_from_reader(size):
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, workers=2)
+    data = bytes(i % 251 for i in range(size))
+
+    uploader.upload("key", io.BufferedReader(io.BytesIO(data), buffer_size=100_000), size=size)
+
+    assert client.objects["key"] == data
+    assert all(len(client.parts[number]) == 5 * MiB for number in sorted(client.parts)[:-1])
+    assert len(client.parts) == max(-(-size // (5 * MiB)), 1)
+
+
+def test_upload_concurrent_with_backpressure():
+    gate = threading.Event()
+    client = FakeClient(gate=gate)
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, workers=3, queue_size=2)
+
+    pulled = []
+
+    def stream():
+        for i in range(20):
+            pulled.append(i)
+            yield bytes([i]) * 5 * MiB
+
+    thread = threading.Thread(target=uploader.upload, args=("key", stream()))
+    thread.start()
+
+    # uploads are blocked, the producer stops once 3 parts upload and 2 wait
+    deadline = time.monotonic() + 10
+    while client.active < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+
+    assert len(pulled) == 3 + 2 + 1
+
+    gate.set()
+    thread.join()
+
+    assert client.max_active == 3
+    assert client.objects["key"] == b"".join(bytes([i]) * 5 * MiB for i in range(20))
+
+
+def test_upload_retries_part():
+    client = FakeClient(failures={2: [client_error(), EndpointConnectionError(endpoint_url="x")]})
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, retries=2, backoff=0)
+    data = bytes(i % 251 for i in range(12 * MiB))
+
+    uploader.upload("key", chunks(data, MiB))
+
+    assert client.objects["key"] == data
+
+
+def test_upload_aborts_after_retries():
+    client = FakeClient(failures={2: [client_error()] * 3})
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, retries=2, backoff=0)
+
+    with pytest.raises(ClientError):
+        uploader.upload("key", chunks(bytes(12 * MiB), MiB))
+
+    assert client.calls[-1] == ("abort", "key")
+    assert "key" not in client.objects
+
+
+def test_upload_aborts_on_stream_error():
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB)
+
+    def stream():
+        yield bytes(6 * MiB)
+        raise ValueError("encryption failed")
+
+    with pytest.raises(ValueError, match="encryption failed"):
+        uploader.upload("key", stream())
+
+    assert client.calls[-1] == ("abort", "key")
+
+
+def test_upload_does_not_retry_permanent_errors():
+    denied = ClientError({"Error": {"Code": "AccessDenied", "Message": "denied"}}, "UploadPart")
+    client = FakeClient(failures={1: [denied]})
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, retries=2, backoff=0)
+
+    with pytest.raises(ClientError, match="AccessDenied"):
+        uploader.upload("key", chunks(bytes(6 * MiB), MiB))
+
+    # the failure was not retried, the next attempt would have succeeded
+    assert 1 not in client.parts
+    assert client.calls[-1] == ("abort", "key")
+
+
+def test_upload_sizes_parts_from_hint(monkeypatch):
+    monkeypatch.setattr("ytarchive_lib.uploader.MAX_PARTS", 2)
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB)
+    data = bytes(i % 251 for i in range(11 * MiB))
+
+    uploader.upload("key", chunks(data, MiB), size=len(data))
+
+    assert client.objects["key"] == data
+    assert [len(client.parts[number]) for number in sorted(client.parts)] == [6 * MiB, 5 * MiB]
+
+
+def test_upload_size_hint_too_large():
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket")
+
+    with pytest.raises(ValueError, match="does not fit"):
+        uploader.upload("key", chunks(b"", 1), size=MAX_PARTS * 5 * 1024 * MiB + 1)
+
+    # nothing was started
+    assert client.calls == []
+
+
+def test_upload_too_many_parts(monkeypatch):
+    monkeypatch.setattr("ytarchive_lib.uploader.MAX_PARTS", 2)
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB)
+
+    with pytest.raises(ValueError, match="more than 2 parts"):
+        uploader.upload("key", chunks(bytes(11 * MiB), MiB))
+
+    assert client.calls[-1] == ("abort", "key")
+
+
+def test_upload_reports_progress():
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=5 * MiB, workers=2)
+    data = bytes(i % 251 for i in range(12 * MiB))
+    created = []
+    completed = {}
+
+    uploader.upload("key", chunks(data, MiB), on_created=created.append, on_part=completed.__setitem__)
+
+    assert created == [UploadProgress("upload-1", 5 * MiB)]
+    assert completed == {number: etag(part) for number, part in client.parts.items()}
+    assert len(completed) == 3
+
+
+@pytest.mark.parametrize("done", [[1], [1, 3], [1, 2, 3]])
+def test_upload_resume(done):
+    data = bytes(i % 251 for i in range(12 * MiB))
+    client = FakeClient()
+    # left behind by the interrupted run
+    client.parts = {number: data[(number - 1) * 5 * MiB:number * 5 * MiB] for number in done}
+    uploader = MultipartUploader(client, "bucket", part_size=32 * MiB, workers=2)
+    progress = UploadProgress("upload-1", 5 * MiB, {number: etag(part) for number, part in client.parts.items()})
+    completed = {}
+
+    result = uploader.upload("key", chunks(data[progress.offset:], MiB), size=len(data), progress=progress, on_part=completed.__setitem__)
+
+    assert client.objects["key"] == data
+    assert result.size == len(data)
+    assert not any(call[0] == "create" for call in client.calls)
+    assert completed.keys() == {1, 2, 3} - set(done)
+
+
+def test_upload_part_etag_mismatch():
+    class Client(FakeClient):
+        def upload_part(self, *args, **kwargs):
+            super().upload_part(*args, **kwargs)
+            return {"ETag": '"0123"'}
+
+    client = Client()
+    uploader = MultipartUploader(client, "bucket")
+
+    with pytest.raises(ValueError, match="does not match its MD5"):
+        uploader.upload("key", chunks(b"data", 1))
+
+    assert client.calls[-1] == ("abort", "key")
+
+
+def test_upload_object_etag_mismatch():
+    class Client(FakeClient):
+        def complete_multipart_upload(self, *args, **kwargs):
+            super().complete_multipart_upload(*args, **kwargs)
+            return {"ETag": '"0123-1"'}
+
+    uploader = MultipartUploader(Client(), "bucket")
+
+    with pytest.raises(ValueError, match="completed with ETag"):
+        uploader.upload("key", chunks(b"data", 1))
+
+
+def test_composite_etag():
+    # as computed by S3 for the two parts
+    parts = [etag(b"a" * 5 * MiB), etag(b"b")]
+    digest = hashlib.md5(hashlib.md5(b"a" * 5 * MiB).digest() + hashlib.md5(b"b").digest()).hexdigest()
+
+    assert composite_etag(parts) == f'"{digest}-2"'
+
+
+def test_upload_abort_errors_are_not_raised():
+    class Client(FakeClient):
+        def abort_multipart_upload(self, Bucket, Key, UploadId):
+            raise ClientError({"Error": {"Code": "NoSuchUpload", "Message": "gone"}}, "AbortMultipartUpload")
+
+    uploader = MultipartUploader(Client(failures={1: [client_error()] * 4}), "bucket", backoff=0)
+
+    with pytest.raises(ClientError, match="InternalError"):
+        uploader.upload("key", chunks(b"data", 1))
+
+
+@pytest.mark.parametrize("size, budget, expected", [
+    # small archives get a single small part and a single worker
+    (MiB, 256 * MiB, UploadPlan(5 * MiB, 1, 2)),
+    (12 * MiB + 1, 256 * MiB, UploadPlan(13 * MiB, 1, 2)),
+    # the configured part size when everything fits
+    (10 * 1024 * MiB, 512 * MiB, UploadPlan(32 * MiB, 4, 2)),
+    # smaller parts to keep all workers within a smaller budget
+    (10 * 1024 * MiB, 128 * MiB, UploadPlan(16 * MiB, 4, 2)),
+    # parts can't shrink below what MAX_PARTS needs, workers and queue are cut instead
+    (1000 * 1024 * MiB, 512 * MiB, UploadPlan(103 * MiB, 2, 0)),
+    (1000 * 1024 * MiB, 350 * MiB, UploadPlan(103 * MiB, 1, 0)),
+    # unknown size keeps the configured part size
+    (None, 128 * MiB, UploadPlan(32 * MiB, 2, 0)),
+    (None, None, UploadPlan(32 * MiB, 4, 2)),
+])
+def test_plan(size, budget, expected):
+    uploader = MultipartUploader(FakeClient(), "bucket")
+
+    plan = uploader.plan(size, budget)
+
+    assert plan == expected
+    if budget is not None:
+        assert plan.memory <= budget
+
+
+@pytest.mark.parametrize("size", [0, MiB, 100 * MiB, 10 * 1024 * MiB, 100 * 1024 * MiB, 5 * 1024 * 1024 * MiB])
+@pytest.mark.parametrize("budget", [15 * MiB, 64 * MiB, 1024 * MiB])
+def test_plan_within_limits(size, budget):
+    uploader = MultipartUploader(FakeClient(), "bucket", part_size=128 * MiB, workers=8)
+
+    try:
+        plan = uploader.plan(size, budget)
+    except ValueError as e:
+        assert "memory budget" in str(e)
+        # not even one worker with the smallest part that fits MAX_PARTS
+        assert 3 * -(-size // MAX_PARTS) > budget
+        return
+
+    assert plan.memory <= budget
+    assert plan.part_size * MAX_PARTS >= size
+    assert plan.workers >= 1
+
+
+def test_upload_within_memory_budget():
+    client = FakeClient()
+    uploader = MultipartUploader(client, "bucket", part_size=32 * MiB, workers=2, queue_size=0, memory_budget=40 * MiB)
+    data = bytes(i % 251 for i in range(21 * MiB))
+
+    uploader.upload("key", chunks(data, MiB), size=len(data))
+
+    assert client.objects["key"] == data
+    # (2 workers + 2) parts of 10 MiB fill the budget
+    assert [len(client.parts[number]) for number in sorted(client.parts)] == [10 * MiB, 10 * MiB, MiB]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError, match="part size"):
+        MultipartUploader(FakeClient(), "bucket", part_size=MiB)
+
+    with pytest.raises(ValueError, match="workers"):
+        MultipartUploader(FakeClient(), "bucket", workers=0)
+
+    with pytest.raises(ValueError, match="queue size"):
+        MultipartUploader(FakeClient(), "bucket", queue_size=-1)
+
+    with pytest.raises(ValueError, match="memory budget"):
+        MultipartUploader(FakeClient(), "bucket", memory_budget=10 * MiB)
@@ -0,0 +1,88 @@
+import pytest
+import io
+from datetime import timedelta
+import ytarchive_lib.verify_app as app
+import ytarchive_lib.notify as notify
+import ytarchive_lib.data_manager as dm
+from ytarchive_lib.utils import hash_string
+
+
+@pytest.fixture(scope="function", autouse=True)
+def enable_bucket_cleanup(bucket_cleanup):
+    yield
+
+
+@pytest.fixture(scope="function", autouse=True)
+def enable_db_cleanup(db_cleanup):
+    yield
+
+
+class MockNotify:
+    def __init__(self):
+        self.calls = []
+
+    def send_message(self, message, config, with_notification=True):
+        self.calls.append(message)
+
+
+@pytest.fixture
+def mock_notify(monkeypatch):
+    mock_notify = MockNotify()
+    monkeypatch.setattr(notify, "send_message", mock_notify.send_message)
+    return mock_notify
+
+
+def archive_key(id):
+    return f"archive/{hash_string(f'youtube:{id}')}"
+
+
+async def test_verify(data_manager, mock_notify):
+    data_manager.upload_file("youtube", "video1", io.BytesIO(b"first video" * 1024 * 1024))
+    data_manager.upload_file("youtube", "video2", io.BytesIO(b"second video"))
+
+    legacy = b"".join(data_manager.legacy_cryptor.encrypt([b"legacy video"]))
+    data_manager.bucket.put_object(Key=archive_key("video3"), Body=io.BytesIO(legacy))
+
+    stats = await app.amain()
+
+    assert stats == {"ok": 3, "bytes": 11 * 1024 * 1024 + 12 + 12}
+    assert mock_notify.calls == []
+
+    verification = await data_manager.get_verification(archive_key("video2"))
+    assert verification.ok
+    assert verification.size == 12
+    assert verification.verified_at is not None
+
+
+async def test_verify_corrupted(data_manager, mock_notify):
+    data_manager.upload_file("youtube", "video1", io.BytesIO(b"video content"))
+
+    encrypted = data_manager.bucket.Object(archive_key("video1")).get()["Body"].read()
+    corrupted = encrypted[:-1] + bytes([encrypted[-1] ^ 1])
+    data_manager.bucket.put_object(Key=archive_key("video1"), Body=io.BytesIO(corrupted))
+
+    stats = await app.amain()
+
+    assert stats == {"failed": 1}
+    assert len(mock_notify.calls) == 1
+    assert archive_key("video1") in mock_notify.calls[0]
+
+    verification = await data_manager.get_verification(archive_key("video1"))
+    assert not verification.ok
+    assert "InvalidTag" in verification.error
+
+
+async def test_verify_skips_recent(data_manager, mock_notify):
+    data_manager.upload_file("youtube", "video1", io.BytesIO(b"video content"))
+
+    assert await app.amain() == {"ok": 1, "bytes": 13}
+    assert await app.amain() == {"recent": 1}
+    assert await app.amain(max_age=timedelta(0)) == {"ok": 1, "bytes": 13}
+
+
+async def test_verify_sample(data_manager, mock_notify):
+    for i in range(4):
+        data_manager.upload_file("youtube", f"video{i}", io.BytesIO(b"video content"))
+
+    assert (await app.amain(sample=0.5))["ok"] == 2
+    assert (await app.amain(sample=0.5)) == {"recent": 2, "ok": 1, "bytes": 13}